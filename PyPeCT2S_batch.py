@@ -0,0 +1,115 @@
+"""
+================================================================================================================
+PyPeCT2S Batch: Headless entry point for running pipeline steps over a cohort
+================================================================================================================
+    Created by G.H. Allison, University of Sheffield, Sheffield, United Kingdom.
+    Copyright (C) 2024 George H. Allison
+    Contact: ghallison1@sheffield.ac.uk or xinshan.li@sheffield.ac.uk
+----------------------------------------------------------------------------------------------------------------
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+________________________________________________________________________________________________________________
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+from core_libs import batch_funcs
+
+
+def validate(args):
+    rows = batch_funcs.validate_cohort(args.stl_dir, args.workers, args.weld_tol, args.fail_fast, args.recursive)
+    if not rows:
+        return 1
+    output = args.output or os.path.join(args.stl_dir, 'stl_validation')
+    csv_path, json_path = batch_funcs.write_summary(rows, output)
+    failed = sum(row['status'] != 'PASS' for row in rows)
+    print(f"{len(rows) - failed} of {len(rows)} STL files passed. Summary saved to {csv_path} and {json_path}")
+    return 0
+
+
+def landmarks(args):
+    rows = batch_funcs.landmark_cohort(args.stl_dir, args.output_dir, args.workers, args.bm_rot, args.axis_sample_size,
+                                       args.recursive)
+    if not rows:
+        return 1
+    output = os.path.join(args.output_dir or args.stl_dir, 'landmarks')
+    csv_path, json_path = batch_funcs.write_summary(rows, output)
+    failed = sum(row['status'] != 'DONE' for row in rows)
+    print(f"Landmarks found for {len(rows) - failed} of {len(rows)} STL files. Summary saved to {csv_path} and {json_path}")
+    return 0
+
+
+def screen(args):
+    rows = batch_funcs.screen_cohort(args.stl_dir, args.workers, args.recursive, force=args.force, pc=args.pc,
+                                     pf=args.pf, angle_inc=args.angle_inc, modulus=args.modulus)
+    if not rows:
+        return 1
+    output = args.output or os.path.join(args.stl_dir, 'beam_screening')
+    csv_path, json_path = batch_funcs.write_summary(rows, output)
+    print(f"{len(rows)} STL files ranked by force to failure. Summary saved to {csv_path} and {json_path}")
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Run PyPeCT2S pipeline steps over a cohort without the GUI.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    validate_parser = subparsers.add_parser('validate', help="Check every STL file in a directory.")
+    validate_parser.add_argument('stl_dir', help="Directory holding the STL files.")
+    validate_parser.add_argument('-o', '--output', help="Summary path without extension, a .csv and a .json are "
+                                                        "written. Defaults to <stl_dir>/stl_validation.")
+    validate_parser.add_argument('-w', '--workers', type=int, help="Number of worker processes, defaults to the "
+                                                                   "number of physical cores.")
+    validate_parser.add_argument('--weld-tol', type=float, help="Distance within which STL corners are welded.")
+    validate_parser.add_argument('--fail-fast', action='store_true', help="Stop each file at its first error.")
+    validate_parser.add_argument('-r', '--recursive', action='store_true', help="Include sub-directories.")
+    validate_parser.set_defaults(func=validate)
+
+    landmarks_parser = subparsers.add_parser('landmarks', help="Find the landmarks of every STL file in a directory.")
+    landmarks_parser.add_argument('stl_dir', help="Directory holding the STL files.")
+    landmarks_parser.add_argument('-o', '--output-dir', help="Directory the <name>/landmarks folders and the summary "
+                                                             "are written to. Defaults to stl_dir.")
+    landmarks_parser.add_argument('-w', '--workers', type=int, help="Number of worker processes, defaults to the "
+                                                                    "number of physical cores.")
+    landmarks_parser.add_argument('--bm-rot', action='store_true', help="The models were segmented with the RAS "
+                                                                        "coordinate system and rotated in Bonemat.")
+    landmarks_parser.add_argument('--axis-sample-size', type=int, default=0, help="Triangles sampled to find the "
+                                                                                  "shaft axis, 0 uses them all.")
+    landmarks_parser.add_argument('-r', '--recursive', action='store_true', help="Include sub-directories.")
+    landmarks_parser.set_defaults(func=landmarks)
+
+    screen_parser = subparsers.add_parser('screen', help="Rank every STL file in a directory by its beam theory "
+                                                         "four point bending strength.")
+    screen_parser.add_argument('stl_dir', help="Directory holding the STL files.")
+    screen_parser.add_argument('-o', '--output', help="Summary path without extension, a .csv and a .json are "
+                                                      "written. Defaults to <stl_dir>/beam_screening.")
+    screen_parser.add_argument('-w', '--workers', type=int, help="Number of worker processes, defaults to the "
+                                                                 "number of physical cores.")
+    screen_parser.add_argument('--force', type=float, default=120.0, help="Applied force (N).")
+    screen_parser.add_argument('--pc', type=float, default=0.5, help="Percentage of remaining segment.")
+    screen_parser.add_argument('--pf', type=float, default=0.5, help="Proportion of mid-segment to apply force.")
+    screen_parser.add_argument('--angle-inc', type=float, default=10, help="Angle increment (deg) between orientations.")
+    screen_parser.add_argument('--modulus', type=float, default=17000.0, help="Homogeneous Young's modulus (MPa).")
+    screen_parser.add_argument('-r', '--recursive', action='store_true', help="Include sub-directories.")
+    screen_parser.set_defaults(func=screen)
+    return parser
+
+
+if __name__ == '__main__':
+    multiprocessing.freeze_support()  # Needed for the process pool in the frozen Windows executable
+    arguments = build_parser().parse_args()
+    sys.exit(arguments.func(arguments))
@@ -0,0 +1,128 @@
+"""
+================================================================================================================
+TET10 Conversion Benchmark: round trip of a TET4 .inp through the TET10 .cdb written without MAPDL.
+================================================================================================================
+    Created by G.H. Allison, University of Sheffield, Sheffield, United Kingdom.
+    Copyright (C) 2024 George H. Allison
+    Contact: ghallison1@sheffield.ac.uk or xinshan.li@sheffield.ac.uk
+----------------------------------------------------------------------------------------------------------------
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+________________________________________________________________________________________________________________
+
+    Run from the repository root:
+        python -m benchmarks.bench_cdb --sizes 10000 100000 1000000
+"""
+
+import argparse
+import csv
+import os
+import platform
+import tempfile
+import time
+import numpy as np
+from benchmarks import synthetic_bones
+from core_libs import cdb_funcs
+
+default_sizes = [10000, 100000, 1000000]
+
+
+def write_icem_inp(inp_path, nodes, corners):
+    """
+    Write a tetrahedral mesh as ICEM does with -use_blocks: SOLID185 degenerate bricks I, J, K, K, L, L, L, L, with
+    nodes and elements numbered from 1 in a shuffled order so the conversion cannot rely on them being in sequence.
+    :return: node_ids, element_ids:  The node number of each row of nodes and the element number of each row of corners
+    """
+    rng = np.random.default_rng(0)
+    node_ids = rng.permutation(nodes.shape[0]).astype(np.int64) + 1
+    element_ids = rng.permutation(corners.shape[0]).astype(np.int64) + 1
+    ids = node_ids[corners]
+    bricks = ids[:, [0, 1, 2, 2, 3, 3, 3, 3]]
+    order = np.argsort(node_ids)
+    cdb_funcs.write_cdb(inp_path, node_ids[order], nodes[order], element_ids, bricks, element_type=185)
+    return node_ids, element_ids
+
+
+def check_round_trip(inp_path, cdb_path, nodes, corners, node_ids, element_ids):
+    """
+    Compare the .cdb read back with the mesh the .inp was written from, independently of verify_cdb.
+    :return: checks:  Dictionary of check name -> True when it held
+    """
+    mesh = cdb_funcs.read_cdb(cdb_path)
+    n_corner_nodes = nodes.shape[0]
+    order = np.argsort(node_ids)
+    corner_rows = cdb_funcs.node_index(mesh['node_ids'], node_ids[order])
+    points = mesh['nodes'][cdb_funcs.node_index(mesh['node_ids'], mesh['connectivity'])]
+    midpoints = (points[:, cdb_funcs.tet10_edges[:, 0]] + points[:, cdb_funcs.tet10_edges[:, 1]]) / 2
+    edges = np.sort(corners[:, cdb_funcs.tet10_edges], axis=2).reshape(-1, 2)
+    n_edges = np.unique(edges[:, 0] * n_corner_nodes + edges[:, 1]).shape[0]
+    return {
+        'corner node ids': bool(np.array_equal(mesh['node_ids'][:n_corner_nodes], np.arange(1, n_corner_nodes + 1))),
+        'corner coordinates': bool(np.allclose(mesh['nodes'][corner_rows], nodes[order], rtol=0, atol=1e-9)),
+        'midside node ids': bool(np.array_equal(mesh['node_ids'][n_corner_nodes:],
+                                                n_corner_nodes + 1 + np.arange(n_edges))),
+        'midside placement': bool(np.allclose(points[:, 4:], midpoints, rtol=0, atol=1e-9)),
+        'element ids': bool(np.array_equal(mesh['element_ids'], element_ids)),
+        'corner connectivity': bool(np.array_equal(mesh['connectivity'][:, :4], node_ids[corners])),
+        'element type': bool(np.all(mesh['n_nodes'] == 10) and mesh['element_types'].get(1) == '187'),
+    }
+
+
+def run(sizes, output_path, seed=0):
+    results = []
+    with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as temp_dir:
+        for size in sizes:
+            nodes, corners = synthetic_bones.bone_volume(size, seed=seed)
+            inp_path, cdb_path = os.path.join(temp_dir, f"bone_{size}.inp"), os.path.join(temp_dir, f"bone_{size}.cdb")
+            node_ids, element_ids = write_icem_inp(inp_path, nodes, corners)
+
+            start = time.perf_counter()
+            cdb_funcs.inp_to_cdb(inp_path, cdb_path, verify=False)
+            convert_time = time.perf_counter() - start
+            start = time.perf_counter()
+            n_nodes, n_elements = cdb_funcs.inp_to_cdb(inp_path, cdb_path, verify=True)
+            verify_time = time.perf_counter() - start - convert_time  # The read back and checks of verify_cdb
+
+            checks = check_round_trip(inp_path, cdb_path, nodes, corners, node_ids, element_ids)
+            row = {'elements': n_elements, 'nodes': n_nodes, 'convert_time_s': round(convert_time, 3),
+                   'verify_time_s': round(verify_time, 3), 'passed': all(checks.values()),
+                   'failed_checks': "; ".join(name for name, held in checks.items() if not held)}
+            results.append(row)
+            print(f"{n_elements} elements, {n_nodes} nodes: converted in {convert_time:.3f} s, verified in "
+                  f"{verify_time:.3f} s, round trip {'passed' if row['passed'] else 'FAILED: ' + row['failed_checks']}")
+            for path in (inp_path, cdb_path):
+                os.remove(path)
+
+    with open(output_path, 'w', newline='') as file:
+        file.write(f"# {platform.platform()}, Python {platform.python_version()}, NumPy {np.__version__}\n")
+        writer = csv.DictWriter(file, fieldnames=list(results[0]))
+        writer.writeheader()
+        writer.writerows(results)
+    print(f"\nResults saved to {output_path}")
+    return results
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Benchmark and check the TET10 .cdb conversion on synthetic meshes.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=default_sizes, help="Target element counts.")
+    parser.add_argument('--seed', type=int, default=0, help="Seed for the random mesh points.")
+    parser.add_argument('-o', '--output', default='tet10_benchmark.csv', help="CSV file for the results.")
+    return parser
+
+
+if __name__ == '__main__':
+    arguments = build_parser().parse_args()
+    results = run(arguments.sizes, arguments.output, arguments.seed)
+    raise SystemExit(0 if all(row['passed'] for row in results) else 1)
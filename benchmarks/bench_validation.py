@@ -0,0 +1,242 @@
+"""
+================================================================================================================
+STL Validation Benchmark: wall time and peak resident memory of the STL loading, checks and shaft axis search.
+================================================================================================================
+    Created by G.H. Allison, University of Sheffield, Sheffield, United Kingdom.
+    Copyright (C) 2024 George H. Allison
+    Contact: ghallison1@sheffield.ac.uk or xinshan.li@sheffield.ac.uk
+----------------------------------------------------------------------------------------------------------------
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+________________________________________________________________________________________________________________
+
+    Run from the repository root:
+        python -m benchmarks.bench_validation --sizes 10000 100000 1000000 5000000 --defects none all --shapes bone femur
+"""
+
+import argparse
+import contextlib
+import csv
+import io
+import os
+import platform
+import tempfile
+import threading
+import time
+import numpy as np
+import psutil
+from benchmarks import synthetic_bones
+from core_libs import ansys_vars, gui_funcs, ldmk_funcs, stl_checks, surf_mesh
+
+default_sizes = [10000, 100000, 1000000, 5000000]
+shapes = {'bone': synthetic_bones.bone_surface, 'femur': synthetic_bones.femur_surface}  # The femur is asymmetric
+
+
+def current_rss():
+    # Resident memory of this process in bytes, memory-mapped file pages and C allocations included
+    return psutil.Process().memory_info().rss
+
+
+def reset_peak_rss():
+    """
+    Reset the kernel's record of the peak resident memory of this process (VmHWM), which only Linux allows.
+    :return: True when reset, so the peak can be read back from read_peak_rss
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as file:
+            file.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def read_peak_rss():
+    # The peak resident memory in bytes since the last reset, from /proc/self/status
+    with open('/proc/self/status') as file:
+        for line in file:
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1]) * 1024
+    return None
+
+
+class RSSSampler:
+    """
+    Record the peak resident memory of this process from a background thread, on systems where the kernel peak
+    cannot be reset. Peaks shorter than the interval can be missed.
+    """
+
+    def __init__(self, interval=0.001):
+        self.interval = interval
+        self.peak = current_rss()
+        self.stop = threading.Event()
+        self.thread = threading.Thread(target=self.sample, daemon=True)
+
+    def sample(self):
+        while not self.stop.wait(self.interval):
+            self.peak = max(self.peak, current_rss())
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop.set()
+        self.thread.join()
+        self.peak = max(self.peak, current_rss())
+
+
+def measure(step, func, track_memory=True):
+    """
+    Run one benchmark step, timing it and recording the peak resident memory (RSS) of the process while it ran.
+    RSS counts the memory-mapped STL pages and the C allocations of NumPy, SciPy and the k-d trees, which tracing
+    Python allocations misses. On Linux the kernel peak is reset before the step, elsewhere RSS is sampled.
+    Printed output of the step is discarded so it does not clutter the results.
+    :return: row, output:  Dictionary with the step name, wall time, peak RSS and its rise over the RSS at the start
+        of the step, and the return value of func
+    """
+    row = {'step': step, 'wall_time_s': None, 'peak_rss_mb': None, 'rss_increase_mb': None}
+    baseline = current_rss() if track_memory else 0
+    kernel_peak = track_memory and reset_peak_rss()
+    sampler = RSSSampler() if track_memory and not kernel_peak else contextlib.nullcontext()
+    start = time.perf_counter()
+    with sampler, contextlib.redirect_stdout(io.StringIO()):
+        output = func()
+    row['wall_time_s'] = round(time.perf_counter() - start, 4)
+    if track_memory:
+        peak = read_peak_rss() if kernel_peak else sampler.peak
+        row['peak_rss_mb'] = round(peak / 1024 ** 2, 2)
+        row['rss_increase_mb'] = round(max(peak - baseline, 0) / 1024 ** 2, 2)
+    return row, output
+
+
+def count_of(output):
+    # Reduce a check output to one number for the results table
+    if isinstance(output, (bool, np.bool_)):
+        return int(output)
+    if isinstance(output, tuple):
+        return output[0] if np.isscalar(output[0]) else len(output[0])
+    if isinstance(output, (list, dict, np.ndarray)):
+        return len(output)
+    return output if np.isscalar(output) else None  # Steps returning a mesh have no count
+
+
+def bench_surface(stl_path, skip=(), track_memory=True):
+    """
+    Benchmark every step of the validation layer on one STL file.
+    :return: rows:  One row per step
+    """
+    rows = []
+    steps = [
+        ('load_stl', lambda: gui_funcs.load_stl(stl_path)),
+        ('load_surface_mesh', lambda: surf_mesh.load_surface_mesh(stl_path)),  # The path the GUI and mesher use
+        ('load_surface_mesh cached', lambda: surf_mesh.load_surface_mesh(stl_path)),
+    ]
+    surface = None
+    for step, func in steps:
+        if step in skip:
+            continue
+        row, output = measure(step, func, track_memory)
+        rows.append(row)
+        surface = output if step.startswith('load_surface_mesh') else surface
+    surface = surface if surface is not None else surf_mesh.load_surface_mesh(stl_path)
+
+    checker = stl_checks.STLChecks(surface, run_checks=False)
+    steps = [
+        ('Weld vertices', lambda: surface.vertices),
+        ('Edge table', checker.build_edge_table),
+        ('Face geometry', checker.build_face_geometry),
+        ('Non-manifold edges', checker.check_non_manifold_edges),
+        ('Holes', checker.check_for_holes),
+        ('Inconsistent winding', checker.check_winding),
+        ('Multiple bodies', checker.check_multiple_bodies),
+        ('Degenerate faces', checker.check_degenerate_faces),
+        ('Self-intersections', checker.check_self_intersections),
+        ('Normals orientation', checker.check_normals_orientation),
+        ('Stored normals', checker.check_stored_normals),
+        ('Non-uniform scaling', checker.check_non_uniform_scaling),
+        ('Duplicates', checker.check_duplicate_vertices_faces),
+        ('bone_length', lambda: ldmk_funcs.bone_length(surface)),
+        ('find_long_shaft_axis', lambda: ldmk_funcs.find_long_shaft_axis(ansys_vars.FemVariables(), surface)),
+    ]
+    for step, func in steps:
+        if step in skip:
+            continue
+        row, output = measure(step, func, track_memory)
+        row['result'] = count_of(output)
+        rows.append(row)
+    return rows
+
+
+def run(sizes, defect_sets, output_path, skip=(), track_memory=True, seed=0, shape_names=('bone',)):
+    results = []
+    with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as temp_dir:
+        for shape, size in [(shape, size) for shape in shape_names for size in sizes]:
+            surface = shapes[shape](size)
+            for defects in defect_sets:
+                vectors, normals = synthetic_bones.inject_defects(surface, defects, seed=seed)
+                stl_path = os.path.join(temp_dir, f"{shape}_{size}_{'_'.join(defects) or 'clean'}.stl")
+                surf_mesh.write_binary_stl(stl_path, normals, vectors)
+                print(f"\n{shape}, {vectors.shape[0]} triangles, defects: {', '.join(defects) or 'none'}")
+                for row in bench_surface(stl_path, skip, track_memory):
+                    row = {'shape': shape, 'size': size, 'triangles': vectors.shape[0], 'defects': '+'.join(defects) or 'none', **row}
+                    results.append(row)
+                    memory = '' if row['peak_rss_mb'] is None else f"{row['peak_rss_mb']:>10.1f} MB peak RSS{row['rss_increase_mb']:>10.1f} MB rise"
+                    print(f"  {row['step']:<26}{row['wall_time_s']:>10.3f} s{memory}")
+                surf_mesh.clear_surface_cache()  # Close the memory map, as the GUI does at the end of a run
+                try:
+                    os.remove(stl_path)
+                except OSError:
+                    pass  # Windows keeps the file while a memory map of it is still open
+    columns = ['shape', 'size', 'triangles', 'defects', 'step', 'wall_time_s', 'peak_rss_mb', 'rss_increase_mb', 'result']
+    with open(output_path, 'w', newline='') as file:
+        file.write(f"# {platform.platform()}, Python {platform.python_version()}, NumPy {np.__version__}\n")
+        writer = csv.DictWriter(file, fieldnames=columns)
+        writer.writeheader()
+        writer.writerows(results)
+    print(f"\nResults saved to {output_path}")
+    return results
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Benchmark the STL validation layer on synthetic long bones.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=default_sizes, help="Target triangle counts.")
+    parser.add_argument('--defects', nargs='+', default=['none', 'all'],
+                        help="Defect sets to run, each 'none', 'all' or a '+' separated mix of "
+                             f"{', '.join(synthetic_bones.defect_types)}.")
+    parser.add_argument('--shapes', nargs='+', choices=list(shapes), default=list(shapes),
+                        help="Bone shapes to run, the femur is bowed with its head set to one side.")
+    parser.add_argument('--skip', nargs='*', default=[], help="Steps to leave out, e.g. find_long_shaft_axis.")
+    parser.add_argument('--no-memory', action='store_true', help="Time only, without measuring memory.")
+    parser.add_argument('--seed', type=int, default=0, help="Seed for the injected defects.")
+    parser.add_argument('-o', '--output', default='stl_validation_benchmark.csv', help="CSV file for the results.")
+    return parser
+
+
+def parse_defects(defect_set):
+    if defect_set == 'none':
+        return ()
+    if defect_set == 'all':
+        return synthetic_bones.defect_types
+    defects = tuple(defect_set.split('+'))
+    unknown = set(defects) - set(synthetic_bones.defect_types)
+    if unknown:
+        raise ValueError(f"Unknown defects: {', '.join(sorted(unknown))}")
+    return defects
+
+
+if __name__ == '__main__':
+    arguments = build_parser().parse_args()
+    run(arguments.sizes, [parse_defects(defect_set) for defect_set in arguments.defects], arguments.output,
+        arguments.skip, not arguments.no_memory, arguments.seed, arguments.shapes)
@@ -0,0 +1,142 @@
+"""
+================================================================================================================
+Synthetic Long Bone Generator for benchmarking the STL validation layer and the TET10 conversion.
+================================================================================================================
+    Created by G.H. Allison, University of Sheffield, Sheffield, United Kingdom.
+    Copyright (C) 2024 George H. Allison
+    Contact: ghallison1@sheffield.ac.uk or xinshan.li@sheffield.ac.uk
+----------------------------------------------------------------------------------------------------------------
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+________________________________________________________________________________________________________________
+"""
+
+import numpy as np
+from scipy import spatial
+
+defect_types = ('holes', 'duplicates', 'bodies', 'flipped')
+
+
+def bone_surface(triangles, length=300.0, shaft_radius=12.0, end_radius=25.0):
+    """
+    Build a watertight, outward wound surface shaped like a long bone: a narrow shaft that widens into rounded ends.
+    The surface is a stretched UV sphere, rings of vertices along the bone axis (z) closed by a pole at each end.
+    :param triangles:  The approximate number of triangles wanted
+    :param length:  The length of the bone along z
+    :param shaft_radius:  The radius in the middle of the shaft
+    :param end_radius:  The radius of the widened ends
+    :return: vectors:  The (n, 3, 3) float32 triangle corners
+    """
+    # Rings are spaced to keep the triangles roughly equilateral along the shaft
+    aspect = length / (2 * np.pi * shaft_radius)
+    n_theta = max(8, int(round(np.sqrt(triangles / (2.0 * aspect)))))
+    n_rings = max(3, int(round(triangles / (2.0 * n_theta))) + 1)
+
+    phi = np.linspace(0, np.pi, n_rings + 1)[1:-1]  # Ring latitudes, the poles are added separately
+    theta = np.linspace(0, 2 * np.pi, n_theta, endpoint=False)
+    z = -0.5 * length * np.cos(phi)
+    radius = np.sin(phi) ** 0.25 * (shaft_radius + (end_radius - shaft_radius) * np.cos(phi) ** 8)
+    rings = np.stack((np.outer(radius, np.cos(theta)), np.outer(radius, np.sin(theta)), np.repeat(z[:, None], n_theta, axis=1)), axis=-1)
+    vertices = np.vstack((rings.reshape(-1, 3), [[0, 0, -0.5 * length], [0, 0, 0.5 * length]]))
+
+    ring = np.arange(n_theta)
+    following = (ring + 1) % n_theta
+    faces = []
+    for k in range(n_rings - 2):
+        a, b = k * n_theta + ring, k * n_theta + following
+        c, d = a + n_theta, b + n_theta
+        faces.extend((np.column_stack((a, b, d)), np.column_stack((a, d, c))))
+    bottom, top = vertices.shape[0] - 2, vertices.shape[0] - 1
+    last = (n_rings - 2) * n_theta
+    faces.append(np.column_stack((np.full(n_theta, bottom), following, ring)))
+    faces.append(np.column_stack((np.full(n_theta, top), last + ring, last + following)))
+    return vertices[np.vstack(faces)].astype(np.float32)
+
+
+def femur_surface(triangles, length=420.0, bow=15.0, head_offset=40.0, head_radius=24.0):
+    """
+    Build a bone shaped like a femur, asymmetric about its centroid: a shaft bowed forward, with a head set to one
+    side of the shaft at the top on a short neck, as in the scans the landmarks are found on.
+    :param bow:  How far the middle of the shaft is bowed from the line between its ends
+    :param head_offset:  How far the centre of the head is set out from the shaft axis
+    :param head_radius:  The radius of the femoral head
+    :return: vectors:  The (n, 3, 3) float32 triangle corners, shaft and head are separate closed surfaces
+    """
+    head_triangles = max(200, triangles // 8)
+    shaft = bone_surface(triangles - head_triangles, length=length).astype(np.float64)
+    z = shaft[..., 2] / (0.5 * length)
+    shaft[..., 1] += bow * (1 - z ** 2)  # Bowed forward along y
+    top = np.clip((z - 0.6) / 0.4, 0, 1)
+    shaft[..., 0] += 0.5 * head_offset * top ** 2  # The neck leans towards the head
+
+    head = bone_surface(head_triangles, length=2 * head_radius, shaft_radius=0.95 * head_radius, end_radius=head_radius)
+    head = head.astype(np.float64) + [head_offset, 0, 0.5 * length - head_radius]
+    return np.concatenate((shaft, head)).astype(np.float32)
+
+
+def bone_volume(elements, length=300.0, shaft_radius=12.0, seed=0):
+    """
+    Build a 4 node tetrahedral mesh of a bone shaft, a Delaunay triangulation of random points filling a cylinder
+    along z, as a stand-in for the tetra mesh ICEM writes.
+    :param elements:  The approximate number of tetrahedra wanted, a Delaunay mesh has about 6.5 per point
+    :return: nodes, corners:  The (n, 3) node coordinates and the (m, 4) zero-based corner ids of each element
+    """
+    rng = np.random.default_rng(seed)
+    n_points = max(10, int(elements / 6.5))
+    radius = shaft_radius * np.sqrt(rng.random(n_points))
+    theta = 2 * np.pi * rng.random(n_points)
+    z = length * (rng.random(n_points) - 0.5)
+    nodes = np.column_stack((radius * np.cos(theta), radius * np.sin(theta), z))
+    return nodes, spatial.Delaunay(nodes).simplices.astype(np.int64)
+
+
+def face_normals(vectors):
+    normals = np.cross(vectors[:, 1] - vectors[:, 0], vectors[:, 2] - vectors[:, 0]).astype(np.float64)
+    lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+    return np.divide(normals, lengths, out=np.zeros_like(normals), where=lengths > 0).astype(np.float32)
+
+
+def inject_defects(vectors, defects, count=10, seed=0):
+    """
+    Add known defects to a surface so the checks have something to find.
+    :param vectors:  The (n, 3, 3) triangle corners of a watertight surface
+    :param defects:  Any of 'holes', 'duplicates', 'bodies' and 'flipped'
+    :param count:  How many of each defect to add, for 'flipped' it is the percentage of faces flipped
+    :param seed:  Seed of the random generator, so each run injects the same defects
+    :return: vectors, normals:  The defective surface with the stored normals it was generated with
+    """
+    rng = np.random.default_rng(seed)
+    vectors = vectors.copy()
+    normals = face_normals(vectors)  # Normals follow the original winding, so flipped faces disagree with them
+
+    if 'flipped' in defects:
+        flipped = rng.random(vectors.shape[0]) < count / 100.0
+        vectors[flipped] = vectors[flipped][:, [0, 2, 1]]
+    if 'duplicates' in defects:
+        copies = rng.choice(vectors.shape[0], count, replace=False)
+        vectors, normals = np.concatenate((vectors, vectors[copies])), np.concatenate((normals, normals[copies]))
+    if 'holes' in defects:
+        # Faces far enough apart in the face order sit on different rings, so each removal opens its own hole
+        removed = np.linspace(0, vectors.shape[0] - 1, count + 2).astype(np.int64)[1:-1]
+        keep = np.ones(vectors.shape[0], dtype=bool)
+        keep[removed] = False
+        vectors, normals = vectors[keep], normals[keep]
+    if 'bodies' in defects:
+        extent = vectors.reshape(-1, 3).max(axis=0)
+        for body in range(count):
+            fragment = bone_surface(200, length=4.0, shaft_radius=1.0, end_radius=1.5)
+            fragment += (extent + 5.0 * (body + 1)).astype(np.float32)
+            vectors, normals = np.concatenate((vectors, fragment)), np.concatenate((normals, face_normals(fragment)))
+    return vectors, normals
@@ -0,0 +1,233 @@
+"""
+================================================================================================================
+ANSYS Installation Discovery Library for finding the ICEM CFD and MAPDL executables without walking the whole disk.
+================================================================================================================
+    Created by G.H. Allison, University of Sheffield, Sheffield, United Kingdom.
+    Copyright (C) 2024 George H. Allison
+    Contact: ghallison1@sheffield.ac.uk or xinshan.li@sheffield.ac.uk
+----------------------------------------------------------------------------------------------------------------
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+________________________________________________________________________________________________________________
+
+    The installation is looked for in this order, stopping at the first that has ICEM CFD:
+        1. The cache file, when every executable in it still exists and is unchanged
+        2. The AWP_ROOTxxx environment variables set by the ANSYS installer, newest version first
+        3. Executables on the PATH
+        4. The default install folders of Windows and Linux
+        5. A breadth first search from the search root, in parallel and limited in depth and time
+"""
+
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+cache_path = os.path.join(os.path.expanduser('~'), '.pypect2s', 'ansys_paths.json')
+windows = sys.platform.startswith('win')
+icem_names = ('icemcfd.bat',) if windows else ('icemcfd',)
+platform_dirs = ('win64_amd',) if windows else ('linux64_amd', 'lnamd64')
+install_prefixes = [
+    'C:/Program Files/ANSYS Inc', 'C:/Program Files/Ansys Inc', 'D:/Program Files/ANSYS Inc',
+] if windows else [
+    '/usr/ansys_inc', '/ansys_inc', '/opt/ansys_inc', '/apps/ansys_inc', '/usr/local/ansys_inc',
+    os.path.join(os.path.expanduser('~'), 'ansys_inc'),
+]
+skip_dirs = {'$recycle.bin', 'system volume information', 'windows', 'proc', 'sys', 'dev', 'run', 'tmp', 'snap',
+             'node_modules', '.git', '__pycache__'}
+
+
+def version_of(path):
+    # The three digit release number of an install folder such as v232, or 0 when there is none
+    match = re.search(r'v(\d{3})', path.replace('\\', '/'))
+    return int(match.group(1)) if match else 0
+
+
+def install_executables(version_root):
+    """
+    The ICEM CFD, ICEM output interface and MAPDL executables of one ANSYS release folder, e.g. '.../ANSYS Inc/v232'.
+    :return: paths:  Dictionary with 'icem', 'icem_output' and 'mapdl', each None when it is not installed
+    """
+    paths = {'icem': None, 'icem_output': None, 'mapdl': None, 'version': version_of(version_root)}
+    for platform_dir in platform_dirs:
+        icem_root = os.path.join(version_root, 'icemcfd', platform_dir)
+        for name in icem_names:
+            if paths['icem'] is None and os.path.isfile(os.path.join(icem_root, 'bin', name)):
+                paths['icem'] = os.path.join(icem_root, 'bin', name)
+        output = os.path.join(icem_root, 'icemcfd', 'output-interfaces', 'ansys.exe' if windows else 'ansys')
+        if paths['icem_output'] is None and os.path.isfile(output):
+            paths['icem_output'] = output
+
+    version = paths['version']
+    if windows:
+        candidates = [os.path.join(version_root, 'ansys', 'bin', 'winx64', f'ANSYS{version}.exe')]
+    else:
+        candidates = [os.path.join(version_root, 'ansys', 'bin', name) for name in (f'ansys{version}', f'mapdl{version}', 'mapdl')]
+    paths['mapdl'] = next((candidate for candidate in candidates if os.path.isfile(candidate)), None)
+    return {key: value.replace('\\', '/') if isinstance(value, str) else value for key, value in paths.items()}
+
+
+def version_root_of(executable):
+    # Walk up from an executable to the vXXX release folder that holds it
+    path = os.path.abspath(executable)
+    while True:
+        parent = os.path.dirname(path)
+        if re.fullmatch(r'v\d{3}', os.path.basename(path)):
+            return path
+        if parent == path:
+            return None
+        path = parent
+
+
+def candidate_roots():
+    """
+    Release folders named by the installer environment variables, the PATH and the default install folders,
+    newest release first and without repeats.
+    """
+    roots = []
+    for key, value in os.environ.items():
+        if re.fullmatch(r'AWP_ROOT\d{3}', key.upper()) and os.path.isdir(value):
+            roots.append(value)
+    for folder in os.environ.get('PATH', '').split(os.pathsep):
+        root = version_root_of(folder) if re.search(r'v\d{3}', folder) else None
+        if root:
+            roots.append(root)
+    for prefix in install_prefixes:
+        try:
+            roots.extend(entry.path for entry in os.scandir(prefix) if entry.is_dir() and re.fullmatch(r'v\d{3}', entry.name))
+        except OSError:
+            continue  # This prefix does not exist here
+
+    unique = {}
+    for root in roots:
+        unique.setdefault(os.path.normcase(os.path.abspath(root)), root)
+    return sorted(unique.values(), key=version_of, reverse=True)
+
+
+def scan_dir(path):
+    # List one folder for the parallel search, unreadable folders are simply skipped
+    found, subdirs = [], []
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if entry.name.lower() not in skip_dirs:
+                            subdirs.append(entry.path)
+                    elif entry.name in icem_names:
+                        found.append(entry.path)
+                except OSError:
+                    continue
+    except OSError:
+        pass
+    return found, subdirs
+
+
+def search_icem(search_root, max_depth=8, workers=16, timeout=120.0):
+    """
+    Search for the ICEM CFD launcher below a folder, one depth level at a time with a thread pool of os.scandir
+    calls, so shallow installs are found quickly and the search never runs past its depth or time limit.
+    The time limit is checked as each folder is listed, and folders not yet listed when it passes are cancelled.
+    :return: icem_path:  The launcher found at the shallowest depth, or None
+    """
+    deadline = time.perf_counter() + timeout
+    level = [search_root]
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        for depth in range(max_depth + 1):
+            pending = {executor.submit(scan_dir, path) for path in level}
+            next_level = []
+            while pending:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    return None
+                done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+                for future in done:
+                    found, subdirs = future.result()
+                    for path in found:
+                        if os.path.basename(os.path.dirname(path)) == 'bin':
+                            return path.replace('\\', '/')
+                    next_level.extend(subdirs)
+            if not next_level:
+                break
+            level = sorted(next_level)  # Folders finish in any order, sorting keeps the search the same every run
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)  # A scandir call already running is left to finish alone
+    return None
+
+
+def read_cache():
+    """
+    The cached paths, or None when there is no cache or it is stale, i.e. an executable in it was moved, removed
+    or replaced by an update since it was found.
+    """
+    try:
+        with open(cache_path, 'r') as file:
+            cache = json.load(file)
+    except (OSError, ValueError):
+        return None
+    for key, stamp in cache.get('mtimes', {}).items():
+        path = cache.get(key)
+        if not path or not os.path.isfile(path) or os.path.getmtime(path) != stamp:
+            return None
+    return cache if cache.get('icem') else None
+
+
+def write_cache(paths):
+    paths = dict(paths)
+    paths['mtimes'] = {key: os.path.getmtime(paths[key]) for key in ('icem', 'icem_output', 'mapdl') if paths.get(key)}
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        with open(cache_path, 'w') as file:
+            json.dump(paths, file, indent=2)
+    except OSError as e:
+        print(f"Error: {e}\n Could not save the ANSYS paths to {cache_path}")
+    return paths
+
+
+def find_ansys(search_root=None, refresh=False, max_depth=8, timeout=120.0):
+    """
+    Find the ICEM CFD launcher, the ICEM ANSYS output interface and the MAPDL executable, see the module notes.
+    :param search_root:  Folder searched when no known install is found, e.g. MeshVariables.root_dir
+    :param refresh:  Ignore the cache and look again
+    :return: paths:  Dictionary with 'icem', 'icem_output', 'mapdl' and 'version', missing executables are None
+    """
+    if not refresh:
+        cache = read_cache()
+        if cache is not None:
+            return cache
+
+    for root in candidate_roots():
+        paths = install_executables(root)
+        if paths['icem']:
+            return write_cache(paths)
+
+    if search_root:
+        print(f"No ANSYS install found in the usual places, searching {search_root}...")
+        icem_path = search_icem(search_root, max_depth, timeout=timeout)
+        if icem_path:
+            root = version_root_of(icem_path)
+            paths = install_executables(root) if root else {'icem_output': None, 'mapdl': None, 'version': 0}
+            paths['icem'] = icem_path
+            return write_cache(paths)
+    return {'icem': None, 'icem_output': None, 'mapdl': None, 'version': 0}
+
+
+def mapdl_exec_file():
+    # The cached MAPDL executable for launch_mapdl, None lets ansys-mapdl-core find it itself
+    cache = read_cache()
+    return cache.get('mapdl') if cache else None
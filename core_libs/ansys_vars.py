@@ -23,17 +23,36 @@ ANSYS VARIABLES
 ________________________________________________________________________________________________________________
 """
 
+import os
 import numpy as np
 
 
 class MeshVariables:
     def __init__(self, initial_vars=None):
         if initial_vars is None:
-            self.root_dir = '\\'
+            self.root_dir = os.path.abspath(os.sep)  # Searched for ICEM CFD when no known install is found
             self.max_element_size = 3.0  # Maximum element size
+            self.weld_tol = 1e-4  # Distance within which STL corners are welded into one vertex for the STL checks
+            self.check_self_intersections = True  # Search the STL for self-intersecting faces, the slowest check
+            self.auto_repair = False  # Repair the STL before it is passed to ICEM
+            self.min_body_fraction = 0.01  # Repair removes bodies smaller than this fraction of the largest body
+            self.max_hole_edges = 100  # Repair fills holes bounded by up to this many edges
+            self.decimate = False  # Decimate the STL to the triangle budget set by max_element_size before ICEM
+            self.decimate_refinement = 3.0  # The decimated STL keeps this many triangle edges per element edge
+            self.max_deviation = 0.1  # Largest distance (mm) the decimated surface may move from the original
+            self.crop_shaft = False  # Crop the STL to the mid-shaft segment kept by the FEM solve before ICEM
+            self.crop_pc = 0.5  # Proportion of the shaft kept, should match the FEM 'Percentage of Remaining Segment'
+            self.crop_margin = 10.0  # Length (mm) kept beyond each end of the FEM segment
+            self.shaft_length = ""  # Whole bone length of the cropped STL being meshed, "" when it was not cropped
+            self.native_tet10 = False  # Convert the ICEM mesh to TET10 and write the .cdb without starting MAPDL, no .db
             self.proj_name = ""  # Project name
+            self.batch_stl_dir = ""  # Folder of STL files meshed together in batch
+            self.icem_licences = 1  # ICEM CFD licences free for batch meshing, one ICEM session is run per licence
+            self.icem_threads = 0  # Threads for ICEM tetra meshing and smoothing, 0 shares the core count between sessions
+            self.icem_time_limit = 0.0  # Minutes ICEM may take per specimen before it is stopped, 0 for no limit
+            self.icem_memory_limit = 0.0  # GB of memory ICEM may use before it is stopped, 0 for no limit
             self.icem_path = ""  # icemcfd.bat
-            self.icem_ansys_path = ""  # This is found from icem_path
+            self.icem_ansys_path = ""  # ICEM output interface to ANSYS, found with icem_path
             self.file_name = ""  # File name is pulled by commands later, file name is pulled from stl_path
             self.file_name_ext = ""  # File name pulled by commands with extension later
             self.stl_type = ""  # Type of stl file
@@ -54,7 +73,7 @@ class MeshVariables:
             for icem_variable in self.icem_variables:
                 setattr(self, icem_variable, "")
             self.icem_commands = []
-            self.files_to_remove = ['temp_tetra.tin', 'tetra_cmd.log', 'tmpdomain0.uns', 'temp_icem_script.rpl']
+            self.icem_timing = {}  # Tetra meshing and smoothing wall times of the last ICEM run, see parse_timing
         else:
             # Initialize the instance variables with the values of initial_vars
             self.__dict__ = initial_vars.__dict__.copy()
@@ -86,6 +105,13 @@ class FemVariables:
             self.middle = np.zeros(3)  # Initialises empty array for middle landmark
             self.distal = np.zeros(3)  # Initialises empty array for distal landmark
             self.proximal = np.zeros(3)  # Initialises empty array for proximal landmark
+            self.axis_sample_size = 0  # Triangles sampled to find the shaft axis of very large scans, 0 uses them all
+            self.screen_modulus = 17000.0  # Young's modulus (MPa) of the beam theory screen without Bonemat moduli
+            self.screen_slices = 20  # Cross-sections checked by the beam theory screen between the loads
+            self.screen_cell_size = 0.5  # Grid spacing (mm) used to map Bonemat moduli onto the cross-sections
+            self.moduli_cdb = ""  # Optional Bonemat material mapped .cdb file used by the beam theory screen
+            self.esl_tension = 0.0073  # 0.73% in tension | Elastic strain Limit Tension
+            self.esl_compression = 0.0104  # 1.04% in compression | Elastic strain Limit Compression
             self.roi_x = ""
             self.roi_y = ""
             self.roi_z = ""
@@ -0,0 +1,238 @@
+"""
+================================================================================================================
+Batch Functions Library for running pipeline steps over a whole cohort without the GUI.
+================================================================================================================
+    Created by G.H. Allison, University of Sheffield, Sheffield, United Kingdom.
+    Copyright (C) 2024 George H. Allison
+    Contact: ghallison1@sheffield.ac.uk or xinshan.li@sheffield.ac.uk
+----------------------------------------------------------------------------------------------------------------
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+________________________________________________________________________________________________________________
+"""
+
+import contextlib
+import csv
+import io
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from core_libs import ansys_vars, beam_funcs, gui_vars, ldmk_funcs, stl_checks, surf_mesh
+
+
+def find_stl_files(stl_dir, recursive=False):
+    """
+    List the STL files in a directory, sorted by path.
+    :param stl_dir:  The directory to search
+    :param recursive:  Also search the sub-directories
+    :return: stl_paths
+    """
+    stl_paths = []
+    for root, dirs, files in os.walk(stl_dir):
+        stl_paths.extend(os.path.join(root, file).replace("\\", "/") for file in files if file.lower().endswith('.stl'))
+        if not recursive:
+            break
+    return sorted(stl_paths)
+
+
+def pool_size(n_jobs, workers=None):
+    """
+    Number of worker processes, one per physical core by default and never more than there are jobs.
+    """
+    if workers is None:
+        workers = gui_vars.GuiVariables().phys_core or 1
+    return max(1, min(workers, n_jobs))
+
+
+def validate_stl(stl_path, weld_tol=None, fail_fast=False):
+    """
+    Run the STL checks on one file, this is the worker run in each process.
+    The printed check output is captured so the output of parallel workers does not interleave.
+    :return: row:  Dictionary of the file, its triangle count, status, issues, time and the per-check results
+    """
+    start = time.perf_counter()
+    row = {'file': os.path.basename(stl_path), 'path': stl_path, 'triangles': None, 'status': 'ERROR', 'issues': ''}
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            surface = surf_mesh.SurfaceMesh(stl_path, weld_tol=weld_tol)
+            report = stl_checks.STLChecks(surface, fail_fast=fail_fast).report
+        row['triangles'] = int(surface.vectors.shape[0])
+        row['status'] = 'FAIL' if report.failed else 'PASS'
+        row['issues'] = "; ".join(f"{result.name}: {result.count}" for result in report.errors + report.warnings)
+        row.update({key: value for key, value in report.as_dict().items() if key != 'stl_path'})
+    except Exception as e:
+        row['issues'] = f"Error: {e}"
+    row['wall_time'] = round(time.perf_counter() - start, 4)
+    return row
+
+
+def validate_cohort(stl_dir, workers=None, weld_tol=None, fail_fast=False, recursive=False):
+    """
+    Validate every STL file in a directory with a process pool.
+    :param stl_dir:  The directory holding the STL files
+    :param workers:  Number of processes, None uses the physical core count from GuiVariables
+    :param weld_tol:  Weld tolerance passed to the checks, None uses the default
+    :param fail_fast:  Stop each file at its first hard error
+    :param recursive:  Also validate STL files in sub-directories
+    :return: rows:  One summary row per file, in file order
+    """
+    stl_paths = find_stl_files(stl_dir, recursive)
+    if not stl_paths:
+        print(f"No STL files found in {stl_dir}")
+        return []
+
+    workers = pool_size(len(stl_paths), workers)
+    print(f"Validating {len(stl_paths)} STL files with {workers} worker process(es)...")
+    rows = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(validate_stl, stl_path, weld_tol, fail_fast): stl_path for stl_path in stl_paths}
+        for done, future in enumerate(as_completed(futures), start=1):
+            row = future.result()
+            rows[futures[future]] = row
+            print(f"[{done}/{len(stl_paths)}] {row['file']}: {row['status']} ({row['wall_time']:.2f} s) {row['issues']}")
+    return [rows[stl_path] for stl_path in stl_paths]
+
+
+def landmark_stl(stl_path, output_dir, bm_rot=False, axis_sample_size=0):
+    """
+    Find the landmarks of one bone and write them to '<output_dir>/<name>/landmarks', this is the worker run in each
+    process. The files are those read by read_landmark_file, so the FEM scripts skip their own landmark search when
+    that folder is their FEM file directory.
+    :param bm_rot:  The model was rotated in Bonemat, as set by 'Segmented with RAS Coordinate System' in the GUI
+    :return: row:  Dictionary of the file, its landmarks and the time taken
+    """
+    start = time.perf_counter()
+    row = {'file': os.path.basename(stl_path), 'path': stl_path, 'status': 'ERROR', 'issues': ''}
+    try:
+        vari = ansys_vars.FemVariables()
+        vari.axis_sample_size = axis_sample_size
+        with contextlib.redirect_stdout(io.StringIO()):
+            surface = surf_mesh.SurfaceMesh(stl_path)
+            ldmk_funcs.find_long_shaft_axis(vari, surface, bm_rot)
+        landmarks_dir = os.path.join(output_dir, os.path.splitext(os.path.basename(stl_path))[0], 'landmarks')
+        os.makedirs(landmarks_dir, exist_ok=True)
+        ldmk_funcs.write_landmark_files(vari, landmarks_dir)
+        row.update({
+            'status': 'DONE',
+            'landmarks_dir': landmarks_dir.replace("\\", "/"),
+            'middle': [round(float(value), 6) for value in vari.middle],
+            'distal': [round(float(value), 6) for value in vari.distal],
+            'proximal': [round(float(value), 6) for value in vari.proximal],
+        })
+    except Exception as e:
+        row['issues'] = f"Error: {e}"
+    row['wall_time'] = round(time.perf_counter() - start, 4)
+    return row
+
+
+def landmark_cohort(stl_dir, output_dir=None, workers=None, bm_rot=False, axis_sample_size=0, recursive=False):
+    """
+    Find the landmarks of every STL file in a directory with a process pool, before any FEM job starts.
+    :param output_dir:  Directory the '<name>/landmarks' folders are written to, None uses stl_dir
+    :return: rows:  One summary row per file, in file order
+    """
+    stl_paths = find_stl_files(stl_dir, recursive)
+    if not stl_paths:
+        print(f"No STL files found in {stl_dir}")
+        return []
+
+    output_dir = output_dir or stl_dir
+    workers = pool_size(len(stl_paths), workers)
+    print(f"Finding landmarks of {len(stl_paths)} STL files with {workers} worker process(es)...")
+    rows = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(landmark_stl, stl_path, output_dir, bm_rot, axis_sample_size): stl_path for stl_path in stl_paths}
+        for done, future in enumerate(as_completed(futures), start=1):
+            row = future.result()
+            rows[futures[future]] = row
+            print(f"[{done}/{len(stl_paths)}] {row['file']}: {row['status']} ({row['wall_time']:.2f} s) {row['issues']}")
+    return [rows[stl_path] for stl_path in stl_paths]
+
+
+def screen_stl(stl_path, force=120.0, pc=0.5, pf=0.5, angle_inc=10, modulus=17000.0):
+    """
+    Screen the four point bending strength of one bone with beam theory, this is the worker run in each process.
+    The landmarks are found automatically, as the bones have not been through the GUI.
+    :return: row:  Dictionary of the file, its weakest orientation and its force and moment to failure
+    """
+    start = time.perf_counter()
+    row = {'file': os.path.basename(stl_path), 'path': stl_path, 'status': 'ERROR', 'issues': ''}
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            surface = surf_mesh.SurfaceMesh(stl_path)
+            distal, proximal, middle = ldmk_funcs.shaft_landmarks(surface)
+            angles = np.arange(int(360 / angle_inc)) * angle_inc
+            results = beam_funcs.screen_bending(surface, middle, distal, proximal, force, pc, pf, angles, modulus=modulus)
+        weakest = results[np.argmin(results['Force to Failure (N)'])]
+        row.update({
+            'status': 'DONE',
+            'weakest_angle': float(weakest['Angle']),
+            'fail_type': str(weakest['Fail Type']),
+            'min_force_to_failure': round(float(weakest['Force to Failure (N)']), 4),
+            'min_moment_to_failure': round(float(weakest['Moment to Failure (Nm)']), 4),
+            'mean_force_to_failure': round(float(np.mean(results['Force to Failure (N)'])), 4),
+        })
+    except Exception as e:
+        row['issues'] = f"Error: {e}"
+    row['wall_time'] = round(time.perf_counter() - start, 4)
+    return row
+
+
+def screen_cohort(stl_dir, workers=None, recursive=False, **screen_args):
+    """
+    Screen every STL file in a directory with a process pool, to rank a cohort before the full FEM runs.
+    :param screen_args:  Loading and material arguments passed to screen_stl
+    :return: rows:  One summary row per file, weakest bone first, failed files last
+    """
+    stl_paths = find_stl_files(stl_dir, recursive)
+    if not stl_paths:
+        print(f"No STL files found in {stl_dir}")
+        return []
+
+    workers = pool_size(len(stl_paths), workers)
+    print(f"Screening {len(stl_paths)} STL files with {workers} worker process(es)...")
+    rows = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(screen_stl, stl_path, **screen_args) for stl_path in stl_paths]
+        for done, future in enumerate(as_completed(futures), start=1):
+            row = future.result()
+            rows.append(row)
+            result = f"{row['min_force_to_failure']:.1f} N at {row['weakest_angle']:.0f} deg" if row['status'] == 'DONE' else row['issues']
+            print(f"[{done}/{len(stl_paths)}] {row['file']}: {result} ({row['wall_time']:.2f} s)")
+    return sorted(rows, key=lambda row: (row['status'] != 'DONE', row.get('min_force_to_failure', 0), row['path']))
+
+
+def write_summary(rows, output_path):
+    """
+    Write the summary rows to '<output_path>.csv' and '<output_path>.json'.
+    Files stopped early by fail-fast mode have fewer columns, missing values are left blank in the CSV.
+    :return: csv_path, json_path
+    """
+    output_path = os.path.splitext(output_path)[0]
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    columns = []
+    for row in rows:
+        columns.extend(key for key in row if key not in columns)
+
+    csv_path, json_path = f"{output_path}.csv", f"{output_path}.json"
+    with open(csv_path, 'w', newline='') as file:
+        writer = csv.DictWriter(file, fieldnames=columns)
+        writer.writeheader()
+        writer.writerows(rows)
+    with open(json_path, 'w') as file:
+        json.dump(rows, file, indent=2)
+    return csv_path, json_path
@@ -0,0 +1,172 @@
+"""
+================================================================================================================
+Beam Theory Library for screening the four point bending strength of a femur from its STL in seconds.
+================================================================================================================
+    Created by G.H. Allison, University of Sheffield, Sheffield, United Kingdom.
+    Copyright (C) 2024 George H. Allison
+    Contact: ghallison1@sheffield.ac.uk or xinshan.li@sheffield.ac.uk
+----------------------------------------------------------------------------------------------------------------
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+________________________________________________________________________________________________________________
+
+    The loading follows fem_libs/A_APDL_4B_fem.py: supports at +/- l * pc / 2 and loads at +/- l * pc * pf / 2 about
+    the centre of the segment, so the span between the loads carries a constant moment F * (x_upper - fx_upper).
+    Each cross-section of that span is treated as a composite beam section, with strain varying linearly over it,
+    and the force to failure is found with the strain limits of post_libs/A_post.py.
+"""
+
+import numpy as np
+from scipy.spatial import cKDTree
+from core_libs import cdb_funcs, section_funcs
+
+result_dtype = [('Angle', 'f8'), ('Max Tension', 'f8'), ('Max Compression', 'f8'), ('Fail Type', 'U20'),
+                ('Force to Failure (N)', 'f8'), ('Moment to Failure (Nm)', 'f8')]
+
+
+def read_cdb_moduli(cdb_path):
+    """
+    Read the element centroids and Young's moduli of a Bonemat material mapped .cdb file.
+    Bonemat writes one material per modulus band as MPDATA EX lines, and each element of the EBLOCK refers to one.
+    The centroid is taken from the four corner nodes, which come first for both TET4 and TET10 elements.
+    :return: centroids, moduli:  The (n, 3) element centroids and (n,) moduli
+    """
+    mesh = cdb_funcs.read_cdb(cdb_path)
+    corners = cdb_funcs.node_index(mesh['node_ids'], mesh['connectivity'][:, :4])
+    centroids = mesh['nodes'][corners].mean(axis=1)
+    element_moduli = np.array([mesh['moduli'].get(material, np.nan) for material in mesh['materials'].tolist()])
+    found = np.isfinite(element_moduli)
+    return centroids[found], element_moduli[found]
+
+
+def inside_cells(start, end, cell_size):
+    """
+    Find the centres of a square grid lying inside a cross-section, by counting the section boundary crossings
+    of a ray from each centre, row by row.
+    :param start, end:  The (m, 2) directed boundary segments of the section
+    :return: cells:  The (k, 2) centres inside the section
+    """
+    points = np.vstack((start, end))
+    low, high = points.min(axis=0), points.max(axis=0)
+    gx = np.arange(low[0] + cell_size / 2, high[0], cell_size)
+    gy = np.arange(low[1] + cell_size / 2, high[1], cell_size)
+    cells = []
+    for y in gy:
+        straddle = (start[:, 1] > y) != (end[:, 1] > y)
+        if not np.any(straddle):
+            continue
+        a, b = start[straddle], end[straddle]
+        crossings = np.sort(a[:, 0] + (y - a[:, 1]) * (b[:, 0] - a[:, 0]) / (b[:, 1] - a[:, 1]))
+        inside = (crossings.shape[0] - np.searchsorted(crossings, gx)) % 2 == 1
+        cells.append(np.column_stack((gx[inside], np.full(inside.sum(), y))))
+    return np.vstack(cells) if cells else np.zeros((0, 2))
+
+
+def section_rigidity(start, end, modulus, section_point=None, moduli_tree=None, moduli=None, cell_size=0.5):
+    """
+    The bending rigidity of a cross-section, homogeneous or with moduli mapped from a Bonemat mesh.
+    Homogeneous sections use the exact Green's theorem sums over the boundary segments. With moduli, the section is
+    filled with a grid of cells, each taking the modulus of the nearest element.
+    :param start, end:  The directed boundary segments of the section in (u, v) section coordinates
+    :param modulus:  Young's modulus (MPa) of a homogeneous section
+    :param section_point:  Function mapping (k, 2) section coordinates to (k, 3) model coordinates
+    :param moduli_tree, moduli:  A cKDTree of the element centroids and the element moduli
+    :return: centroid, rigidity:  The modulus weighted centroid and the (2, 2) tensor of E (r - c)(r - c)^T dA
+    """
+    if moduli_tree is None:
+        (x1, y1), (x2, y2) = start.T, end.T
+        cross = x1 * y2 - x2 * y1
+        area = cross.sum() / 2
+        centroid = np.array([((x1 + x2) * cross).sum(), ((y1 + y2) * cross).sum()]) / (6 * area)
+        uu = ((x1 * x1 + x1 * x2 + x2 * x2) * cross).sum() / 12 - area * centroid[0] ** 2
+        vv = ((y1 * y1 + y1 * y2 + y2 * y2) * cross).sum() / 12 - area * centroid[1] ** 2
+        uv = ((x1 * y2 + 2 * x1 * y1 + 2 * x2 * y2 + x2 * y1) * cross).sum() / 24 - area * centroid[0] * centroid[1]
+        return centroid, modulus * np.array([[uu, uv], [uv, vv]])
+
+    cells = inside_cells(start, end, cell_size)
+    cell_moduli = moduli[moduli_tree.query(section_point(cells))[1]] * cell_size ** 2
+    centroid = cell_moduli @ cells / cell_moduli.sum()
+    offsets = cells - centroid
+    return centroid, (offsets * cell_moduli[:, None]).T @ offsets
+
+
+def screen_bending(mesh_data, middle, distal, proximal, force, pc, pf, angles, length="", n_slices=20, modulus=17000.0,
+                   moduli=None, cell_size=0.5, esl_tension=0.0073, esl_compression=0.0104):
+    """
+    Estimate the four point bending force and moment to failure of a femur for each loading orientation.
+    The segment frame follows local_func: the axis joins the centroids of the sections at either end of the segment,
+    and orientation 0 loads the bone in -y, with y pointing at the proximal landmark. Other orientations rotate y
+    about the axis. Each section between the loads carries the moment M = F * a, its curvature solves
+    rigidity @ k = M * load direction, and the strain at each boundary point r is k . (r - centroid).
+    :param mesh_data:  The bone surface, a surf_mesh.SurfaceMesh or numpy-stl mesh, in the frame of the landmarks
+    :param force:  The applied force F (N)
+    :param angles:  The orientations (degrees) to screen
+    :param length:  The bone length as in FemVariables.l, or "" to measure it along the axis
+    :param n_slices:  Number of cross-sections screened between the loads
+    :param modulus:  Young's modulus (MPa) used when no Bonemat moduli are given
+    :param moduli:  Optional (centroids, moduli) of Bonemat mapped elements, see read_cdb_moduli
+    :return: results:  Structured array with one row per orientation, in the columns of Max_Strain_Bending.csv
+    """
+    corners = mesh_data.vectors
+    proximal_end, distal_end, origin = section_funcs.mid_ends(mesh_data, middle, distal, pc, length)
+    axis = (distal_end - proximal_end) / np.linalg.norm(distal_end - proximal_end)
+    y0 = np.asarray(proximal, dtype=np.float64) - origin
+    y0 -= (y0 @ axis) * axis
+    y0 /= np.linalg.norm(y0)
+    z0 = np.cross(axis, y0)
+
+    if length == "":
+        heights = (corners.reshape(-1, 3) - origin) @ axis
+        length = heights.max() - heights.min()
+    x_upper = float(length) * pc / 2
+    fx_upper = float(length) * pc * pf / 2
+    lever = x_upper - fx_upper
+    positions = np.linspace(-fx_upper, fx_upper, n_slices)
+
+    rad = np.deg2rad(np.asarray(angles, dtype=np.float64))
+    loads = -(np.outer(np.cos(rad), y0) + np.outer(np.sin(rad), z0))  # Force direction of each orientation
+    u, v = section_funcs.section_basis(axis)
+    loads_uv = np.column_stack((loads @ u, loads @ v))
+
+    moduli_tree, element_moduli = (None, None) if moduli is None else (cKDTree(moduli[0]), moduli[1])
+    tension = np.zeros(rad.shape[0])
+    compression = np.zeros(rad.shape[0])
+    segments = list(section_funcs.section_segments(corners, origin, axis, positions))
+    plane = np.concatenate([segment[0] for segment in segments])
+    start = np.vstack([segment[1] for segment in segments])
+    end = np.vstack([segment[2] for segment in segments])
+    for index, position in enumerate(positions):
+        mask = plane == index
+        if not np.any(mask):
+            continue
+        section_point = lambda points: origin + position * axis + np.outer(points[:, 0], u) + np.outer(points[:, 1], v)
+        centroid, rigidity = section_rigidity(start[mask], end[mask], modulus, section_point, moduli_tree,
+                                              element_moduli, cell_size)
+        # Sagging puts the side the load points to in tension, strain per unit force
+        curvatures = np.linalg.solve(rigidity, (lever * loads_uv).T)
+        strains = (start[mask] - centroid) @ curvatures
+        tension = np.maximum(tension, strains.max(axis=0))
+        compression = np.maximum(compression, -strains.min(axis=0))
+
+    tension_fails = tension / esl_tension >= compression / esl_compression
+    force_to_failure = np.where(tension_fails, esl_tension / tension, esl_compression / compression)
+    results = np.zeros(rad.shape[0], dtype=result_dtype)
+    results['Angle'] = angles
+    results['Max Tension'] = tension * force
+    results['Max Compression'] = -compression * force
+    results['Fail Type'] = np.where(tension_fails, "Tension", "Compression")
+    results['Force to Failure (N)'] = force_to_failure
+    results['Moment to Failure (Nm)'] = force_to_failure * lever / 1000
+    return results
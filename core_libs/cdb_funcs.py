@@ -0,0 +1,293 @@
+"""
+================================================================================================================
+CDB Library for reading and writing ANSYS blocked mesh files and converting 4 node tetrahedra to 10 node SOLID187.
+================================================================================================================
+    Created by G.H. Allison, University of Sheffield, Sheffield, United Kingdom.
+    Copyright (C) 2024 George H. Allison
+    Contact: ghallison1@sheffield.ac.uk or xinshan.li@sheffield.ac.uk
+----------------------------------------------------------------------------------------------------------------
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+________________________________________________________________________________________________________________
+
+    This replaces the MAPDL session of apdl_mesh, which reads the ICEM .inp file, sets element type 187, adds the
+    midside nodes with EMID and writes the .cdb with CDWRITE. ICEM writes the .inp in the same NBLOCK and EBLOCK
+    format as CDWRITE when given -use_blocks, so one reader serves the ICEM output, our .cdb and Bonemat's .cdb.
+    The midside nodes sit at the middle of each straight edge, as EMID places them, and are numbered after the
+    highest corner node.
+"""
+
+import re
+import numpy as np
+
+tet10_edges = np.array([[0, 1], [1, 2], [2, 0], [0, 3], [1, 3], [2, 3]])  # Corners of midside nodes M to R of SOLID187
+
+
+def fixed_format(line):
+    """
+    Field widths and kinds of an ANSYS format line such as (19i9) or (3i9,6e21.13e3).
+    :return: widths, kinds:  One width and one 'i' or 'e' per field
+    """
+    widths, kinds = [], []
+    for group in line.strip().strip('()').lower().split(','):
+        kind = 'i' if 'i' in group else 'e'
+        count, width = group.split(kind, 1)
+        widths += [int(width.split('.')[0])] * int(count or 1)
+        kinds += [kind] * int(count or 1)
+    return widths, kinds
+
+
+def parse_fixed(lines, widths, kinds):
+    """
+    Parse a block of fixed width lines at once, as one character array sliced into fields.
+    Trailing fields left out by ANSYS, and blank fields, are read as 0.
+    :return: columns:  One array per field, int64 for 'i' fields and float64 for 'e' fields
+    """
+    total = sum(widths)
+    text = "".join(line.rstrip("\r\n").ljust(total)[:total] for line in lines)
+    chars = np.frombuffer(text.encode('ascii', 'replace'), dtype='S1').reshape(len(lines), total)
+    columns, start = [], 0
+    for width, kind in zip(widths, kinds):
+        field = np.char.strip(np.ascontiguousarray(chars[:, start:start + width]).view(f'S{width}').ravel())
+        field[field == b''] = b'0'
+        columns.append(field.astype(np.int64 if kind == 'i' else np.float64))
+        start += width
+    return columns
+
+
+def block_end(lines, start, node_block):
+    # First line after a block, NBLOCK ends with 'N,R5.3,LOC,-1,' or -1, EBLOCK with -1
+    end = start
+    while end < len(lines):
+        line = lines[end].strip()
+        if line.startswith('-1') or (node_block and line.upper().startswith('N,')):
+            break
+        end += 1
+    return end
+
+
+def read_elements(lines, widths, kinds):
+    """
+    Parse the lines of a solid EBLOCK. Each element has a line of 11 fields and its first 8 nodes, and elements of
+    more than 8 nodes carry on over a second line.
+    :return: materials, types, element_ids, n_nodes, connectivity:  Per element, connectivity zero padded to 20 nodes
+    """
+    rows = np.column_stack(parse_fixed(lines, widths, kinds))
+    rows = np.pad(rows, ((0, 0), (0, max(0, 19 - rows.shape[1]))))
+    heads, row = [], 0
+    counts = rows[:, 8]
+    while row < rows.shape[0]:
+        heads.append(row)
+        row += 2 if counts[row] > 8 else 1
+    heads = np.array(heads, dtype=np.int64)
+    more = rows[heads, 8] > 8
+    second = np.zeros((heads.shape[0], 12), dtype=np.int64)
+    second[more] = rows[heads[more] + 1, :12]
+    connectivity = np.hstack((rows[heads, 11:19], second))
+    return rows[heads, 0], rows[heads, 1], rows[heads, 10], rows[heads, 8], connectivity
+
+
+def read_cdb(cdb_path):
+    """
+    Read the nodes, elements and materials of an ANSYS blocked mesh file: a .cdb written by CDWRITE, write_cdb or
+    Bonemat, or the .inp written by ICEM with -use_blocks.
+    :return: mesh:  Dictionary of 'node_ids' (n,) sorted, 'nodes' (n, 3), 'element_ids', 'materials', 'types' and
+        'n_nodes' (m,), 'connectivity' (m, k) node ids zero padded, 'moduli' {material: EX} and
+        'element_types' {type: element name or number}
+    """
+    with open(cdb_path, 'r', errors='replace') as file:
+        lines = file.read().splitlines()
+
+    node_parts, element_parts, moduli, element_types = [], [], {}, {}
+    index = 0
+    while index < len(lines):
+        fields = [field.strip() for field in lines[index].split(',')]
+        keyword = fields[0].upper()
+        if keyword == 'NBLOCK':
+            widths, kinds = fixed_format(lines[index + 1])
+            end = block_end(lines, index + 2, True)
+            if end > index + 2:
+                columns = parse_fixed(lines[index + 2:end], widths, kinds)
+                coordinates = columns[3:6] + [np.zeros(columns[0].shape[0])] * (6 - len(columns))
+                node_parts.append((columns[0], np.column_stack(coordinates)))
+            index = end
+        elif keyword == 'EBLOCK':
+            if len(fields) > 2 and fields[2].upper() != 'SOLID':
+                raise ValueError(f"{cdb_path}: only solid EBLOCKs can be read, not {fields[2]}")
+            widths, kinds = fixed_format(lines[index + 1])
+            end = block_end(lines, index + 2, False)
+            if end > index + 2:
+                element_parts.append(read_elements(lines[index + 2:end], widths, kinds))
+            index = end
+        elif keyword == 'MPDATA' and len(fields) > 6 and fields[3].upper() == 'EX':
+            moduli[int(fields[4])] = float(fields[6])  # MPDATA,R5.0, 1,EX, material, 1, value,
+        elif keyword == 'ET' and len(fields) > 2:
+            element_types[int(fields[1])] = fields[2]
+        index += 1
+
+    if not node_parts or not element_parts:
+        raise ValueError(f"{cdb_path}: no NBLOCK or EBLOCK found, the file is not in blocked format")
+    node_ids = np.concatenate([ids for ids, _ in node_parts])
+    nodes = np.vstack([coordinates for _, coordinates in node_parts])
+    order = np.argsort(node_ids, kind='stable')
+    materials, types, element_ids, n_nodes, connectivity = (np.concatenate(part) for part in zip(*element_parts))
+    connectivity = connectivity[:, :max(1, n_nodes.max())]
+    return {'node_ids': node_ids[order], 'nodes': nodes[order], 'element_ids': element_ids, 'materials': materials,
+            'types': types, 'n_nodes': n_nodes, 'connectivity': connectivity, 'moduli': moduli,
+            'element_types': element_types}
+
+
+def node_index(node_ids, ids):
+    # Rows of the sorted node_ids holding the given node numbers
+    index = np.searchsorted(node_ids, ids)
+    if np.any(index >= node_ids.shape[0]) or np.any(node_ids[np.minimum(index, node_ids.shape[0] - 1)] != ids):
+        raise ValueError("Elements refer to nodes missing from the NBLOCK")
+    return index
+
+
+def tet_corners(mesh):
+    """
+    The four corner nodes of every element, which must all be tetrahedra: 4 node, 10 node, or 8 node degenerate
+    bricks I, J, K, K, M, M, M, M as ICEM writes them for SOLID185.
+    :return: corners:  (m, 4) node ids
+    """
+    n_nodes, connectivity = mesh['n_nodes'], mesh['connectivity']
+    corners = np.zeros((n_nodes.shape[0], 4), dtype=np.int64)
+    plain = (n_nodes == 4) | (n_nodes == 10)
+    corners[plain] = connectivity[plain, :4]
+    brick = n_nodes == 8
+    nodes = connectivity[brick]
+    degenerate = (nodes[:, 2] == nodes[:, 3]) & np.all(nodes[:, 4:8] == nodes[:, 4:5], axis=1)
+    if not np.all(plain | brick) or not np.all(degenerate):
+        raise ValueError("The mesh has elements that are not tetrahedra")
+    corners[brick] = nodes[:, [0, 1, 2, 4]]
+    return corners
+
+
+def tet4_to_tet10(node_ids, nodes, corners):
+    """
+    Add a midside node to every edge of a tetrahedral mesh, once per edge however many elements share it.
+    The six edges of every element are keyed by their sorted corner ids and made unique in one np.unique call, so
+    the elements sharing an edge get the same midside node.
+    :param node_ids, nodes:  The sorted (n,) node numbers and (n, 3) coordinates
+    :param corners:  The (m, 4) corner node numbers of each element
+    :return: node_ids, nodes, connectivity:  Nodes with the midside nodes appended after the highest node number,
+        and the (m, 10) SOLID187 connectivity I, J, K, L, M to R
+    """
+    edges = np.sort(corners[:, tet10_edges], axis=2).reshape(-1, 2)
+    base = np.int64(node_ids.max()) + 1
+    keys, inverse = np.unique(edges[:, 0] * base + edges[:, 1], return_inverse=True)
+    first, second = node_index(node_ids, keys // base), node_index(node_ids, keys % base)
+    mid_ids = base + np.arange(keys.shape[0], dtype=np.int64)
+    mid_nodes = (nodes[first] + nodes[second]) / 2
+    connectivity = np.hstack((corners, mid_ids[inverse.reshape(-1)].reshape(-1, 6)))
+    return np.concatenate((node_ids, mid_ids)), np.vstack((nodes, mid_nodes)), connectivity
+
+
+def exponent_3(text, values):
+    """
+    Python writes two exponent digits, the e21.13e3 fields of CDWRITE have three. When no value needs three digits
+    already, which is the case for any mesh coordinate, plain replaces do this far faster than a regular expression.
+    """
+    magnitude = np.abs(values[values != 0])
+    if magnitude.size == 0 or (magnitude.min() >= 1e-99 and magnitude.max() < 1e100):
+        return text.replace('E+', 'E+0').replace('E-', 'E-0')
+    return re.sub(r'E([+-])(\d\d)(?!\d)', r'E\g<1>0\2', text)
+
+
+def write_cdb(cdb_path, node_ids, nodes, element_ids, connectivity, materials=None, element_type=187, title=""):
+    """
+    Write a mesh of one element type to a .cdb in the blocked format of CDWRITE, which MAPDL CDREAD and Bonemat
+    read. Each block is formatted in one string operation rather than line by line.
+    :param connectivity:  The (m, k) node numbers of each element, up to 20 per element
+    :param materials:  The (m,) material of each element, 1 for all by default
+    """
+    node_ids = np.asarray(node_ids, dtype=np.int64)
+    element_ids = np.asarray(element_ids, dtype=np.int64)
+    connectivity = np.asarray(connectivity, dtype=np.int64)
+    m, k = connectivity.shape
+    materials = np.ones(m, dtype=np.int64) if materials is None else np.asarray(materials, dtype=np.int64)
+
+    nodes = np.asarray(nodes, dtype=np.float64)
+    node_table = np.zeros((node_ids.shape[0], 6), dtype=object)
+    node_table[:, 0] = node_ids
+    node_table[:, 3:6] = nodes
+    node_text = exponent_3(("%9d%9d%9d% .13E% .13E% .13E\n" * node_ids.shape[0]) % tuple(node_table.ravel().tolist()), nodes)
+
+    heads = np.zeros((m, 19), dtype=np.int64)
+    heads[:, 0], heads[:, 1], heads[:, 2], heads[:, 3] = materials, 1, 1, 1  # Material, type, real and section
+    heads[:, 8], heads[:, 10] = k, element_ids
+    heads[:, 11:11 + min(k, 8)] = connectivity[:, :8]
+    if k > 8:
+        element_format = "%9d" * 19 + "\n" + "%9d" * (k - 8) + "\n"
+        element_table = np.hstack((heads, connectivity[:, 8:]))
+    else:
+        element_format = "%9d" * (11 + k) + "\n"
+        element_table = heads[:, :11 + k]
+    element_text = (element_format * m) % tuple(element_table.ravel().tolist())
+
+    with open(cdb_path, 'w') as file:
+        file.write("/PREP7\n/NOPR\n")
+        file.write(f"/TITLE,{title}\n")
+        file.write(f"ET,{1:9d},{element_type}\n")
+        file.write(f"NBLOCK,6,SOLID,{node_ids.max():10d},{node_ids.shape[0]:10d}\n(3i9,6e21.13e3)\n")
+        file.write(node_text)
+        file.write("N,R5.3,LOC,       -1,\n")
+        file.write(f"EBLOCK,19,SOLID,{element_ids.max():10d},{m:10d}\n(19i9)\n")
+        file.write(element_text)
+        file.write("       -1\n/GO\nFINISH\n")
+
+
+def verify_cdb(cdb_path, node_ids, nodes, element_ids, connectivity, rtol=1e-12):
+    """
+    Read a written .cdb back and check it holds the mesh it was written from: the same node numbers and coordinates,
+    the same EBLOCK element numbers and connectivity, and every midside node at the middle of its edge.
+    :param rtol:  Tolerance on the coordinates relative to the size of the mesh, the .cdb keeps 14 significant digits
+    :raises ValueError:  Naming the first check that failed
+    """
+    mesh = read_cdb(cdb_path)
+    scale = max(float(np.abs(nodes).max()), 1.0) * rtol
+    checks = [
+        ('node numbers', lambda: np.array_equal(mesh['node_ids'], node_ids)),
+        ('node coordinates', lambda: np.allclose(mesh['nodes'], nodes, rtol=0, atol=scale)),
+        ('element numbers', lambda: np.array_equal(mesh['element_ids'], element_ids)),
+        ('EBLOCK connectivity', lambda: np.all(mesh['n_nodes'] == connectivity.shape[1])
+            and np.array_equal(mesh['connectivity'], connectivity)),
+    ]
+    for name, check in checks:
+        if not check():
+            raise ValueError(f"{cdb_path}: the {name} read back do not match the mesh written")
+
+    # Each midside node M to R must sit halfway along the edge of the corners it belongs to
+    if connectivity.shape[1] == 10:
+        points = mesh['nodes'][node_index(mesh['node_ids'], mesh['connectivity'])]
+        midpoints = (points[:, tet10_edges[:, 0]] + points[:, tet10_edges[:, 1]]) / 2
+        if not np.allclose(points[:, 4:], midpoints, rtol=0, atol=2 * scale):
+            raise ValueError(f"{cdb_path}: midside nodes read back are not at the middle of their edges")
+
+
+def inp_to_cdb(inp_path, cdb_path, title="", verify=True):
+    """
+    Convert the tetrahedral mesh of an ICEM .inp file to a SOLID187 .cdb with midside nodes, without MAPDL.
+    :param verify:  Read the .cdb back and check it against the converted mesh, see verify_cdb
+    :return: n_nodes, n_elements:  The node and element counts of the written mesh
+    """
+    mesh = read_cdb(inp_path)
+    corners = tet_corners(mesh)
+    node_ids, nodes, connectivity = tet4_to_tet10(mesh['node_ids'], mesh['nodes'], corners)
+    write_cdb(cdb_path, node_ids, nodes, mesh['element_ids'], connectivity, mesh['materials'], 187, title)
+    if verify:
+        verify_cdb(cdb_path, node_ids, nodes, mesh['element_ids'], connectivity)
+    return node_ids.shape[0], connectivity.shape[0]
@@ -30,7 +30,7 @@ import numpy as np
 from concurrent.futures import ThreadPoolExecutor
 from stl import mesh
 import os
-from core_libs import waitingspinnerwidget
+from core_libs import waitingspinnerwidget, surf_mesh, tool_runner
 
 
 def browse_file_path(text, var_target, var_key, file_types, line_edit_name, parent_widget):
@@ -165,6 +165,14 @@ def create_gui_element(element_info, signal_slots=None):
                 var_name, var_inst, slot_func = signal_slots['valueChanged']
                 widget.currentIndexChanged.connect(lambda value, vn=var_name, vi=var_inst: on_value_changed(value, vi, vn))
             return widget
+        case 'QCheckBox':
+            widget = QCheckBox(element_info.get('text', ''))
+            widget.setObjectName(element_info.get('obname', ''))
+            widget.setChecked(element_info.get('checked', False))
+            if signal_slots and 'stateChanged' in signal_slots:
+                var_name, var_inst, slot_func = signal_slots['stateChanged']
+                widget.stateChanged.connect(lambda state, vn=var_name, vi=var_inst: on_state_changed(state, vi, vn))
+            return widget
         case _:
             return None
 
@@ -206,47 +214,22 @@ def load_stl(file_path):
 
 
 def rotate_stl_180_z(stl_path):
-    # Load the STL file
-    model_mesh = load_stl(stl_path)
+    # Reuse the surface parsed for this path rather than reading the STL file again, or a surface already in memory
+    if isinstance(stl_path, surf_mesh.SurfaceMesh):
+        model_mesh = stl_path
+    else:
+        model_mesh = surf_mesh.load_surface_mesh(stl_path)
 
     # Define the rotation matrix for 180 degrees rotation around Z-axis
     rotation_matrix = np.array([[-1, 0, 0], [0, -1, 0], [0, 0, 1]])
 
-    # Apply the rotation to each vertex
-    model_mesh.vectors = np.dot(model_mesh.vectors, rotation_matrix)
-
-    # Return the rotated mesh object
-    return model_mesh
+    # Return the rotated mesh object, the rotation is recorded in its transform
+    return model_mesh.transformed(rotation_matrix)
 
 
 def check_stl_file_type(stl_path):
     try:
-        with open(stl_path, 'rb') as file:
-            header = file.read(80)  # Read the 80-byte header
-            # Check if the header starts with 'solid ' indicating a potential ASCII file
-            # Some binary files may also start with 'solid '
-            if header.startswith(b'solid '):
-                # Perform a simple check to see if the rest of the file looks like ASCII
-                # This checks for the presence of 'facet normal' which is common in ASCII STLs
-                file.seek(0)  # Go back to the beginning of the file
-                contents = file.read(1024).lower()  # Read the first 1024 bytes
-                if b'facet normal' in contents:
-                    return 'ASCII'
-
-            # Proceed with binary file size check
-            triangles = int.from_bytes(file.read(4), byteorder='little')  # Read the number of triangles
-            expected_size = 84 + (50 * triangles)  # Calculate the expected size for a binary STL
-
-            file.seek(0, 2)  # Move to the end of the file
-            actual_size = file.tell()  # Get the actual size of the file
-
-            # Check if the actual size matches the expected size for a binary STL
-            if actual_size == expected_size:
-                return 'BINARY'
-            else:
-                # If the size doesn't match, it's safer to assume ASCII
-                # This could also indicate a malformed file
-                return 'ASCII'
+        return surf_mesh.stl_file_type(stl_path)
     except Exception as e:
         print(f"Error checking STL file type: {e}")
         # In case of an error, it might be safer to default to ASCII or handle the error explicitly
@@ -302,6 +285,8 @@ def gen_thread_worker(func, active_cores):
 
     main_window = QApplication.instance().main_window  # Get the main window
     input_widgets = main_window.findChildren((QLineEdit, QDoubleSpinBox, QSpinBox, QComboBox, QPushButton, QCheckBox))  # Find all input widgets
+    input_widgets = [widget for widget in input_widgets if widget.objectName() != 'cancel_button']  # Cancel stays usable
+    tool_runner.cancel_event.clear()  # A new run is not stopped by an earlier cancel
 
     for widget in input_widgets:
         widget.setEnabled(False)
@@ -316,6 +301,7 @@ def gen_thread_worker(func, active_cores):
             except Exception as e:
                 logging.error(f"Error in thread worker function: {e}")  # Log the error
             finally:
+                surf_mesh.clear_surface_cache()  # Release the STL memory maps held for the run
                 throbbing(main_window)  # Ensure the throbber stops
                 for widget in input_widgets:
                     widget.setEnabled(True)
@@ -24,9 +24,10 @@ ________________________________________________________________________________
 """
 
 import numpy as np
+from scipy.spatial.distance import cdist
 from stl import mesh
 import os
-from core_libs import gui_funcs, gui_vars
+from core_libs import gui_funcs, gui_vars, surf_mesh
 
 gui_ins = gui_vars.GuiVariables()
 
@@ -42,29 +43,161 @@ def reshape_1d_array(array):
     return array
 
 
-def bone_length(mesh_data):
-    vertices = mesh_data.vectors.reshape(-1, 3)
-
-    # Pick an arbitrary vertex as the starting point
-    start_vertex = vertices[0]
-
-    # Find the vertex farthest from the starting point
-    max_distance = 0
-    farthest_vertex = start_vertex
-    for vertex in vertices:
-        distance = np.linalg.norm(start_vertex - vertex)
-        if distance > max_distance:
-            max_distance = distance
-            farthest_vertex = vertex
-
-    # Find the vertex farthest from the farthest_vertex
-    max_distance = 0
-    for vertex in vertices:
-        distance = np.linalg.norm(farthest_vertex - vertex)
-        if distance > max_distance:
-            max_distance = distance
-
-    return max_distance
+def surface_points(mesh_data):
+    """
+    The points of a surface for searches of its extreme points, which find the same points when some are repeated.
+    These are the welded vertices of a surf_mesh.SurfaceMesh when they have already been found, otherwise the triangle
+    corners, so nothing is welded only for the landmarks.
+    """
+    if getattr(mesh_data, 'welded', False):
+        return mesh_data.vertices
+    return mesh_data.vectors.reshape(-1, 3)
+
+
+def surface_moments(vectors):
+    """
+    The area, first and second moments of each triangle, integrated over its surface, for a uniform surface density.
+    :param vectors:  The (n, 3, 3) triangle corners
+    :return: areas, centroids, second_moments:  The (n,) areas, (n, 3) centroids and (n, 3, 3) mean x x^T per triangle
+    """
+    corners = vectors.astype(np.float64)
+    areas = 0.5 * np.linalg.norm(np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0]), axis=1)
+    total = corners.sum(axis=1)
+    second_moments = (np.einsum('nki,nkj->nij', corners, corners) + total[:, :, None] * total[:, None, :]) / 12
+    return areas, total / 3, second_moments
+
+
+def shaft_axis(mesh_data, sample_size=None, seed=0, chunk_size=1000000):
+    """
+    Find the centroid and longest principal axis of the bone surface.
+    Every triangle counts by its area, with its exact second moment, so the axis does not lean towards densely
+    triangulated regions the way an average over STL corners does. The covariance is symmetric, so eigh is used.
+    For very large scans a uniform sample of triangles can be used instead, each weighted by its area, so only the
+    sampled triangles are read. The angular error of the sampled axis is then bounded by the Davis-Kahan theorem,
+    sin(error) <= 2 |E| / (l1 - l2), with the covariance error E taken as three standard errors of the area weighted
+    second moments.
+    :param mesh_data:  The bone surface, a surf_mesh.SurfaceMesh or numpy-stl mesh
+    :param sample_size:  Number of triangles sampled, None or 0 uses every triangle
+    :param seed:  Seed of the sample, so a scan always gives the same axis
+    :param chunk_size:  Triangles processed at once, bounds the memory used
+    :return: centroid, axis, error_bound:  The surface centroid, the unit shaft axis and the error bound in degrees
+    """
+    vectors = mesh_data.vectors
+    n_faces = vectors.shape[0]
+    if sample_size and sample_size < n_faces:
+        rng = np.random.default_rng(seed)
+        sample = np.sort(rng.integers(0, n_faces, size=sample_size))  # Sorted so the mapped file is read in order
+        areas, centroids, second_moments = surface_moments(vectors[sample])
+        # Each sampled triangle stands for the surface in proportion to its area, a ratio estimate of the moments
+        weights = areas / areas.mean()
+        centroid = weights @ centroids / sample_size
+        second_moment = np.einsum('n,nij->ij', weights, second_moments) / sample_size
+        covariance = second_moment - np.outer(centroid, centroid)
+        residuals = weights[:, None, None] * (second_moments - second_moment)
+        error = 3 * np.linalg.norm(residuals.std(axis=0) / np.sqrt(sample_size))
+    else:
+        area, first_moment, second_moment = 0.0, np.zeros(3), np.zeros((3, 3))
+        for first in range(0, n_faces, chunk_size):
+            areas, centroids, second_moments = surface_moments(vectors[first:first + chunk_size])
+            area += areas.sum()
+            first_moment += areas @ centroids
+            second_moment += np.einsum('n,nij->ij', areas, second_moments)
+        centroid = first_moment / area
+        covariance = second_moment / area - np.outer(centroid, centroid)
+        error = 0.0
+
+    eigenvalues, eigenvectors = np.linalg.eigh(covariance)  # Ascending order
+    gap = eigenvalues[2] - eigenvalues[1]
+    error_bound = np.degrees(np.arcsin(min(1.0, 2 * error / gap))) if gap > 0 else 90.0
+    return centroid, eigenvectors[:, 2], float(error_bound)
+
+
+def bone_length(mesh_data, cells=64):
+    """
+    Find the length of the bone as the diameter of its surface, the largest distance between two of its vertices.
+    The diameter is at least the longest side of the bounding box, so vertices nearer than that to every corner of the
+    box are ruled out first. Sweeps, each to the vertex farthest from the last, give a pair of vertices and a lower
+    bound on the diameter. Two vertices inside the ball spanned by that pair are no further apart than its diameter,
+    so one end of any longer pair lies outside the ball, and sweeps are repeated from the vertex furthest outside while
+    they find longer pairs. The other end must lie further than the length from a corner of the bounding box. The
+    vertices left at both ends are binned into cubic cells, and pairs of cells are compared in order of the largest
+    distance their boxes allow, raising the length as longer pairs are found, until no pair left can beat it, so the
+    result is exact.
+    :param mesh_data:  The bone surface, a surf_mesh.SurfaceMesh or numpy-stl mesh
+    :param cells:  The number of cells along the longest side of the bounding box
+    :return: length, start_point, end_point:  The diameter and the two vertices it runs between
+    """
+    vertices = surface_points(mesh_data).astype(np.float64)
+
+    def squared_distances(offsets):
+        # Squared row lengths, much faster than norm over millions of rows
+        return np.einsum('ij,ij->i', offsets, offsets)
+
+    # Only vertices at least the longest side of the bounding box from one of its corners can end the diameter, the
+    # few left are made unique as triangle corners repeat each vertex
+    lower, upper = vertices.min(axis=0), vertices.max(axis=0)
+    vertices = vertices[squared_distances(np.maximum(vertices - lower, upper - vertices)) >= (upper - lower).max() ** 2]
+    vertices = vertices[np.lexsort(vertices.T)]  # Sorting by columns is far faster than np.unique over rows
+    vertices = vertices[np.r_[True, np.any(vertices[1:] != vertices[:-1], axis=1)]]
+
+    def sweep(start, length, end):
+        # Move to the farthest vertex until the distance stops growing
+        while True:
+            distances = squared_distances(vertices - vertices[start])
+            farthest = np.argmax(distances)
+            if distances[farthest] <= length ** 2:
+                return length, start, end
+            length, start, end = np.sqrt(distances[farthest]), farthest, start
+
+    length, start, end = sweep(np.argmax(squared_distances(vertices - vertices.mean(axis=0))), 0.0, 0)
+    while True:
+        outside = squared_distances(vertices - (vertices[start] + vertices[end]) / 2) - (length / 2) ** 2
+        furthest = np.argmax(outside)
+        if outside[furthest] <= 0:
+            break
+        longer = sweep(furthest, length, end)
+        if longer[0] <= length:
+            break
+        length, start, end = longer
+    outside = np.flatnonzero(outside > 0)
+
+    # Either end must be further than the length from the farthest corner of the bounding box
+    lower, upper = vertices.min(axis=0), vertices.max(axis=0)
+    reach = np.flatnonzero(squared_distances(np.maximum(vertices - lower, upper - vertices)) > length ** 2)
+    outside = np.intersect1d(outside, reach, assume_unique=True)
+    if outside.shape[0] == 0:
+        return float(length), vertices[start], vertices[end]
+
+    # Bin both ends into cubic cells, each with the bounding box of its own vertices
+    size = max((upper - lower).max() / cells, np.finfo(float).tiny)
+
+    def bin_cells(ids):
+        keys = np.floor((vertices[ids] - lower) / size).astype(np.int64) @ np.array([(cells + 1) ** 2, cells + 1, 1])
+        order = np.argsort(keys, kind='stable')
+        ids = ids[order]
+        firsts = np.flatnonzero(np.r_[True, np.diff(keys[order]) != 0])
+        lasts = np.r_[firsts[1:], ids.shape[0]]
+        return ids, firsts, lasts, np.minimum.reduceat(vertices[ids], firsts), np.maximum.reduceat(vertices[ids], firsts)
+
+    ids_a, firsts_a, lasts_a, lower_a, upper_a = bin_cells(outside)
+    ids_b, firsts_b, lasts_b, lower_b, upper_b = bin_cells(reach)
+
+    # Compare pairs of cells, longest possible distance first, until none can beat the length found
+    for cell in range(firsts_a.shape[0]):
+        bounds = np.linalg.norm(np.maximum(upper_a[cell] - lower_b, upper_b - lower_a[cell]), axis=1)
+        pairs = np.flatnonzero(bounds > length)
+        pairs = pairs[np.argsort(-bounds[pairs], kind='stable')]
+        rows = ids_a[firsts_a[cell]:lasts_a[cell]]
+        for pair in pairs:
+            if bounds[pair] <= length:
+                break
+            columns = ids_b[firsts_b[pair]:lasts_b[pair]]
+            distances = cdist(vertices[rows], vertices[columns])
+            row, column = np.unravel_index(np.argmax(distances), distances.shape)
+            if distances[row, column] > length:
+                length, start, end = distances[row, column], rows[row], columns[column]
+
+    return float(length), vertices[start], vertices[end]
 
 
 def extend_points_along_central_axis(distal, proximal, percentage, mesh_data):
@@ -75,7 +208,7 @@ def extend_points_along_central_axis(distal, proximal, percentage, mesh_data):
 
     # Calculate the length of the bone
     try:
-        bone_l = bone_length(mesh_data)
+        bone_l, _, _ = bone_length(mesh_data)
     except Exception as e:
         print(f"Error calculating bone length: {e}")
 
@@ -124,24 +257,23 @@ def estimate_femoral_head_location(proximal, distal, center_of_mass, percentage)
     return femoral_head_location
 
 
-def find_long_shaft_axis(vari, mesh_data):
-    # Calculate the middle of the long shaft
-    vertices = mesh_data.points
-    center_of_mass = np.mean(vertices, axis=0)
-
-    # Calculate the covariance matrix of the model
-    covariance_matrix = np.cov(vertices, rowvar=False)
-
-    # Calculate the principal axes of the model
-    eigenvalues, eigenvectors = np.linalg.eig(covariance_matrix)
-
-    # The longest principal axis is the shaft axis
-    shaft_axis = eigenvectors[:, np.argmax(eigenvalues)]
+def shaft_landmarks(mesh_data, sample_size=None):
+    """
+    Find the distal, proximal and mid-shaft landmarks of a long bone in the frame of its STL file.
+    :param mesh_data:  The bone surface, a surf_mesh.SurfaceMesh or numpy-stl mesh
+    :param sample_size:  Number of triangles sampled to find the shaft axis, see shaft_axis
+    :return: distal_point, proximal_point, middle_point
+    """
+    # The middle of the long shaft is the centroid of the surface, and the shaft axis its longest principal axis
+    center_of_mass, axis, error_bound = shaft_axis(mesh_data, sample_size)
+    if sample_size:
+        print(f"Shaft axis found from {sample_size} sampled triangles, within {error_bound:.3f} degrees")
 
     # The proximal and distal coordinates are the points on the model that are furthest along the shaft axis
-    projections = np.dot(vertices - center_of_mass, shaft_axis)
-    proximal_point = vertices[np.argmin(projections)]
-    distal_point = vertices[np.argmax(projections)]
+    points = surface_points(mesh_data)
+    projections = np.dot(points, axis.astype(points.dtype))  # The centroid only shifts every projection by the same amount
+    proximal_point = points[np.argmin(projections)].astype(np.float64)
+    distal_point = points[np.argmax(projections)].astype(np.float64)
     middle_point = center_of_mass
 
     # Estimate the location of the femoral head
@@ -156,8 +288,14 @@ def find_long_shaft_axis(vari, mesh_data):
     except Exception as e:
         print(f"Error estimating extended locations: {e}")
 
+    return distal_point, proximal_point, middle_point
+
+
+def find_long_shaft_axis(vari, mesh_data, bm_rot=None):
+    distal_point, proximal_point, middle_point = shaft_landmarks(mesh_data, vari.axis_sample_size)
+
     # Get the x, y, and z coordinates of the distal, proximal, and middle points
-    match gui_ins.bm_rot:
+    match gui_ins.bm_rot if bm_rot is None else bm_rot:
         case True:
             vari.distal = - distal_point[0], - distal_point[1], distal_point[2]
             vari.proximal = - proximal_point[0], - proximal_point[1], proximal_point[2]
@@ -199,8 +337,8 @@ def read_landmark_file(file_path, vari):
 
 
 def find_landmarks(vari):
-    # Load STL file
-    femur_mesh = gui_funcs.load_stl(gui_ins.stl_path)
+    # Load STL file, shared with the mesher and STL checks when it has already been parsed
+    femur_mesh = surf_mesh.load_surface_mesh(gui_ins.stl_path, gui_ins.save_path)
 
     # Find the middle of the long shaft and align it with the x-axis
     femur_mesh = find_long_shaft_axis(vari, femur_mesh)
@@ -208,6 +346,11 @@ def find_landmarks(vari):
     print("Middle point:", vari.middle)
     print("Distal point:", vari.distal)
     print("Proximal point:", vari.proximal)
-    np.savetxt(f"{vari.output_dir}/RMShaft.txt", vari.middle, delimiter=",", fmt='%.10f')
-    np.savetxt(f"{vari.output_dir}/RDOss.txt", vari.distal, delimiter=",", fmt='%.10f')
-    np.savetxt(f"{vari.output_dir}/RPOss.txt", vari.proximal, delimiter=",", fmt='%.10f')
+    write_landmark_files(vari, vari.output_dir)
+
+
+def write_landmark_files(vari, landmarks_dir):
+    # Save the landmarks in the files read back by read_landmark_file
+    np.savetxt(f"{landmarks_dir}/RMShaft.txt", vari.middle, delimiter=",", fmt='%.10f')
+    np.savetxt(f"{landmarks_dir}/RDOss.txt", vari.distal, delimiter=",", fmt='%.10f')
+    np.savetxt(f"{landmarks_dir}/RPOss.txt", vari.proximal, delimiter=",", fmt='%.10f')
@@ -29,6 +29,8 @@ class BMatVariables:
             self.cdb_path = ""  # Path to your cdb file
             self.vtk_path = ""  # Path to your vtk file
             self.config_path = ""  # Path to your config file
+            self.time_limit = 0.0  # Minutes BonematCLI may take before it is stopped, 0 for no limit
+            self.memory_limit = 0.0  # GB of memory BonematCLI may use before it is stopped, 0 for no limit
         else:
             # Initialize the instance variables with the values of initial_vars
             self.__dict__ = initial_vars.__dict__.copy()
@@ -0,0 +1,180 @@
+"""
+================================================================================================================
+Cross-Section Library for slicing a bone surface along its shaft axis and finding the section properties.
+================================================================================================================
+    Created by G.H. Allison, University of Sheffield, Sheffield, United Kingdom.
+    Copyright (C) 2024 George H. Allison
+    Contact: ghallison1@sheffield.ac.uk or xinshan.li@sheffield.ac.uk
+----------------------------------------------------------------------------------------------------------------
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+________________________________________________________________________________________________________________
+"""
+
+import numpy as np
+
+
+def section_basis(axis):
+    """
+    Two unit vectors u, v spanning the planes normal to the axis, with u x v = axis.
+    Section centroids and second moments of area are given in this frame.
+    """
+    axis = np.asarray(axis, dtype=np.float64)
+    axis = axis / np.linalg.norm(axis)
+    helper = np.eye(3)[np.argmin(np.abs(axis))]  # The coordinate direction furthest from the axis
+    u = np.cross(helper, axis)
+    u /= np.linalg.norm(u)
+    return u, np.cross(axis, u)
+
+
+def section_segments(corners, origin, axis, positions, chunk_size=1000000):
+    """
+    Cut every triangle with every plane it crosses, in one batch per chunk of triangles.
+    A triangle crosses the planes between the lowest and highest of its corners along the axis, found by a sorted
+    search, so only the crossing (triangle, plane) pairs are built. Corners exactly on a plane count as above it,
+    which keeps the segments of neighbouring triangles joined end to end.
+    Each segment is directed along axis x face normal, which runs anti-clockwise about the material when seen from
+    the +axis side, so the sections of an outward-facing closed surface have positive area and any canal is subtracted.
+    :param corners:  The (n, 3, 3) triangle corners
+    :param origin:  A point on the axis, the planes are at origin + position * axis
+    :param positions:  The sorted plane positions along the axis
+    :return: Yields plane, starts, ends:  The plane index of each segment and its ends in (u, v) section coordinates
+    """
+    axis = np.asarray(axis, dtype=np.float64)
+    axis = axis / np.linalg.norm(axis)
+    u, v = section_basis(axis)
+    frame = np.column_stack((u, v, axis))
+
+    for first in range(0, corners.shape[0], chunk_size):
+        local = (corners[first:first + chunk_size].astype(np.float64) - origin) @ frame  # (u, v, along the axis)
+        heights = local[:, :, 2]
+        lowest = np.searchsorted(positions, heights.min(axis=1), side='right')
+        highest = np.searchsorted(positions, heights.max(axis=1), side='right')
+        counts = highest - lowest
+        face = np.repeat(np.arange(local.shape[0]), counts)
+        if face.shape[0] == 0:
+            continue
+        plane = np.arange(face.shape[0]) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(lowest, counts)
+
+        tri = local[face]
+        above = heights[face] >= positions[plane][:, None]
+        # Exactly two edges cross the plane, the third is found as the one whose ends are on the same side
+        crossing = above != np.roll(above, -1, axis=1)
+        same = np.argmin(crossing, axis=1)
+        ends = []
+        for offset in (1, 2):
+            edge = (same + offset) % 3
+            a = tri[np.arange(tri.shape[0]), edge]
+            b = tri[np.arange(tri.shape[0]), (edge + 1) % 3]
+            t = (positions[plane] - a[:, 2]) / (b[:, 2] - a[:, 2])
+            ends.append(a[:, :2] + t[:, None] * (b[:, :2] - a[:, :2]))
+        start, end = ends
+
+        # The in-plane direction of axis x normal is the in-plane normal rotated a quarter turn anti-clockwise
+        normal = np.cross(tri[:, 1] - tri[:, 0], tri[:, 2] - tri[:, 0])
+        forward = (end - start) @ np.array([[0.0, -1.0], [1.0, 0.0]]) * normal[:, :2]
+        swap = forward.sum(axis=1) < 0
+        start[swap], end[swap] = end[swap], start[swap].copy()
+        yield plane, start, end
+
+
+def section_properties(corners, origin, axis, positions, chunk_size=1000000):
+    """
+    Slice a closed surface at planes normal to the axis and find the properties of each cross-section.
+    The section is never assembled into loops; Green's theorem turns the area integrals into sums over the directed
+    cut segments, which are accumulated per plane. Moments of area are about the section centroid, in the (u, v)
+    frame of section_basis.
+    :param corners:  The (n, 3, 3) triangle corners, e.g. SurfaceMesh.vectors or the outer faces of a tetra mesh
+    :param origin:  A point on the axis
+    :param axis:  The slicing direction, normally the shaft axis
+    :param positions:  The plane positions along the axis, measured from the origin
+    :return: centroids, areas, second_moments, perimeters:  The (N, 3) centroids, (N,) areas, (N, 3) second moments
+        of area (Iuu, Ivv, Iuv) and (N,) perimeters. Planes missing the surface have zero area and nan centroid.
+    """
+    origin = np.asarray(origin, dtype=np.float64)
+    axis = np.asarray(axis, dtype=np.float64)
+    axis = axis / np.linalg.norm(axis)
+    positions = np.asarray(positions, dtype=np.float64)
+    order = np.argsort(positions)
+    sorted_positions = positions[order]
+
+    n_planes = positions.shape[0]
+    sums = np.zeros((7, n_planes))  # Area, first moments and second moments, times 2, 6, 6, 12, 12, 24; perimeter
+    for plane, start, end in section_segments(corners, origin, axis, sorted_positions, chunk_size):
+        (x1, y1), (x2, y2) = start.T, end.T
+        cross = x1 * y2 - x2 * y1
+        terms = (
+            cross,
+            (x1 + x2) * cross,
+            (y1 + y2) * cross,
+            (y1 * y1 + y1 * y2 + y2 * y2) * cross,
+            (x1 * x1 + x1 * x2 + x2 * x2) * cross,
+            (x1 * y2 + 2 * x1 * y1 + 2 * x2 * y2 + x2 * y1) * cross,
+            np.hypot(x2 - x1, y2 - y1),
+        )
+        for row, term in enumerate(terms):
+            sums[row] += np.bincount(plane, weights=term, minlength=n_planes)
+
+    areas = sums[0] / 2
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cu, cv = sums[1] / (6 * areas), sums[2] / (6 * areas)
+    # Moments about the plane origin, moved to the centroid with the parallel axis theorem
+    second_moments = np.column_stack((
+        sums[3] / 12 - areas * cv * cv,
+        sums[4] / 12 - areas * cu * cu,
+        sums[5] / 24 - areas * cu * cv,
+    ))
+    second_moments[areas == 0] = 0
+    u, v = section_basis(axis)
+    centroids = origin + np.outer(cu, u) + np.outer(cv, v) + np.outer(sorted_positions, axis)
+
+    inverse = np.argsort(order)  # Back to the order the planes were given in
+    return centroids[inverse], areas[inverse], second_moments[inverse], sums[6][inverse]
+
+
+def shaft_sections(mesh_data, middle, distal, n_slices=50, pc=1.0):
+    """
+    Slice a bone at evenly spaced planes along the axis through the mid-shaft and distal landmarks.
+    :param mesh_data:  The bone surface, a surf_mesh.SurfaceMesh or numpy-stl mesh
+    :param n_slices:  Number of planes
+    :param pc:  The proportion of the bone length covered, centred on the mid-shaft landmark
+    :return: positions, centroids, areas, second_moments, perimeters:  See section_properties
+    """
+    middle, distal = np.asarray(middle, dtype=np.float64), np.asarray(distal, dtype=np.float64)
+    axis = (distal - middle) / np.linalg.norm(distal - middle)
+    heights = (mesh_data.vectors.reshape(-1, 3) - middle) @ axis
+    half_length = (heights.max() - heights.min()) * pc / 2
+    positions = np.linspace(-half_length, half_length, n_slices + 2)[1:-1]  # Not the tips, where sections vanish
+    return (positions, *section_properties(mesh_data.vectors, middle, axis, positions))
+
+
+def mid_ends(mesh_data, middle, distal, pc, length=""):
+    """
+    Find the centres of the proximal and distal ends of the FEM segment without MAPDL.
+    These are the section centroids at -/+ length * pc / 2 from the mid-shaft landmark along the axis towards the
+    distal landmark, the bounds used by local_func in the FEM scripts, and their mid-point is the new origin.
+    :param length:  The bone length, as in FemVariables.l, or "" to measure it along the axis
+    :return: proximal_end, distal_end, mid_point
+    """
+    middle, distal = np.asarray(middle, dtype=np.float64), np.asarray(distal, dtype=np.float64)
+    axis = (distal - middle) / np.linalg.norm(distal - middle)
+    if length == "":
+        heights = (mesh_data.vectors.reshape(-1, 3) - middle) @ axis
+        length = heights.max() - heights.min()
+    half_length = float(length) * pc / 2
+    centroids, areas, _, _ = section_properties(mesh_data.vectors, middle, axis, [-half_length, half_length])
+    if np.any(areas <= 0):
+        raise ValueError("The FEM segment reaches beyond the bone, no cross-section found at one of its ends")
+    return centroids[0], centroids[1], centroids.mean(axis=0)
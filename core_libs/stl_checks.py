@@ -23,66 +23,180 @@ STL Check Module for checking the integrity of STL files prior to meshing.
 ________________________________________________________________________________________________________________
 """
 
+import time
 import numpy as np
-from stl import mesh
-from collections import defaultdict
-from core_libs import gui_funcs
+from scipy import sparse
+from scipy.sparse import csgraph
+from core_libs import gui_funcs, stl_repair, surf_mesh
 
+body_dt = np.dtype([('Body', int), ('Triangles', int), ('Min', float, (3,)), ('Max', float, (3,))])
 
-class STLChecks:
-    def __init__(self, stl_path):
+
+class CheckResult:
+    """
+    The outcome of a single STL check.
+    :param name:  The name of the check
+    :param severity:  'ERROR' for issues that stop the meshing, 'WARNING' for issues that may affect it
+    :param passed:  True when no issue was found
+    :param count:  The number of offending items (edges, faces, bodies...)
+    :param ids:  Array of the offending edge, face or body ids, None when the check has none
+    :param value:  Any further output of the check, such as the signed volume or the body bounds
+    :param message:  The line(s) printed for the issue when the check fails
+    :param elapsed:  Wall-clock time of the check in seconds
+    """
+
+    def __init__(self, name, severity, passed, count=0, ids=None, value=None, message="", elapsed=0.0):
+        self.name = name
+        self.severity = severity
+        self.passed = passed
+        self.count = count
+        self.ids = ids
+        self.value = value
+        self.message = message
+        self.elapsed = elapsed
+
+    def __repr__(self):
+        return f"CheckResult({self.name!r}, {self.severity}, passed={self.passed}, count={self.count}, elapsed={self.elapsed:.3f}s)"
+
+
+class STLCheckReport:
+    """
+    The results of all the STL checks run on a file, in the order they were run.
+    """
+
+    def __init__(self, stl_path, fail_fast=False):
         self.stl_path = stl_path
-        self.stl_mesh = gui_funcs.load_stl(self.stl_path)
-        self.checks()
+        self.fail_fast = fail_fast
+        self.results = {}  # Check name -> CheckResult
+        self.timings = {}  # Shared preparation steps -> wall-clock time in seconds
+        self.stopped_early = False  # True when fail-fast mode stopped at a hard error
+        self.skipped = []  # Checks left out because an earlier error already failed the file
+
+    def add(self, result):
+        self.results[result.name] = result
+
+    @property
+    def errors(self):
+        return [result for result in self.results.values() if result.severity == 'ERROR' and not result.passed]
+
+    @property
+    def warnings(self):
+        return [result for result in self.results.values() if result.severity == 'WARNING' and not result.passed]
+
+    @property
+    def failed(self):
+        # Any hard error means ICEM is likely to fail on this file
+        return bool(self.errors)
+
+    @property
+    def total_time(self):
+        return sum(self.timings.values()) + sum(result.elapsed for result in self.results.values())
+
+    def as_dict(self):
+        """
+        Flatten the report into plain values, one entry per check, for CSV or JSON summaries.
+        """
+        summary = {'stl_path': self.stl_path, 'failed': self.failed, 'stopped_early': self.stopped_early,
+                   'total_time': round(self.total_time, 4)}
+        for step, elapsed in self.timings.items():
+            summary[f"{step} time"] = round(elapsed, 4)
+        for result in self.results.values():
+            summary[f"{result.name} passed"] = result.passed
+            summary[f"{result.name} count"] = result.count
+            summary[f"{result.name} time"] = round(result.elapsed, 4)
+        return summary
+
+    def print_summary(self):
+        if self.errors:
+            print("\n-------------------ERROR-------------------")
+            for result in self.errors:
+                print(result.message)
+            if self.stopped_early:
+                print("Fail-fast mode stopped the checks at the first error, later checks were not run.")
+            elif self.skipped:
+                print(f"Not run as the file has already failed: {', '.join(self.skipped)}.")
+            print(
+                "These will likely cause issues with the meshing process, please fix the issues above before proceeding.\n"
+                "It is recommended to check your STL file for errors using a 3D viewer such as Slicer or ParaView.\n"
+                "---------------------------------------------\n"
+            )
+
+        if self.warnings:
+            print("\n-------------------WARNING-------------------")
+            for result in self.warnings:
+                print(result.message)
+            print(
+                "These issues may affect the meshing process.\n"
+                "It is recommended to check your STL file for errors using a 3D viewer such as Slicer or ParaView.\n"
+                "---------------------------------------------\n"
+            )
+
+        slowest = max(self.results.values(), key=lambda result: result.elapsed, default=None)
+        if slowest is not None:
+            print(f"STL checks completed in {self.total_time:.2f} s (slowest: {slowest.name}, {slowest.elapsed:.2f} s)")
+
+
+class STLChecks:
+    def __init__(self, stl_path, weld_tol=None, fail_fast=False, run_checks=True, self_intersections=True):
+        # Accepts a path or an already parsed surf_mesh.SurfaceMesh so the file is only read once per run
+        if isinstance(stl_path, surf_mesh.SurfaceMesh):
+            self.stl_mesh = stl_path
+            self.stl_path = stl_path.stl_path
+        else:
+            self.stl_path = stl_path
+            self.stl_mesh = surf_mesh.load_surface_mesh(self.stl_path)
+        if weld_tol is not None:
+            self.stl_mesh.set_weld_tol(weld_tol)  # Corners closer than this are treated as one vertex
+        self.fail_fast = fail_fast  # Stop at the first hard error rather than running every check
+        self.self_intersections = self_intersections  # The costly self-intersection search can be left out
+        self.report = self.checks() if run_checks else None  # Without run_checks the checks can be called one by one
+
+    def build_edge_table(self):
+        """
+        Build the shared edge table used by the topology checks.
+        The triangle soup is welded into integer vertex ids within the weld tolerance, every face contributes its three edges as sorted id
+        pairs, and np.unique counts how many faces share each edge.
+        """
+        self.vertices, self.faces = self.stl_mesh.vertices, self.stl_mesh.faces
+        self.edges, self.edge_counts = surf_mesh.count_edges(self.faces)
 
     def check_non_manifold_edges(self):
         # This function checks for edges shared by more than two faces, indicating non-manifold edges.
-        edges = {}  # Dictionary to store edges and their counts
-        for face in self.stl_mesh.vectors:
-            for i in range(3):
-                edge = tuple(sorted([tuple(face[i]), tuple(
-                    face[(i + 1) % 3])]))  # Sort the vertices to get a consistent edge representation
-                if edge in edges:
-                    edges[edge] += 1  # Increment the count if the edge is already in the dictionary
-                else:
-                    edges[edge] = 1  # Add the edge to the dictionary if it's not already present
-        non_manifold_edges = {edge: count for edge, count in edges.items() if
-                              count > 2}  # Filter edges with more than two faces
+        mask = self.edge_counts > 2  # Filter edges with more than two faces
+        non_manifold_edges = {tuple(edge): int(count) for edge, count in zip(self.edges[mask].tolist(), self.edge_counts[mask])}
         return non_manifold_edges
 
     def check_multiple_bodies(self):
         """
         Check for multiple bodies in the STL file by identifying unconnected components.
+        The welded edges form a sparse CSR adjacency matrix, and scipy labels its connected components.
+        :return: bodies, body_info:  The number of bodies and a structured array holding the triangle count and
+                                     bounding box of each body, largest body first
         """
-        vertices = self.stl_mesh.vectors.reshape(-1, 3)
-        vertex_indices = {tuple(vertex): idx for idx, vertex in enumerate(vertices)}
-        adjacency_list = defaultdict(list)
-
-        # Build the adjacency list
-        for face in self.stl_mesh.vectors:
-            for i in range(3):
-                v1 = tuple(face[i])
-                v2 = tuple(face[(i + 1) % 3])
-                adjacency_list[vertex_indices[v1]].append(vertex_indices[v2])
-                adjacency_list[vertex_indices[v2]].append(vertex_indices[v1])
-
-        visited = set()
-
-        def dfs(v):
-            stack = [v]
-            while stack:
-                current = stack.pop()
-                if current not in visited:
-                    visited.add(current)
-                    stack.extend(adjacency_list[current])
-
-        bodies = 0
-        for vertex in vertex_indices.values():
-            if vertex not in visited:
-                dfs(vertex)
-                bodies += 1
-
-        return bodies
+        n_vertices = self.vertices.shape[0]
+        adjacency = sparse.csr_matrix(
+            (np.ones(self.edges.shape[0], dtype=np.int8), (self.edges[:, 0], self.edges[:, 1])),
+            shape=(n_vertices, n_vertices)
+        )
+        bodies, vertex_labels = csgraph.connected_components(adjacency, directed=False)
+
+        # Every vertex of a face shares its label, so the first vertex labels the face
+        self.face_bodies = vertex_labels[self.faces[:, 0]]
+        triangles = np.bincount(self.face_bodies, minlength=bodies)
+
+        # Per-body bounding boxes from the vertex labels
+        min_coords = np.full((bodies, 3), np.inf)
+        max_coords = np.full((bodies, 3), -np.inf)
+        np.minimum.at(min_coords, vertex_labels, self.vertices)
+        np.maximum.at(max_coords, vertex_labels, self.vertices)
+
+        body_info = np.empty(bodies, dtype=body_dt)
+        body_info['Body'] = np.arange(bodies)
+        body_info['Triangles'] = triangles
+        body_info['Min'] = min_coords
+        body_info['Max'] = max_coords
+        body_info = body_info[np.argsort(-triangles, kind='stable')]
+        return bodies, body_info
 
     def check_non_uniform_scaling(self):
         """
@@ -98,92 +212,178 @@ class STLChecks:
         # Check for non-uniform scaling
         return not np.allclose(dimensions / dimensions[0], 1)
 
+    def build_face_geometry(self):
+        """
+        Compute the cross product, area and centroid of every face in one batched pass.
+        The face checks below are all derived from these arrays.
+        """
+        vectors = self.stl_mesh.vectors.astype(np.float64)
+        self.face_cross = gui_funcs.crossing(vectors[:, 1] - vectors[:, 0], vectors[:, 2] - vectors[:, 0])
+        self.face_areas = 0.5 * np.linalg.norm(self.face_cross, axis=1)
+        self.face_centroids = vectors.mean(axis=1)
+
     def check_degenerate_faces(self):
         """
-        Check for degenerate faces (faces with zero area).
+        Check for degenerate faces (faces with zero area, or with two corners welded into the same vertex).
         """
-        degenerate_faces = []
-        for i, face in enumerate(self.stl_mesh.vectors):
-            if np.linalg.norm(gui_funcs.crossing(face[1] - face[0], face[2] - face[0])) == 0:
-                degenerate_faces.append(i)
+        collapsed = (self.faces[:, 0] == self.faces[:, 1]) | (self.faces[:, 1] == self.faces[:, 2]) | (self.faces[:, 2] == self.faces[:, 0])
+        degenerate_faces = np.flatnonzero((self.face_areas == 0) | collapsed).tolist()
         return degenerate_faces
 
+    def check_signed_volume(self):
+        """
+        Calculate the signed volume enclosed by the surface.
+        Each face contributes the tetrahedron it spans with the origin, centroid . cross / 6, so a closed surface
+        whose faces wind outward has a positive volume regardless of how curved the bone is.
+        """
+        return float(np.einsum('ij,ij->', self.face_centroids, self.face_cross) / 6.0)
+
     def check_normals_orientation(self):
         """
-        This function checks if normals are consistently oriented.
-        A simple heuristic is used here: normals should generally point outward.
-        """
-        center = self.stl_mesh.points.mean(axis=0)[0:3]  # Calculate the center of the mesh
-        outward_normals = True
-        for normal, vector in zip(self.stl_mesh.normals, self.stl_mesh.vectors):
-            face_center = vector.mean(axis=0)  # Calculate the center of the face
-            direction_to_center = center - face_center  # Calculate the direction to the center of the mesh
-            if np.dot(normal, direction_to_center) > 0:  # Check if the normal points outward
-                outward_normals = False
-                break
+        This function checks if the faces wind outward, from the sign of the enclosed volume alone.
+        The normals stored in the file are not used, ICEM takes the orientation from the winding.
+        """
+        outward_normals = bool(self.check_signed_volume() > 0)
         return outward_normals
 
+    def check_stored_normals(self):
+        """
+        Find the faces whose stored normal opposes their winding, i.e. the normal written in the file points the
+        other way to the cross product of the face edges. Faces stored with a zero normal are not counted.
+        """
+        stored_normals = self.stl_mesh.normals.astype(np.float64)
+        mismatched = np.flatnonzero(np.einsum('ij,ij->i', stored_normals, self.face_cross) < 0)
+        return mismatched
+
+    def check_winding(self):
+        """
+        Check that neighbouring faces wind consistently: the two faces sharing a manifold edge must traverse it in
+        opposite directions, the same test stl_repair.orient_faces uses. A few flipped faces leave the signed volume
+        positive, so this catches the mixed winding that check_normals_orientation cannot.
+        :return: edges:  The (k, 2) manifold edges both of whose faces traverse them the same way
+        """
+        starts, ends, keys = stl_repair.half_edges(self.faces)
+        n_vertices = int(self.faces.max()) + 1 if self.faces.size else 1
+        directed, counts = np.unique(starts * n_vertices + ends, return_counts=True)
+        repeated = directed[counts == 2]  # Two faces run along this edge the same way
+        repeated_starts, repeated_ends = repeated // n_vertices, repeated % n_vertices
+        undirected = np.minimum(repeated_starts, repeated_ends) * n_vertices + np.maximum(repeated_starts, repeated_ends)
+        edge_keys = self.edges[:, 0] * n_vertices + self.edges[:, 1]  # Sorted, as count_edges builds them with np.unique
+        manifold = self.edge_counts[np.searchsorted(edge_keys, undirected)] == 2  # Non-manifold edges are reported already
+        return np.column_stack((undirected[manifold] // n_vertices, undirected[manifold] % n_vertices))
+
     def check_for_holes(self):
         # This function checks for holes by ensuring each edge is shared by exactly two faces.
-        edges = {}
-        for face in self.stl_mesh.vectors:
-            for i in range(3):
-                edge = tuple(sorted([tuple(face[i]), tuple(
-                    face[(i + 1) % 3])]))  # Sort the vertices to get a consistent edge representation
-                edges[edge] = edges.get(edge, 0) + 1  # Increment the count for the edge
-        holes = [edge for edge, count in edges.items() if count == 1]  # Filter edges shared by only one face
+        holes = [tuple(edge) for edge in self.edges[self.edge_counts == 1].tolist()]  # Filter edges shared by only one face
         return holes
 
     def check_duplicate_vertices_faces(self):
-        # This function checks for duplicate vertices and faces.
-        unique_vertices = np.unique(self.stl_mesh.vectors.reshape(-1, self.stl_mesh.vectors.shape[-1]),
-                                    axis=0)  # Reshape the vertices and find unique rows
-        duplicate_vertices = self.stl_mesh.vectors.shape[0] * 3 - unique_vertices.shape[
-            0]  # Calculate the number of duplicate vertices
-        unique_faces = np.unique(self.stl_mesh.vectors, axis=0)  # Find unique faces
-        duplicate_faces = self.stl_mesh.vectors.shape[0] - unique_faces.shape[0]  # Calculate the number of duplicate faces
+        # This function checks for duplicate vertices and faces using the welded vertex ids.
+        duplicate_vertices = self.faces.shape[0] * 3 - self.vertices.shape[0]  # Corners that share a welded vertex
+        unique_faces = np.unique(np.sort(self.faces, axis=1), axis=0)  # Faces over the same three vertices, in any order
+        duplicate_faces = self.faces.shape[0] - unique_faces.shape[0]  # Calculate the number of duplicate faces
         return duplicate_vertices, duplicate_faces
 
+    def check_self_intersections(self):
+        """
+        Check for faces that pass through each other, a common cause of failed tetra meshing.
+        Only nearby faces are tested, see surf_mesh.find_self_intersections.
+        :return: pairs:  The (k, 2) ids of the intersecting faces, matching the face order of the STL file
+        """
+        pairs = surf_mesh.find_self_intersections(self.vertices, self.faces)
+        self.self_intersecting_faces = np.unique(pairs)  # Face ids for a later repair step
+        return pairs
+
+    def run_check(self, report, name, severity, check, summarise):
+        """
+        Run one check, time it and add its result to the report.
+        :param summarise:  Function turning the output of the check into (passed, count, ids, value, message)
+        :return: result:  The CheckResult that was added
+        """
+        start = time.perf_counter()
+        output = check()
+        elapsed = time.perf_counter() - start
+        passed, count, ids, value, message = summarise(output)
+        result = CheckResult(name, severity, bool(passed), int(count), ids, value, message, elapsed)
+        report.add(result)
+        return result
+
     def checks(self):
-        # Load the STL file
-        self.stl_mesh = gui_funcs.load_stl(self.stl_path)
-
-        non_manifold_edges = self.check_non_manifold_edges()
-        normals_orientation = self.check_normals_orientation()
-        holes = self.check_for_holes()
-        duplicate_vertices, duplicate_faces = self.check_duplicate_vertices_faces()
-        multiple_bodies = self.check_multiple_bodies()
-        degenerate_faces = self.check_degenerate_faces()
-        non_uniform_scaling = self.check_non_uniform_scaling()
-
-        if any([non_manifold_edges, holes, multiple_bodies > 1, degenerate_faces]):
-            print("\n-------------------ERROR-------------------")
-            if non_manifold_edges:
-                print(f"Non-manifold edges: {len(non_manifold_edges)}")
-            if holes:
-                print(f"Holes in the model: {len(holes)}")
-            if multiple_bodies:
-                print(f"Multiple bodies: {multiple_bodies}")
-            if degenerate_faces:
-                print(f"Degenerate faces: {degenerate_faces}")
-            print(
-                "These will likely cause issues with the meshing process, please fix the issues above before proceeding.\n"
-                "It is recommended to check your STL file for errors using a 3D viewer such as Slicer or ParaView.\n"
-                "---------------------------------------------\n"
-            )
+        """
+        Run the checks, hard errors first, then the warnings, and the costly self-intersection test last, only when
+        no error has been found and it has not been turned off. Only holes, non-manifold edges, inconsistent winding and multiple bodies are errors.
+        :return: report:  STLCheckReport holding a CheckResult per check that was run
+        """
+        report = STLCheckReport(self.stl_path, self.fail_fast)
+        for step, build in (('Edge table', self.build_edge_table), ('Face geometry', self.build_face_geometry)):
+            start = time.perf_counter()
+            build()
+            report.timings[step] = time.perf_counter() - start
 
-        if any([normals_orientation == False, duplicate_faces, duplicate_vertices, non_uniform_scaling]):
-            print("\n-------------------WARNING-------------------")
-            if not normals_orientation:
-                print("Normals are not correctly oriented.")
-            if non_uniform_scaling:
-                print(f"Non-uniform scaling: {non_uniform_scaling}")
-            if duplicate_vertices:
-                print(f"Duplicate vertices: {duplicate_vertices}")
-            if duplicate_faces:
-                print(f"Duplicate faces: {duplicate_faces}")
-            print(
-                "These issues may affect the meshing process.\n"
-                "It is recommended to check your STL file for errors using a 3D viewer such as Slicer or ParaView.\n"
-                "---------------------------------------------\n"
-            )
+        hard_checks = [
+            ('Non-manifold edges', self.check_non_manifold_edges, lambda edges: (
+                not edges, len(edges), np.array(list(edges), dtype=np.int64).reshape(-1, 2), edges,
+                f"Non-manifold edges: {len(edges)}"
+            )),
+            ('Holes', self.check_for_holes, lambda holes: (
+                not holes, len(holes), np.array(holes, dtype=np.int64).reshape(-1, 2), None,
+                f"Holes in the model: {len(holes)}"
+            )),
+            ('Inconsistent winding', self.check_winding, lambda edges: (
+                edges.shape[0] == 0, edges.shape[0], edges, None,
+                f"Edges between faces wound in opposite directions: {edges.shape[0]}"
+            )),
+            ('Multiple bodies', self.check_multiple_bodies, lambda output: (
+                output[0] <= 1, output[0], output[1]['Body'], output[1],
+                "\n".join([f"Multiple bodies: {output[0]}"] + [
+                    f"  Body {body['Body']}: {body['Triangles']} triangles, bounds {body['Min']} to {body['Max']}"
+                    for body in output[1]
+                ])
+            )),
+        ]
+        for name, check, summarise in hard_checks:
+            result = self.run_check(report, name, 'ERROR', check, summarise)
+            if self.fail_fast and not result.passed:
+                report.stopped_early = True
+                report.print_summary()
+                return report
+
+        # ICEM meshes over degenerate and self-intersecting faces in most cases, so they are reported but do not stop it
+        warning_checks = [
+            ('Degenerate faces', self.check_degenerate_faces, lambda faces: (
+                not faces, len(faces), np.array(faces, dtype=np.int64), None,
+                f"Degenerate faces: {len(faces)}"
+            )),
+            ('Normals orientation', self.check_normals_orientation, lambda outward: (
+                outward, int(not outward), None, self.check_signed_volume(),
+                f"Normals are not correctly oriented. Signed volume: {self.check_signed_volume():.2f}"
+            )),
+            ('Stored normals', self.check_stored_normals, lambda mismatched: (
+                mismatched.shape[0] == 0, mismatched.shape[0], mismatched, None,
+                f"Stored normals opposing the face winding: {mismatched.shape[0]}"
+            )),
+            ('Non-uniform scaling', self.check_non_uniform_scaling, lambda scaled: (
+                not scaled, int(scaled), None, None,
+                f"Non-uniform scaling: {scaled}"
+            )),
+            ('Duplicates', self.check_duplicate_vertices_faces, lambda output: (
+                not any(output), sum(output), None, output,
+                "\n".join(line for line, count in zip(
+                    (f"Duplicate vertices: {output[0]}", f"Duplicate faces: {output[1]}"), output
+                ) if count)
+            )),
+        ]
+        for name, check, summarise in warning_checks:
+            self.run_check(report, name, 'WARNING', check, summarise)
+
+        # Far the slowest check, so it is only worth running on a surface that has passed all the others
+        if report.errors or not self.self_intersections:
+            report.skipped.append('Self-intersections')
+        else:
+            self.run_check(report, 'Self-intersections', 'WARNING', self.check_self_intersections, lambda pairs: (
+                pairs.shape[0] == 0, self.self_intersecting_faces.shape[0], self.self_intersecting_faces, pairs,
+                f"Self-intersecting faces: {self.self_intersecting_faces.shape[0]} ({pairs.shape[0]} intersecting pairs)"
+            ))
+
+        report.print_summary()
+        return report
@@ -0,0 +1,214 @@
+"""
+================================================================================================================
+STL Cropping Library for meshing only the mid-shaft segment that the FEM solve keeps.
+================================================================================================================
+    Created by G.H. Allison, University of Sheffield, Sheffield, United Kingdom.
+    Copyright (C) 2024 George H. Allison
+    Contact: ghallison1@sheffield.ac.uk or xinshan.li@sheffield.ac.uk
+----------------------------------------------------------------------------------------------------------------
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+________________________________________________________________________________________________________________
+"""
+
+import os
+import numpy as np
+from core_libs import ldmk_funcs, stl_repair, surf_mesh
+
+shaft_length_suffix = '_shaft_length.txt'  # '<name>_shaft_length.txt' beside a cropped STL, or a mesh made from one
+cropped_title = 'cropped mid-shaft'  # Added to the .cdb title of a mesh made from a cropped STL
+bonemat_suffix = '-mat'  # Bonemat writes the mesh '<name>.cdb' with materials to '<name>-mat.cdb'
+
+
+def cut_surface(vertices, faces, origin, normal):
+    """
+    Cut a mesh with a plane and keep the part behind it, where (x - origin).normal <= 0.
+    Faces crossing the plane are clipped into one or two triangles, with one new vertex per cut edge so neighbouring
+    faces stay joined. Vertices within a small tolerance of the plane are moved onto it, which avoids slivers.
+    :param origin:  A point on the plane
+    :param normal:  The unit normal of the plane, pointing at the part removed
+    :return: vertices, faces, on_plane:  The kept mesh and a mask of its vertices lying on the plane
+    """
+    vertices = vertices.astype(np.float64)
+    faces = faces.astype(np.int64)
+    distances = (vertices - origin) @ normal
+    tolerance = 1e-6 * np.abs(distances).max()
+    snap = np.abs(distances) <= tolerance
+    vertices[snap] -= distances[snap, None] * normal
+    distances[snap] = 0
+    inside = distances <= 0
+
+    inside_count = inside[faces].sum(axis=1)
+    kept = faces[inside_count == 3]
+    clipped = faces[(inside_count == 1) | (inside_count == 2)]
+
+    # One new vertex where each cut edge crosses the plane
+    starts, ends = clipped.reshape(-1), np.roll(clipped, -1, axis=1).reshape(-1)
+    crossing = inside[starts] != inside[ends]
+    a, b = np.minimum(starts[crossing], ends[crossing]), np.maximum(starts[crossing], ends[crossing])
+    edge_keys, edge_ids = np.unique(a * vertices.shape[0] + b, return_inverse=True)
+    a, b = edge_keys // vertices.shape[0], edge_keys % vertices.shape[0]
+    t = distances[a] / (distances[a] - distances[b])
+    cut_ids = vertices.shape[0] + np.arange(edge_keys.shape[0])
+    cut_ids = np.where(distances[a] == 0, a, np.where(distances[b] == 0, b, cut_ids))  # Edges ending on the plane cut there
+    vertices = np.vstack((vertices, vertices[a] + t[:, None] * (vertices[b] - vertices[a])))
+    edge_vertex = np.full(starts.shape[0], -1, dtype=np.int64)
+    edge_vertex[crossing] = cut_ids[edge_ids.reshape(-1)]
+    edge_vertex = edge_vertex.reshape(-1, 3)  # The cut vertex of the edge from each corner to the next
+
+    # Roll every clipped face so its odd corner, the one alone on its side, comes first, keeping the winding
+    odd_inside = inside_count[(inside_count == 1) | (inside_count == 2)] == 1
+    odd = np.argmax(inside[clipped] == odd_inside[:, None], axis=1)
+    roll = (np.arange(3)[None, :] + odd[:, None]) % 3
+    corners = np.take_along_axis(clipped, roll, axis=1)
+    cuts = np.take_along_axis(edge_vertex, roll, axis=1)  # cuts[:, 0] is on edge 0-1, cuts[:, 2] on edge 2-0
+
+    one = odd_inside  # The inside corner keeps a single triangle
+    two = ~odd_inside  # The two inside corners keep a quadrilateral, split in two
+    new_faces = [
+        kept,
+        np.column_stack((corners[one, 0], cuts[one, 0], cuts[one, 2])),
+        np.column_stack((cuts[two, 0], corners[two, 1], corners[two, 2])),
+        np.column_stack((cuts[two, 0], corners[two, 2], cuts[two, 2])),
+    ]
+    faces = np.vstack(new_faces)
+    on_plane = np.concatenate((snap, np.ones(cut_ids.shape[0], dtype=bool)))
+
+    faces = faces[stl_repair.remove_degenerate_faces(vertices, faces)]
+    used, faces = np.unique(faces, return_inverse=True)
+    return vertices[used], faces.reshape(-1, 3), on_plane[used]
+
+
+def crop_surface(surface, middle, distal, pc=0.5, margin=10.0):
+    """
+    Crop a bone to the mid-shaft segment kept by the FEM solve, plus a margin at each end, and cap both cuts.
+    The FEM scripts keep +/- shaft_length * pc / 2 about the mid-shaft landmark, measured along the axis through the
+    mid-shaft and distal landmarks, so the surface is cut with planes normal to that axis just beyond those bounds.
+    Each cut is closed with a fan of triangles about the centroid of its loop, see stl_repair.fill_holes.
+    :param surface:  The surf_mesh.SurfaceMesh of the whole bone
+    :param middle:  The mid-shaft landmark
+    :param distal:  The distal landmark
+    :param pc:  The proportion of the shaft kept by the FEM solve
+    :param margin:  The length kept beyond each end of the FEM segment
+    :return: cropped, shaft_length:  The capped SurfaceMesh and the length of the whole bone along the shaft axis
+    """
+    middle, distal = np.asarray(middle, dtype=np.float64), np.asarray(distal, dtype=np.float64)
+    axis = (distal - middle) / np.linalg.norm(distal - middle)
+    vertices, faces = surface.vertices.astype(np.float64), surface.faces
+    positions = (vertices - middle) @ axis
+    shaft_length = float(positions.max() - positions.min())
+    half_length = shaft_length * pc / 2 + margin
+
+    for direction in (axis, -axis):
+        if ((vertices - middle) @ direction).max() <= half_length:
+            continue  # The bone ends within the segment on this side
+        vertices, faces, on_plane = cut_surface(vertices, faces, middle + direction * half_length, direction)
+        vertices, faces, _ = stl_repair.fill_holes(vertices, faces, faces.shape[0], loop_vertices=on_plane)
+
+    corners = vertices[faces]
+    normals = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+    lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+    normals = np.divide(normals, lengths, out=np.zeros_like(normals), where=lengths > 0)
+    cropped = surf_mesh.SurfaceMesh(surface.stl_path, corners.astype(np.float32), normals.astype(np.float32), 'BINARY', weld_tol=surface.weld_tol)
+    cropped._vertices, cropped._faces = vertices.astype(np.float32), faces  # The welded topology is already known
+    return cropped, shaft_length
+
+
+def project_name(file_path):
+    # The specimen or project a file belongs to, its name without the extension or the suffix Bonemat adds
+    name = os.path.splitext(os.path.basename(file_path))[0]
+    return name[:-len(bonemat_suffix)] if name.endswith(bonemat_suffix) else name
+
+
+def shaft_length_path(file_path):
+    # The file holding the whole bone length of a cropped STL or mesh, '<folder>/<project>_shaft_length.txt', shared
+    # by '<project>.cdb', '<project>.db' and Bonemat's '<project>-mat.cdb'
+    return f"{os.path.dirname(file_path) or '.'}/{project_name(file_path)}{shaft_length_suffix}"
+
+
+def mesh_title(proj_name, shaft_length):
+    # The .cdb title of a mesh, marking one made from a cropped STL so its missing bone length can be caught
+    return proj_name if shaft_length == "" else f"{proj_name} {cropped_title}"
+
+
+def is_cropped_mesh(file_path):
+    """
+    Check the title of a .cdb for the mark left by mesh_title on a mesh made from a cropped STL.
+    Only the header is read. A .db cannot be checked and counts as not cropped.
+    """
+    if not file_path.lower().endswith('.cdb'):
+        return False
+    with open(file_path, 'r', errors='replace') as file:
+        for line, _ in zip(file, range(20)):
+            if line.upper().startswith('/TITLE'):
+                return cropped_title in line
+    return False
+
+
+def write_shaft_length(file_path, shaft_length):
+    """
+    Store the whole bone length beside a cropped STL or a mesh made from one, or remove a stale length when the file
+    was not cropped, so an uncropped mesh never picks up the length of an earlier crop. A mesh and the files made from
+    it, such as Bonemat's, share the length through their project name.
+    :param shaft_length:  The whole bone length, "" when the file was not cropped
+    """
+    length_path = shaft_length_path(file_path)
+    if shaft_length == "":
+        if os.path.exists(length_path):
+            os.remove(length_path)
+        return
+    np.savetxt(length_path, [shaft_length], fmt='%.10f')
+
+
+def read_shaft_length(file_path):
+    """
+    Read the whole bone length stored beside a cropped STL or a mesh made from one, found through the project name so
+    Bonemat's '<project>-mat.cdb' reads the length of '<project>.cdb'.
+    :return: shaft_length:  The length, or "" when none is stored, matching FemVariables.l
+    """
+    length_path = shaft_length_path(file_path)
+    if not os.path.exists(length_path):
+        return ""
+    shaft_length = float(np.loadtxt(length_path))
+    print(f"Bone length read from {length_path}: {shaft_length}")
+    return shaft_length
+
+
+def write_cropped_stl(surface, save_path, pc=0.5, margin=10.0):
+    """
+    Crop a bone to its mid-shaft segment using the automatic landmarks, and write it to
+    '<save_path>/cropped/<name>.stl' with the whole bone length in '<save_path>/cropped/<name>_shaft_length.txt'.
+    The mesher stores the same length beside the mesh it makes from the crop, which the FEM scripts read, since
+    the length of the cropped mesh no longer sets the segment bounds.
+    :return: cropped_path, cropped, shaft_length:  The written path, surface and whole bone length, or None, the
+        original surface and ""
+    """
+    distal, proximal, middle = ldmk_funcs.shaft_landmarks(surface)
+    middle, distal = ldmk_funcs.reshape_1d_array(np.asarray(middle)), ldmk_funcs.reshape_1d_array(np.asarray(distal))
+    cropped, shaft_length = crop_surface(surface, middle, distal, pc, margin)
+    if cropped.faces.shape[0] == surface.faces.shape[0]:
+        print("STL crop: the segment covers the whole bone, nothing was cropped.")
+        return None, surface, ""
+
+    crop_dir = os.path.join(save_path, 'cropped')
+    os.makedirs(crop_dir, exist_ok=True)
+    cropped_path = os.path.join(crop_dir, f"{os.path.splitext(os.path.basename(surface.stl_path))[0]}.stl").replace("\\", "/")
+    cropped.save(cropped_path)
+    cropped.stl_path = cropped_path
+    cropped.binary_path = cropped_path
+    write_shaft_length(cropped_path, shaft_length)
+    print(f"STL cropped to the mid-shaft: {surface.faces.shape[0]} -> {cropped.faces.shape[0]} triangles, "
+          f"bone length {shaft_length:.2f}. Saved to {cropped_path}")
+    return cropped_path, cropped, shaft_length
@@ -0,0 +1,327 @@
+"""
+================================================================================================================
+STL Decimation Library for reducing CT derived surfaces to the triangle count the tetra mesh needs.
+================================================================================================================
+    Created by G.H. Allison, University of Sheffield, Sheffield, United Kingdom.
+    Copyright (C) 2024 George H. Allison
+    Contact: ghallison1@sheffield.ac.uk or xinshan.li@sheffield.ac.uk
+----------------------------------------------------------------------------------------------------------------
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+________________________________________________________________________________________________________________
+"""
+
+import os
+import numpy as np
+from scipy import sparse
+from core_libs import surf_mesh, stl_repair
+
+
+def face_budget(vertices, faces, max_element_size, refinement=3.0):
+    """
+    The number of triangles needed to tile the surface with equilateral triangles whose edges are a fraction of
+    the maximum element size, so the decimated surface stays finer than the tetra mesh built on it.
+    :param max_element_size:  The maximum element size given to ICEM
+    :param refinement:  How many triangle edges fit along one element edge
+    :return: budget
+    """
+    corners = vertices[faces].astype(np.float64)
+    area = 0.5 * np.linalg.norm(np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0]), axis=1).sum()
+    edge = max_element_size / refinement
+    return max(4, int(np.ceil(area / (np.sqrt(3) / 4 * edge ** 2))))
+
+
+def vertex_quadrics(vertices, faces):
+    """
+    Sum the plane quadrics of the faces around each vertex. The squared distance of a point x to the plane
+    n.x + d = 0 is x.A.x + 2 b.x + c with A = n n^T, b = d n and c = d^2, so the quadric of a vertex gives the summed
+    squared distance to the planes of its faces.
+    :return: A, b, c:  The (m, 3, 3), (m, 3) and (m,) quadric terms of each vertex
+    """
+    corners = vertices[faces]
+    normals = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+    lengths = np.linalg.norm(normals, axis=1)
+    normals /= np.where(lengths > 0, lengths, 1.0)[:, None]
+    d = -np.einsum('ij,ij->i', normals, corners[:, 0])
+    ids, n_vertices = faces.reshape(-1), vertices.shape[0]
+    A = np.stack([np.bincount(ids, weights=np.repeat(normals[:, i] * normals[:, j], 3), minlength=n_vertices)
+                  for i in range(3) for j in range(3)], axis=1).reshape(-1, 3, 3)
+    b = np.stack([np.bincount(ids, weights=np.repeat(d * normals[:, i], 3), minlength=n_vertices) for i in range(3)], axis=1)
+    return A, b, np.bincount(ids, weights=np.repeat(d ** 2, 3), minlength=n_vertices)
+
+
+def collapse_targets(vertices, a, b, quadrics):
+    """
+    Find where each edge a-b collapses to and the quadric error of that position. The position minimises the summed
+    quadric of the two vertices. Flat or straight regions leave the quadric singular, so it is regularised towards
+    the edge midpoint, and positions that stray further than the edge length are replaced by the midpoint.
+    :return: positions, costs
+    """
+    A, b_vec, c = quadrics
+    edge_A, edge_b, edge_c = A[a] + A[b], b_vec[a] + b_vec[b], c[a] + c[b]
+    midpoints = 0.5 * (vertices[a] + vertices[b])
+    regulariser = 1e-6 * np.trace(edge_A, axis1=1, axis2=2) + 1e-12
+    system = edge_A + regulariser[:, None, None] * np.eye(3)
+    positions = np.linalg.solve(system, (regulariser[:, None] * midpoints - edge_b)[:, :, None])[:, :, 0]
+    strayed = np.linalg.norm(positions - midpoints, axis=1) > np.linalg.norm(vertices[a] - vertices[b], axis=1)
+    positions[strayed] = midpoints[strayed]
+    costs = np.einsum('ij,ijk,ik->i', positions, edge_A, positions) + 2 * np.einsum('ij,ij->i', edge_b, positions) + edge_c
+    return positions, np.maximum(costs, 0)
+
+
+def collapse_edges(vertices, faces, max_faces, max_deviation, max_rounds=100, matching_passes=3, seed=0):
+    """
+    Decimate a mesh by quadric error edge collapse (Garland and Heckbert), a batch of edges per round.
+    Each round the edges are ranked by quadric error, and an edge is picked when it is the cheapest edge left at both
+    its vertices. Where a face touches two picked edges only the cheaper one is kept, so the collapses in a round never
+    move the same faces and can be applied together.
+    Collapses are rejected when the two vertices share more than two neighbours, which would make the mesh
+    non-manifold, or when a face around them would flip. Edges on holes or non-manifold edges are left alone.
+    The quadrics are not area weighted, so their error bounds the squared distance of the new vertex to every
+    plane merged into it and collapses moving the surface further than max_deviation are never made.
+    :param max_faces:  Stop once the mesh has no more triangles than this
+    :param max_deviation:  The largest distance a collapse may move the surface from the planes of the original faces
+    :param max_rounds:  The most collapse rounds run
+    :param matching_passes:  The number of times per round that edges are picked from those left
+    :param seed:  Seed of the random order of equally cheap edges, so a surface always decimates the same way
+    :return: vertices, faces:  The decimated mesh
+    """
+    vertices, faces = vertices.astype(np.float64), faces.astype(np.int64)
+    quadrics = vertex_quadrics(vertices, faces)
+    n_vertices = vertices.shape[0]
+    rng = np.random.default_rng(seed)
+    for _ in range(max_rounds):
+        if faces.shape[0] <= max_faces:
+            break
+        starts, ends, keys = stl_repair.half_edges(faces)
+        keys, counts = np.unique(np.minimum(starts, ends) * n_vertices + np.maximum(starts, ends), return_counts=True)
+        a, b = keys // n_vertices, keys % n_vertices
+        locked = np.zeros(n_vertices, dtype=bool)
+        locked[a[counts != 2]] = locked[b[counts != 2]] = True
+
+        positions, costs = collapse_targets(vertices, a, b, quadrics)
+        valid = ~locked[a] & ~locked[b] & (costs <= max_deviation ** 2)
+        # Costs change smoothly over the surface, so ranking by cost alone leaves few edges cheapest at both ends.
+        # Costs are ranked in half octave bands instead, randomly within a band, and picked over a few passes.
+        bands = np.floor(2 * np.log2(costs / max_deviation ** 2 + 1e-12))
+        rank = np.empty(a.shape[0], dtype=np.int64)
+        rank[np.lexsort((rng.random(a.shape[0]), bands))] = np.arange(a.shape[0])
+        matched = np.zeros(n_vertices, dtype=bool)
+        selected = []
+        for _ in range(matching_passes):
+            candidates = valid & ~matched[a] & ~matched[b]
+            candidate_rank = np.where(candidates, rank, a.shape[0])
+            near = np.full(n_vertices, a.shape[0], dtype=np.int64)
+            np.minimum.at(near, a, candidate_rank)
+            np.minimum.at(near, b, candidate_rank)
+            picked = np.flatnonzero(candidates & (candidate_rank == near[a]) & (candidate_rank == near[b]))
+            matched[a[picked]] = matched[b[picked]] = True  # No two picked edges share a vertex
+            selected.append(picked)
+        selected = np.concatenate(selected)
+
+        # A face touching two collapsing edges keeps only the cheapest, so every face moves with one collapse at most
+        edge_of = np.full(n_vertices, -1, dtype=np.int64)
+        edge_of[a[selected]] = edge_of[b[selected]] = selected
+        touched = edge_of[faces]
+        touched_rank = np.where(touched >= 0, rank[touched], a.shape[0])
+        cheapest = touched_rank.min(axis=1, keepdims=True)
+        dropped = np.zeros(a.shape[0], dtype=bool)
+        dropped[touched[(touched >= 0) & (touched_rank > cheapest)]] = True
+        selected = selected[~dropped[selected]]
+
+        # The link condition: an edge inside a closed manifold shares exactly two neighbours between its ends
+        adjacency = sparse.csr_matrix((np.ones(2 * a.shape[0], dtype=np.int32), (np.concatenate((a, b)), np.concatenate((b, a)))), shape=(n_vertices, n_vertices))
+        shared = np.asarray(adjacency[a[selected]].multiply(adjacency[b[selected]]).sum(axis=1)).reshape(-1)
+        selected = selected[shared == 2]
+
+        # Reject collapses that flip a surviving face around either vertex
+        edge_of = np.full(n_vertices, -1, dtype=np.int64)
+        edge_of[a[selected]] = edge_of[b[selected]] = selected
+        touched = edge_of[faces]
+        moved = np.flatnonzero(touched.max(axis=1) >= 0)
+        moved_edges = touched[moved].max(axis=1)
+        keeps = ~((faces[moved] == a[moved_edges, None]).any(axis=1) & (faces[moved] == b[moved_edges, None]).any(axis=1))
+        moved, moved_edges = moved[keeps], moved_edges[keeps]
+        before = vertices[faces[moved]]
+        after = np.where((touched[moved] >= 0)[:, :, None], positions[moved_edges][:, None, :], before)
+        normals_before = np.cross(before[:, 1] - before[:, 0], before[:, 2] - before[:, 0])
+        normals_after = np.cross(after[:, 1] - after[:, 0], after[:, 2] - after[:, 0])
+        flipped = np.einsum('ij,ij->i', normals_before, normals_after) <= 0
+        rejected = np.zeros(a.shape[0], dtype=bool)
+        rejected[moved_edges[flipped]] = True
+        selected = selected[~rejected[selected]]
+        if selected.shape[0] == 0:
+            break
+
+        # Each collapse removes two faces, so take only the cheapest collapses needed to meet the budget
+        needed = (faces.shape[0] - max_faces + 1) // 2
+        selected = selected[np.argsort(costs[selected], kind='stable')[:needed]]
+        keep_ids, gone_ids = a[selected], b[selected]
+        vertices[keep_ids] = positions[selected]
+        for terms in quadrics:
+            terms[keep_ids] += terms[gone_ids]
+        remap = np.arange(n_vertices)
+        remap[gone_ids] = keep_ids
+        faces = remap[faces]
+        faces = faces[(faces[:, 0] != faces[:, 1]) & (faces[:, 1] != faces[:, 2]) & (faces[:, 2] != faces[:, 0])]
+
+    used, faces = np.unique(faces, return_inverse=True)
+    return vertices[used], faces.reshape(-1, 3)
+
+
+def point_triangle_distances(points, corners):
+    """
+    Distance from each point to its triangle: the distance to the plane when the point projects inside the
+    triangle, otherwise the distance to the nearest edge.
+    :param points:  The (n, 3) points
+    :param corners:  The (n, 3, 3) corners of the triangle paired with each point
+    :return: distances
+    """
+    edge_1, edge_2 = corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0]
+    normals = np.cross(edge_1, edge_2)
+    areas = np.einsum('ij,ij->i', normals, normals)
+    offsets = points - corners[:, 0]
+    u = np.einsum('ij,ij->i', np.cross(offsets, edge_2), normals) / np.where(areas > 0, areas, 1.0)
+    v = np.einsum('ij,ij->i', np.cross(edge_1, offsets), normals) / np.where(areas > 0, areas, 1.0)
+    inside = (areas > 0) & (u >= 0) & (v >= 0) & (u + v <= 1)
+    plane = np.abs(np.einsum('ij,ij->i', offsets, normals)) / np.sqrt(np.where(areas > 0, areas, 1.0))
+
+    edges = np.full(points.shape[0], np.inf)
+    for start, end in ((0, 1), (1, 2), (2, 0)):
+        direction = corners[:, end] - corners[:, start]
+        lengths = np.einsum('ij,ij->i', direction, direction)
+        t = np.clip(np.einsum('ij,ij->i', points - corners[:, start], direction) / np.where(lengths > 0, lengths, 1.0), 0, 1)
+        edges = np.minimum(edges, np.linalg.norm(points - corners[:, start] - t[:, None] * direction, axis=1))
+    return np.where(inside, plane, edges)
+
+
+def surface_distances(points, vertices, faces, reach, chunk_size=2000000):
+    """
+    Distance from each point to a surface, exact up to reach. Each face is binned into every cell of a uniform grid
+    that its bounding box, grown by reach, overlaps, so every face within reach of a point is binned in the cell of
+    that point and only those faces are checked. Points further than reach from every face get infinity.
+    :param reach:  The largest distance that needs to be exact, the grid cells are at least this size
+    :param chunk_size:  The number of point-face pairs handled at once, bounds the memory used
+    :return: distances
+    """
+    points = points.astype(np.float64)
+    corners = vertices[faces].astype(np.float64)
+    lower, upper = corners.min(axis=1) - reach, corners.max(axis=1) + reach
+    cell_size = max(reach, np.median((upper - lower).max(axis=1)) / 2)
+    origin = np.minimum(lower.min(axis=0), points.min(axis=0))
+    first_cell = np.floor((lower - origin) / cell_size).astype(np.int64)
+    spans = np.floor((upper - origin) / cell_size).astype(np.int64) - first_cell + 1
+    shape = np.maximum(np.floor((np.maximum(upper.max(axis=0), points.max(axis=0)) - origin) / cell_size).astype(np.int64) + 1, 1)
+
+    # List the cells of each face box, counting through the box in x fastest
+    counts = spans.prod(axis=1)
+    face_ids = np.repeat(np.arange(faces.shape[0]), counts)
+    steps = np.arange(face_ids.shape[0]) - np.repeat(np.cumsum(counts) - counts, counts)
+    cells = first_cell[face_ids].copy()
+    cells[:, 0] += steps % spans[face_ids, 0]
+    cells[:, 1] += (steps // spans[face_ids, 0]) % spans[face_ids, 1]
+    cells[:, 2] += steps // (spans[face_ids, 0] * spans[face_ids, 1])
+    keys = np.ravel_multi_index(cells.T, shape)
+    order = np.argsort(keys, kind='stable')
+    keys, face_ids = keys[order], face_ids[order]
+
+    point_keys = np.ravel_multi_index(np.floor((points - origin) / cell_size).astype(np.int64).T, shape)
+    starts, stops = np.searchsorted(keys, point_keys, side='left'), np.searchsorted(keys, point_keys, side='right')
+    found = stops - starts
+    distances = np.full(points.shape[0], np.inf)
+    bounds = np.searchsorted(np.cumsum(found), np.arange(chunk_size, int(found.sum()) + chunk_size, chunk_size), side='right')
+    for first, last in zip(np.r_[0, bounds[:-1]], bounds):
+        last = max(last, first + 1)
+        run = found[first:last]
+        point_ids = np.repeat(np.arange(first, last), run)
+        positions = np.repeat(starts[first:last], run) + np.arange(point_ids.shape[0]) - np.repeat(np.cumsum(run) - run, run)
+        pair_faces = face_ids[positions]
+        inside = np.all((points[point_ids] >= lower[pair_faces]) & (points[point_ids] <= upper[pair_faces]), axis=1)
+        point_ids, pair_faces = point_ids[inside], pair_faces[inside]  # Only faces whose grown box holds the point
+        np.minimum.at(distances, point_ids, point_triangle_distances(points[point_ids], corners[pair_faces]))
+    return distances
+
+
+def hausdorff_distance(vertices_a, faces_a, vertices_b, faces_b, reach):
+    """
+    Two sided Hausdorff distance between a surface and a coarser copy of it. The fine surface is sampled at its
+    vertices, and the coarse one at its vertices and face centroids, since its faces are larger than the spacing.
+    Distances beyond reach are not exact and may come back as infinity, see surface_distances.
+    """
+    samples_b = np.vstack((vertices_b, vertices_b[faces_b].mean(axis=1)))
+    return max(surface_distances(vertices_a, vertices_b, faces_b, reach).max(), surface_distances(samples_b, vertices_a, faces_a, reach).max())
+
+
+def decimate_surface(surface, max_faces, max_deviation):
+    """
+    Decimate a surface to at most max_faces triangles while moving it no further than max_deviation.
+    The budget is not met when that would need collapses beyond the deviation bound. The result is checked with the
+    sampled Hausdorff distance, and rejected if it still moved further than the bound.
+    :param surface:  The surf_mesh.SurfaceMesh to decimate
+    :param max_faces:  The triangle budget
+    :param max_deviation:  The largest Hausdorff distance allowed between the original and decimated surfaces
+    :return: decimated, report:  The decimated SurfaceMesh, or None if nothing acceptable was removed, and a
+        dictionary of the triangle counts and deviation
+    """
+    vertices, faces = surface.vertices.astype(np.float64), surface.faces.astype(np.int64)
+    report = {'Original triangles': int(faces.shape[0]), 'Triangle budget': int(max_faces)}
+    if faces.shape[0] <= max_faces:
+        return None, report
+
+    new_vertices, new_faces = collapse_edges(vertices, faces, max_faces, max_deviation)
+    report['Decimated triangles'] = int(new_faces.shape[0])
+    if new_faces.shape[0] == faces.shape[0]:
+        return None, report
+    report['Hausdorff deviation'] = float(hausdorff_distance(vertices, faces, new_vertices, new_faces, max_deviation))
+    if report['Hausdorff deviation'] > max_deviation:
+        return None, report
+
+    corners = new_vertices[new_faces]
+    normals = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+    lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+    normals = np.divide(normals, lengths, out=np.zeros_like(normals), where=lengths > 0)
+    decimated = surf_mesh.SurfaceMesh(surface.stl_path, corners.astype(np.float32), normals.astype(np.float32), 'BINARY', weld_tol=surface.weld_tol)
+    decimated._vertices, decimated._faces = new_vertices.astype(np.float32), new_faces  # The welded topology is already known
+    return decimated, report
+
+
+def write_decimated_stl(surface, save_path, max_element_size, max_deviation, refinement=3.0):
+    """
+    Decimate a surface to the budget set by the maximum element size and write it to
+    '<save_path>/decimated/<name>.stl'. The original file name is kept so ICEM family names do not change.
+    :return: decimated_path, decimated:  The written path and surface, or None and the original surface
+    """
+    budget = face_budget(surface.vertices, surface.faces, max_element_size, refinement)
+    decimated, report = decimate_surface(surface, budget, max_deviation)
+    if decimated is None:
+        if report['Original triangles'] <= budget:
+            print(f"STL decimation: {report['Original triangles']} triangles is already within the budget of {budget}.")
+        else:
+            print(f"STL decimation: no decimation kept the surface within {max_deviation} of the original, "
+                  "ICEM will use the full surface.")
+        return None, surface
+
+    print("\n-----------------DECIMATION-----------------")
+    print(f"Triangles: {report['Original triangles']} -> {report['Decimated triangles']} (budget {budget})")
+    print(f"Hausdorff deviation: {report['Hausdorff deviation']:.4f}")
+    decimate_dir = os.path.join(save_path, 'decimated')
+    os.makedirs(decimate_dir, exist_ok=True)
+    decimated_path = os.path.join(decimate_dir, f"{os.path.splitext(os.path.basename(surface.stl_path))[0]}.stl").replace("\\", "/")
+    decimated.save(decimated_path)
+    decimated.stl_path = decimated_path
+    decimated.binary_path = decimated_path
+    print(f"Decimated STL saved to {decimated_path}")
+    print("---------------------------------------------\n")
+    return decimated_path, decimated
@@ -0,0 +1,287 @@
+"""
+================================================================================================================
+STL Repair Module for fixing common surface defects prior to meshing.
+================================================================================================================
+    Created by G.H. Allison, University of Sheffield, Sheffield, United Kingdom.
+    Copyright (C) 2024 George H. Allison
+    Contact: ghallison1@sheffield.ac.uk or xinshan.li@sheffield.ac.uk
+----------------------------------------------------------------------------------------------------------------
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+________________________________________________________________________________________________________________
+"""
+
+import os
+import numpy as np
+from scipy import sparse
+from scipy.sparse import csgraph
+from core_libs import surf_mesh
+
+
+def half_edges(faces):
+    """
+    List the directed edges of every face, in winding order.
+    :param faces:  The (n, 3) vertex ids of each face
+    :return: starts, ends, keys:  The start and end vertex of each half-edge and an undirected key for its edge
+    """
+    faces = faces.astype(np.int64)
+    starts = faces.reshape(-1)
+    ends = np.roll(faces, -1, axis=1).reshape(-1)
+    n_vertices = int(faces.max()) + 1 if faces.size else 1
+    keys = np.minimum(starts, ends) * n_vertices + np.maximum(starts, ends)
+    return starts, ends, keys
+
+
+def remove_duplicate_faces(faces):
+    """
+    Keep the first of any faces that use the same three vertices.
+    :return: keep:  Boolean mask of the faces to keep
+    """
+    corners = np.sort(faces, axis=1)
+    order = np.lexsort(corners.T[::-1])
+    repeated = np.all(corners[order][1:] == corners[order][:-1], axis=1)
+    keep = np.ones(faces.shape[0], dtype=bool)
+    keep[order[1:][repeated]] = False
+    return keep
+
+
+def remove_degenerate_faces(vertices, faces):
+    """
+    Flag faces with zero area or with two corners on the same vertex.
+    :return: keep:  Boolean mask of the faces to keep
+    """
+    corners = vertices[faces].astype(np.float64)
+    areas = np.linalg.norm(np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0]), axis=1)
+    collapsed = (faces[:, 0] == faces[:, 1]) | (faces[:, 1] == faces[:, 2]) | (faces[:, 2] == faces[:, 0])
+    return (areas > 0) & ~collapsed
+
+
+def face_bodies(faces, n_vertices):
+    """
+    Label the connected bodies of a mesh.
+    :return: bodies, labels:  The number of bodies and the body label of each face
+    """
+    starts, ends, keys = half_edges(faces)
+    graph = sparse.csr_matrix((np.ones(starts.shape[0], dtype=np.int8), (starts, ends)), shape=(n_vertices, n_vertices))
+    bodies, vertex_labels = csgraph.connected_components(graph, directed=False)
+    labels = vertex_labels[faces[:, 0]]
+    used, labels = np.unique(labels, return_inverse=True)  # Unused vertices do not count as bodies
+    return used.shape[0], labels.reshape(-1)
+
+
+def drop_small_bodies(labels, min_fraction):
+    """
+    Flag faces that belong to bodies smaller than a fraction of the largest body.
+    :param labels:  The body label of each face, see face_bodies
+    :param min_fraction:  Bodies with fewer triangles than this fraction of the largest body are dropped
+    :return: keep:  Boolean mask of the faces to keep
+    """
+    triangles = np.bincount(labels)
+    return triangles[labels] >= min_fraction * triangles.max()
+
+
+def orient_faces(faces):
+    """
+    Make the winding consistent across each body.
+    Faces sharing a manifold edge must traverse it in opposite directions. A breadth-first tree of the face adjacency
+    is built with scipy, and the flips needed along each tree path are accumulated by pointer jumping, so every face
+    learns whether to flip in O(n log n) array operations rather than a python walk over the mesh.
+    :return: faces, flipped:  The re-wound faces and the number of faces that were flipped
+    """
+    n_faces = faces.shape[0]
+    starts, ends, keys = half_edges(faces)
+    order = np.argsort(keys, kind='stable')
+    unique_keys, first, counts = np.unique(keys[order], return_index=True, return_counts=True)
+    manifold = first[counts == 2]  # Only edges shared by exactly two faces link faces together
+    half_a, half_b = order[manifold], order[manifold + 1]
+    face_a, face_b = half_a // 3, half_b // 3
+    # Stored as 1 when the neighbours agree and 2 when they traverse the shared edge the same way
+    agreement = 1 + (starts[half_a] == starts[half_b]).astype(np.int8)
+    unique_pairs = np.unique(np.minimum(face_a, face_b) * n_faces + np.maximum(face_a, face_b), return_index=True)[1]
+    face_a, face_b, agreement = face_a[unique_pairs], face_b[unique_pairs], agreement[unique_pairs]
+    rows, cols = np.concatenate((face_a, face_b)), np.concatenate((face_b, face_a))
+    adjacency = sparse.csr_matrix((np.concatenate((agreement, agreement)), (rows, cols)), shape=(n_faces, n_faces))
+
+    # One breadth-first search from an extra node linked to the first face of every body gives each face its parent
+    face_ids = np.arange(n_faces)
+    components, labels = csgraph.connected_components(adjacency, directed=False)
+    roots = np.unique(labels, return_index=True)[1]
+    search = sparse.csr_matrix(
+        (np.ones(rows.shape[0] + roots.shape[0], dtype=np.int8), (np.concatenate((rows, np.full(roots.shape[0], n_faces))), np.concatenate((cols, roots)))),
+        shape=(n_faces + 1, n_faces + 1)
+    )
+    nodes, predecessors = csgraph.breadth_first_order(search, n_faces, directed=False, return_predecessors=True)
+    parent = predecessors[:n_faces]
+    parent[roots] = roots
+    parity = (np.asarray(adjacency[face_ids, parent]).reshape(-1) == 2).astype(np.int8)
+
+    # Pointer jumping accumulates the parity along each path to the root
+    while np.any(parent != parent[parent]):
+        parity ^= parity[parent]
+        parent = parent[parent]
+
+    flip = parity.astype(bool)
+    faces = faces.copy()
+    faces[flip] = faces[flip][:, [0, 2, 1]]
+    return faces, int(flip.sum())
+
+
+def orient_outward(vertices, faces):
+    """
+    Flip any body whose signed volume is negative, so all faces wind outward.
+    :return: faces, flipped_bodies
+    """
+    bodies, labels = face_bodies(faces, vertices.shape[0])
+    corners = vertices[faces].astype(np.float64)
+    volumes = np.bincount(labels, weights=np.einsum('ij,ij->i', corners[:, 0], np.cross(corners[:, 1], corners[:, 2])), minlength=bodies)
+    flip = (volumes < 0)[labels]
+    faces = faces.copy()
+    faces[flip] = faces[flip][:, [0, 2, 1]]
+    return faces, int(np.count_nonzero(volumes < 0))
+
+
+def fill_holes(vertices, faces, max_hole_edges, loop_vertices=None):
+    """
+    Close small boundary loops with a fan of triangles around the loop centroid.
+    Boundary edges are those used by one face. Where a loop touches itself at a vertex the incoming and outgoing
+    edges at that vertex are paired up, so every loop is split into simple cycles, found as the components of the
+    edge-to-next-edge graph. Each boundary edge a->b then gains the triangle (b, a, centroid), which matches the
+    winding of the face it borders.
+    :param max_hole_edges:  Loops with more boundary edges than this are left open
+    :param loop_vertices:  Optional boolean mask of the vertices, only loops wholly on flagged vertices are filled
+    :return: vertices, faces, filled:  The extended mesh and the number of holes filled
+    """
+    starts, ends, keys = half_edges(faces)
+    unique_keys, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+    boundary = counts[inverse.reshape(-1)] == 1
+    a, b = starts[boundary], ends[boundary]
+    n_vertices = vertices.shape[0]
+
+    # Open boundaries on non-manifold meshes cannot be paired into cycles, so they are left alone
+    balanced = np.bincount(a, minlength=n_vertices) == np.bincount(b, minlength=n_vertices)
+    graph = sparse.csr_matrix((np.ones(a.shape[0], dtype=np.int8), (a, b)), shape=(n_vertices, n_vertices))
+    loops, vertex_labels = csgraph.connected_components(graph, directed=False)
+    closed = np.ones(loops, dtype=bool)
+    closed[vertex_labels[~balanced]] = False
+    if loop_vertices is not None:
+        closed[vertex_labels[a[~loop_vertices[a]]]] = False
+    selected = closed[vertex_labels[a]]
+    a, b = a[selected], b[selected]
+    if a.shape[0] == 0:
+        return vertices, faces, 0
+
+    # Pair each edge ending at a vertex with an edge starting there, then walk the pairs into cycles
+    following = np.empty(a.shape[0], dtype=np.int64)
+    following[np.argsort(b, kind='stable')] = np.argsort(a, kind='stable')
+    while True:
+        cycle_graph = sparse.csr_matrix((np.ones(a.shape[0], dtype=np.int8), (np.arange(a.shape[0]), following)), shape=(a.shape[0], a.shape[0]))
+        cycles, edge_labels = csgraph.connected_components(cycle_graph, directed=False)
+        # A cycle passing through a vertex twice is split by swapping the next edges of its two visits there
+        visits = edge_labels * n_vertices + b
+        order = np.argsort(visits, kind='stable')
+        repeats = np.flatnonzero(visits[order][1:] == visits[order][:-1])
+        if repeats.shape[0] == 0:
+            break
+        repeats = repeats[np.unique(edge_labels[order[repeats]], return_index=True)[1]]  # One swap per cycle
+        first, second = order[repeats], order[repeats + 1]
+        following[first], following[second] = following[second], following[first]
+    cycle_edges = np.bincount(edge_labels, minlength=cycles)
+    fill = cycle_edges <= max_hole_edges
+    if not fill.any():
+        return vertices, faces, 0
+
+    # One new vertex per filled cycle, at the mean of its boundary vertices
+    cycle_ids = np.flatnonzero(fill)
+    new_ids = np.full(cycles, -1, dtype=np.int64)
+    new_ids[cycle_ids] = n_vertices + np.arange(cycle_ids.shape[0])
+    centroids = np.zeros((cycles, 3))
+    for axis in range(3):
+        centroids[:, axis] = np.bincount(edge_labels, weights=vertices[a, axis].astype(np.float64), minlength=cycles)
+    centroids = centroids[cycle_ids] / cycle_edges[cycle_ids, None]
+
+    selected = fill[edge_labels]
+    new_faces = np.column_stack((b[selected], a[selected], new_ids[edge_labels[selected]]))
+    vertices = np.vstack((vertices, centroids.astype(vertices.dtype)))
+    faces = np.vstack((faces, new_faces.astype(faces.dtype)))
+    return vertices, faces, int(cycle_ids.shape[0])
+
+
+def repair_surface(surface, min_body_fraction=0.01, max_hole_edges=100):
+    """
+    Repair a surface mesh ahead of ICEM: remove duplicate and degenerate faces, drop small disconnected bodies,
+    make the winding consistent, fill small holes and orient every body outward.
+    :param surface:  The surf_mesh.SurfaceMesh to repair
+    :param min_body_fraction:  Bodies smaller than this fraction of the largest body are removed
+    :param max_hole_edges:  Holes bounded by up to this many edges are filled
+    :return: repaired, report:  The repaired SurfaceMesh and a dictionary counting each fix
+    """
+    vertices, faces = surface.vertices, surface.faces.astype(np.int64)
+    report = {}
+
+    keep = remove_duplicate_faces(faces)
+    report['Duplicate faces removed'] = int(np.count_nonzero(~keep))
+    faces = faces[keep]
+
+    keep = remove_degenerate_faces(vertices, faces)
+    report['Degenerate faces removed'] = int(np.count_nonzero(~keep))
+    faces = faces[keep]
+
+    bodies, labels = face_bodies(faces, vertices.shape[0])
+    keep = drop_small_bodies(labels, min_body_fraction)
+    report['Small bodies removed'] = int(bodies - np.unique(labels[keep]).shape[0])
+    faces = faces[keep]
+
+    faces, report['Faces re-wound'] = orient_faces(faces)
+    vertices, faces, report['Holes filled'] = fill_holes(vertices, faces, max_hole_edges)
+    faces, report['Bodies turned outward'] = orient_outward(vertices, faces)
+
+    # Drop vertices that no longer belong to any face
+    used, faces = np.unique(faces, return_inverse=True)
+    vertices, faces = vertices[used], faces.reshape(-1, 3)
+
+    corners = vertices[faces]
+    normals = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0]).astype(np.float64)
+    lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+    normals = np.divide(normals, lengths, out=np.zeros_like(normals), where=lengths > 0)
+
+    repaired = surf_mesh.SurfaceMesh(surface.stl_path, corners.astype(np.float32), normals.astype(np.float32), 'BINARY', weld_tol=surface.weld_tol)
+    repaired._vertices, repaired._faces = vertices, faces  # The welded topology is already known
+    return repaired, report
+
+
+def write_repaired_stl(surface, save_path, min_body_fraction=0.01, max_hole_edges=100):
+    """
+    Repair a surface and write it to '<save_path>/repaired/<name>.stl' when anything was changed.
+    The original file name is kept so ICEM family names do not change.
+    :return: repaired_path, repaired:  The written path and surface, or None and the original surface
+    """
+    repaired, report = repair_surface(surface, min_body_fraction, max_hole_edges)
+    if not any(report.values()):
+        print("STL repair: no changes were needed.")
+        return None, surface
+
+    print("\n-------------------REPAIR-------------------")
+    for fix, count in report.items():
+        if count:
+            print(f"{fix}: {count}")
+    repair_dir = os.path.join(save_path, 'repaired')
+    os.makedirs(repair_dir, exist_ok=True)
+    repaired_path = os.path.join(repair_dir, f"{os.path.splitext(os.path.basename(surface.stl_path))[0]}.stl").replace("\\", "/")
+    repaired.save(repaired_path)
+    repaired.stl_path = repaired_path
+    repaired.binary_path = repaired_path
+    print(f"Repaired STL saved to {repaired_path}")
+    print("---------------------------------------------\n")
+    return repaired_path, repaired
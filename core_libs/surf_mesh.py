@@ -0,0 +1,548 @@
+"""
+================================================================================================================
+Surface Mesh Context
+================================================================================================================
+    Created by G.H. Allison, University of Sheffield, Sheffield, United Kingdom.
+    Copyright (C) 2024 George H. Allison
+    Contact: ghallison1@sheffield.ac.uk or xinshan.li@sheffield.ac.uk
+----------------------------------------------------------------------------------------------------------------
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+________________________________________________________________________________________________________________
+"""
+
+import hashlib
+import os
+import threading
+import numpy as np
+from scipy import sparse
+from scipy.sparse import csgraph
+
+_cache = {}  # Parsed surfaces keyed by absolute path
+_cache_lock = threading.Lock()
+cache_size = 2  # Number of parsed surfaces kept in memory
+weld_tolerance = 1e-4  # Default distance (model units, mm) within which STL corners are welded into one vertex
+
+
+# One 50-byte binary STL record: normal, three corners and the attribute byte count, packed without padding
+stl_record_dt = np.dtype([('normal', '<f4', (3,)), ('vectors', '<f4', (3, 3)), ('attr', '<u2')])
+
+
+def read_stl_header(file):
+    """
+    Read the 80-byte header and triangle count of an STL file and measure its size.
+    :param file:  An open binary file object
+    :return: header, triangles, expected_size, actual_size
+    """
+    file.seek(0)
+    header = file.read(80)  # Read the 80-byte header
+    triangles = int.from_bytes(file.read(4), byteorder='little')  # Read the number of triangles
+    expected_size = 84 + (stl_record_dt.itemsize * triangles)  # Calculate the expected size for a binary STL
+    file.seek(0, 2)  # Move to the end of the file
+    actual_size = file.tell()  # Get the actual size of the file
+    return header, triangles, expected_size, actual_size
+
+
+def stl_file_type(stl_path):
+    """
+    Sniff whether an STL file is ASCII or binary.
+    :param stl_path:  The path to the STL file
+    :return: 'ASCII' or 'BINARY'
+    """
+    with open(stl_path, 'rb') as file:
+        header, triangles, expected_size, actual_size = read_stl_header(file)
+        # Check if the header starts with 'solid ' indicating a potential ASCII file
+        # Some binary files may also start with 'solid '
+        if header.startswith(b'solid '):
+            # Perform a simple check to see if the rest of the file looks like ASCII
+            # This checks for the presence of 'facet normal' which is common in ASCII STLs
+            file.seek(0)  # Go back to the beginning of the file
+            contents = file.read(1024).lower()  # Read the first 1024 bytes
+            if b'facet normal' in contents:
+                return 'ASCII'
+
+    # Check if the actual size matches the expected size for a binary STL
+    if actual_size == expected_size:
+        return 'BINARY'
+    # If the size doesn't match, it's safer to assume ASCII
+    # This could also indicate a malformed file
+    return 'ASCII'
+
+
+def map_binary_stl(stl_path):
+    """
+    Memory-map the triangle records of a binary STL without reading them into memory.
+    :param stl_path:  The path to the binary STL file
+    :return: records:  A read-only structured memmap with 'normal', 'vectors' and 'attr' fields
+    """
+    with open(stl_path, 'rb') as file:
+        header, triangles, expected_size, actual_size = read_stl_header(file)
+    if actual_size != expected_size:
+        raise ValueError(f"{stl_path} is not a binary STL, expected {expected_size} bytes but found {actual_size}")
+    if triangles == 0:
+        return np.empty(0, dtype=stl_record_dt)  # An empty file cannot be mapped
+    return np.memmap(stl_path, dtype=stl_record_dt, mode='r', offset=84, shape=(triangles,))
+
+
+def read_binary_stl(stl_path):
+    """
+    Read a binary STL as zero-copy views into the memory-mapped file.
+    :param stl_path:  The path to the binary STL file
+    :return: normals, vectors:  The (n, 3) normals and (n, 3, 3) corner coordinates
+    """
+    records = map_binary_stl(stl_path)
+    return records['normal'], records['vectors']
+
+
+def iter_binary_stl(stl_path, chunk_size=1000000):
+    """
+    Iterate over a binary STL in chunks so files larger than memory can be streamed.
+    Only the pages of the current chunk are resident at any time.
+    :param stl_path:  The path to the binary STL file
+    :param chunk_size:  The number of triangles per chunk
+    :return: start, normals, vectors:  The index of the first triangle in the chunk and views of its records
+    """
+    records = map_binary_stl(stl_path)
+    for start in range(0, records.shape[0], chunk_size):
+        chunk = records[start:start + chunk_size]
+        yield start, chunk['normal'], chunk['vectors']
+
+
+def read_ascii_stl(stl_path):
+    """
+    Parse an ASCII STL in bulk rather than line by line.
+    Solid lines and keywords are stripped from the whole file with byte-level find/replace, leaving only numbers,
+    which numpy parses in a single call. Files holding several solids are concatenated in order.
+    :param stl_path:  The path to the ASCII STL file
+    :return: normals, vectors, solids:  The (n, 3) normals, (n, 3, 3) corner coordinates and the solid names
+    """
+    with open(stl_path, 'rb') as file:
+        data = file.read()
+    lowered = data.lower()
+    facets = lowered.count(b'endfacet')
+
+    # Cut out every 'solid <name>' and 'endsolid <name>' line, the names may contain digits
+    solids = []
+    pieces = []
+    previous = 0
+    start = lowered.find(b'solid')
+    while start != -1:
+        end = lowered.find(b'\n', start)
+        end = len(lowered) if end == -1 else end
+        if lowered[max(start - 3, 0):start] == b'end':
+            pieces.append(lowered[previous:start - 3])
+        else:
+            pieces.append(lowered[previous:start])
+            solids.append(data[start + 5:end].strip().decode(errors='replace'))
+        previous = end
+        start = lowered.find(b'solid', end)
+    pieces.append(lowered[previous:])
+    data = b' '.join(pieces)
+
+    for keyword in (b'endfacet', b'endloop', b'facet', b'normal', b'outer', b'loop', b'vertex'):
+        data = data.replace(keyword, b' ')
+    values = np.fromstring(data, dtype=np.float32, sep=' ')
+
+    if values.size != facets * 12:
+        raise ValueError(f"{stl_path} is not a valid ASCII STL, found {values.size} values for {facets} facets")
+    values = values.reshape(-1, 12)
+    return values[:, 0:3], values[:, 3:12].reshape(-1, 3, 3), solids
+
+
+def write_binary_stl(file_path, normals, vectors, header=b'PyPeCT2S binary STL'):
+    """
+    Write triangles to a binary STL using the same record layout as the reader.
+    :param file_path:  The path of the STL file to write
+    :param normals:  The (n, 3) face normals
+    :param vectors:  The (n, 3, 3) corner coordinates
+    :param header:  Up to 80 bytes of header text, it must not start with 'solid'
+    :return: file_path
+    """
+    release_surface(file_path)  # A cached surface mapping this file must not read it while it is rewritten
+    records = np.zeros(vectors.shape[0], dtype=stl_record_dt)
+    records['normal'] = normals
+    records['vectors'] = vectors
+    with open(file_path, 'wb') as file:
+        file.write(header[:80].ljust(80, b' '))
+        file.write(int(records.shape[0]).to_bytes(4, byteorder='little'))
+        records.tofile(file)
+    return file_path
+
+
+def cached_binary_stl(stl_path, cache_dir):
+    """
+    Convert an ASCII STL to binary once and reuse the converted file on later runs.
+    Each copy sits in a 'stl_cache/<key>' folder, where the key is a short hash of the absolute path, size and
+    modification time of the source, so two sources sharing a name never share a copy and an edited source is
+    converted again. The copy keeps the original file name, so ICEM family names do not change.
+    :param stl_path:  The path to the ASCII STL file
+    :param cache_dir:  The directory the 'stl_cache' folder is created in, normally the save path
+    :return: binary_path:  The path to the binary copy
+    """
+    stat = os.stat(stl_path)
+    source = f"{os.path.abspath(stl_path)}|{stat.st_size}|{stat.st_mtime_ns}"
+    key = hashlib.sha1(source.encode('utf-8')).hexdigest()[:12]
+    cache_dir = os.path.join(cache_dir, 'stl_cache', key)
+    os.makedirs(cache_dir, exist_ok=True)
+    binary_path = os.path.join(cache_dir, f"{os.path.splitext(os.path.basename(stl_path))[0]}.stl").replace("\\", "/")
+    if os.path.exists(binary_path):
+        return binary_path
+
+    normals, vectors, solids = read_ascii_stl(stl_path)
+    print(f"Converted ASCII STL with {len(solids)} solid(s) and {vectors.shape[0]} facets to binary: {binary_path}")
+    write_binary_stl(f"{binary_path}.part", normals, vectors)
+    os.replace(f"{binary_path}.part", binary_path)  # A run stopped mid-write never leaves a copy that looks complete
+    return binary_path
+
+
+def hash_cells(cells):
+    """
+    Hash integer voxel coordinates into one 64-bit key per cell (Teschner et al. spatial hash).
+    Integer overflow wraps around, which is fine for a hash.
+    :param cells:  The (n, 3) integer voxel coordinates
+    :return: keys:  The (n,) int64 hash keys
+    """
+    cells = cells.astype(np.int64)
+    return (cells[:, 0] * 73856093) ^ (cells[:, 1] * 19349663) ^ (cells[:, 2] * 83492791)
+
+
+def weld_vertices(vectors, tolerance=None):
+    """
+    Collapse the triangle soup into unique vertices and integer face indices.
+    Corners are binned into a hashed voxel grid with the weld tolerance as the cell size, so corners in the same cell
+    weld together. Neighbouring cells are then looked up in the hash and joined when their representatives lie
+    within the tolerance, which catches corners split by a cell boundary.
+    :param vectors:  The (n, 3, 3) array of triangle corner coordinates
+    :param tolerance:  The weld distance, 0 only welds exactly equal corners, None uses weld_tolerance
+    :return: vertices, faces:  The (m, 3) welded vertices and the (n, 3) vertex ids of each face
+    """
+    tolerance = weld_tolerance if tolerance is None else tolerance
+    points = vectors.reshape(-1, 3) + 0.0  # Adding zero folds -0.0 into 0.0 so both weld to the same vertex
+    if points.shape[0] == 0 or tolerance <= 0:
+        vertices, inverse = np.unique(points, axis=0, return_inverse=True)
+        return vertices, inverse.reshape(-1, 3)
+
+    cells = np.floor((points.astype(np.float64) - points.min(axis=0)) / tolerance).astype(np.int64)
+    keys = hash_cells(cells)
+    cell_keys, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    cell_coords = cells[first]
+    if not np.array_equal(cells, cell_coords[inverse]):
+        # Two different cells share a hash key, fall back to grouping by the cell coordinates themselves
+        cell_coords, first, inverse = np.unique(cells, axis=0, return_index=True, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        cell_keys = None
+    representatives = points[first].astype(np.float64)
+    n_cells = first.shape[0]
+
+    # Join cells to the 13 forward neighbours whose representative is within the tolerance
+    pairs = []
+    if cell_keys is not None:
+        for offset in np.array([(dx, dy, dz) for dx in (-1, 0, 1) for dy in (-1, 0, 1) for dz in (-1, 0, 1)
+                                if (dx, dy, dz) > (0, 0, 0)]):
+            neighbours = cell_coords + offset
+            neighbour_keys = hash_cells(neighbours)
+            index = np.minimum(np.searchsorted(cell_keys, neighbour_keys), n_cells - 1)
+            found = (cell_keys[index] == neighbour_keys) & np.all(cell_coords[index] == neighbours, axis=1)
+            close = np.linalg.norm(representatives[found] - representatives[index[found]], axis=1) <= tolerance
+            pairs.append(np.column_stack((np.flatnonzero(found)[close], index[found][close])))
+    pairs = np.concatenate(pairs) if pairs else np.empty((0, 2), dtype=np.int64)
+
+    if pairs.shape[0]:
+        graph = sparse.csr_matrix((np.ones(pairs.shape[0], dtype=np.int8), (pairs[:, 0], pairs[:, 1])), shape=(n_cells, n_cells))
+        n_vertices, cell_labels = csgraph.connected_components(graph, directed=False)
+        vertex_first = np.full(n_vertices, n_cells, dtype=np.int64)
+        np.minimum.at(vertex_first, cell_labels, np.arange(n_cells))
+        vertices = points[first[vertex_first]]
+        inverse = cell_labels[inverse]
+    else:
+        vertices = points[first]
+    return vertices, inverse.reshape(-1, 3)
+
+
+def count_edges(faces):
+    """
+    Count how many faces share each edge of an indexed triangle mesh.
+    :param faces:  The (n, 3) vertex ids of each face
+    :return: edges, counts:  The (k, 2) unique edges as sorted vertex id pairs and the number of faces using each
+    """
+    faces = faces.astype(np.int64)
+    edges = np.sort(np.stack((faces, np.roll(faces, -1, axis=1)), axis=-1).reshape(-1, 2), axis=1)
+    n_vertices = int(faces.max()) + 1 if faces.size else 1
+    keys, counts = np.unique(edges[:, 0] * n_vertices + edges[:, 1], return_counts=True)  # One integer key per edge
+    return np.column_stack((keys // n_vertices, keys % n_vertices)), counts
+
+
+def candidate_face_pairs(corners, cell_factor=2.0, chunk_size=100000):
+    """
+    Generate pairs of faces whose bounding boxes overlap, a chunk at a time to bound the memory used.
+    Space is cut into a grid of columns across the two longest axes of the mesh, and each face is listed in every
+    column its box reaches. Within each column the boxes are swept along the shortest axis: after sorting by box
+    minimum, a face is paired with the faces that start within its own extent. A pair is kept only in the column
+    holding the larger of the two box minima, so every overlapping pair is found exactly once, and only when the
+    boxes also overlap across the grid.
+    :param corners:  The (n, 3, 3) corners of each face
+    :param cell_factor:  The column width as a multiple of the median box size along each grid axis
+    :param chunk_size:  The number of column entries swept at once
+    :return: pairs:  Yields (k, 2) arrays of ids of faces with overlapping bounds, smaller id first
+    """
+    n_faces = corners.shape[0]
+    if n_faces < 2:
+        return
+    lower, upper = corners.min(axis=1), corners.max(axis=1)
+    origin = lower.min(axis=0)
+    extent = upper.max(axis=0) - origin
+    sweep_axis = np.argmin(extent)
+    axes = [axis for axis in range(3) if axis != sweep_axis]
+    widths = cell_factor * np.median(upper[:, axes] - lower[:, axes], axis=0)
+    widths = np.where(widths > 0, widths, np.maximum(extent[axes], 1.0))
+    first_cells = np.floor((lower[:, axes] - origin[axes]) / widths).astype(np.int64)
+    last_cells = np.floor((upper[:, axes] - origin[axes]) / widths).astype(np.int64)
+    n_rows = int(last_cells[:, 1].max()) + 1
+
+    # One entry per face and column it reaches, expanded along one grid axis and then the other
+    entry_faces, entry_cells = np.arange(n_faces), np.zeros(n_faces, dtype=np.int64)
+    for step in range(2):
+        spans = last_cells[entry_faces, step] - first_cells[entry_faces, step] + 1
+        offsets = np.arange(int(spans.sum())) - np.repeat(np.cumsum(spans) - spans, spans)
+        entry_faces, entry_cells = np.repeat(entry_faces, spans), np.repeat(entry_cells, spans)
+        entry_cells += (first_cells[entry_faces, step] + offsets) * (n_rows if step == 0 else 1)
+    first_cells = first_cells[:, 0] * n_rows + first_cells[:, 1]
+    del last_cells, spans, offsets
+
+    # Sort by column then box minimum, offsetting each column by more than the spread of the boxes keeps them apart
+    spread = 2.0 * extent[sweep_axis] + 1.0
+    keys = entry_cells * spread + (lower[entry_faces, sweep_axis] - origin[sweep_axis])
+    order = np.argsort(keys, kind='stable')
+    entry_faces, entry_cells, keys = entry_faces[order], entry_cells[order], keys[order]
+    stops = np.searchsorted(keys, entry_cells * spread + (upper[entry_faces, sweep_axis] - origin[sweep_axis]), side='right')
+    del keys, order
+    lower, upper = lower[:, axes], upper[:, axes]
+
+    for first in range(0, entry_faces.shape[0], chunk_size):
+        starts = np.arange(first + 1, min(first + chunk_size, entry_faces.shape[0]) + 1)
+        counts = np.maximum(stops[first:first + chunk_size] - starts, 0)
+        owners = np.repeat(np.arange(first, first + counts.shape[0]), counts)
+        positions = np.repeat(starts, counts) + np.arange(owners.shape[0]) - np.repeat(np.cumsum(counts) - counts, counts)
+        face_a, face_b = entry_faces[owners], entry_faces[positions]
+        # The column holding the larger box minima, the cell of a maximum is the larger of the cells
+        cell_a, cell_b = first_cells[face_a], first_cells[face_b]
+        owned = np.maximum(cell_a // n_rows, cell_b // n_rows) * n_rows + np.maximum(cell_a % n_rows, cell_b % n_rows) == entry_cells[owners]
+        face_a, face_b = face_a[owned], face_b[owned]
+        overlap = np.all((lower[face_a] <= upper[face_b]) & (lower[face_b] <= upper[face_a]), axis=1)
+        face_a, face_b = face_a[overlap], face_b[overlap]
+        yield np.column_stack((np.minimum(face_a, face_b), np.maximum(face_a, face_b)))
+
+
+def segments_cross_triangles(starts, ends, corners, eps=1e-12):
+    """
+    Batched Moller-Trumbore test of whether each segment passes through the interior of its triangle.
+    Touching at an end point or an edge, and segments lying in the plane of the triangle, do not count.
+    :param starts:  The (n, 3) start of each segment
+    :param ends:  The (n, 3) end of each segment
+    :param corners:  The (n, 3, 3) corners of each triangle
+    :param eps:  Relative tolerance on the barycentric and segment coordinates
+    :return: crossed:  Boolean array, True where the segment crosses its triangle
+    """
+    direction = ends - starts
+    edge_1 = corners[:, 1] - corners[:, 0]
+    edge_2 = corners[:, 2] - corners[:, 0]
+    p = np.cross(direction, edge_2)
+    det = np.einsum('ij,ij->i', edge_1, p)
+    parallel = np.abs(det) <= eps * np.linalg.norm(direction, axis=1) * np.linalg.norm(edge_1, axis=1) * np.linalg.norm(edge_2, axis=1)
+    inv_det = 1.0 / np.where(parallel, 1.0, det)
+    s = starts - corners[:, 0]
+    u = np.einsum('ij,ij->i', s, p) * inv_det
+    q = np.cross(s, edge_1)
+    v = np.einsum('ij,ij->i', direction, q) * inv_det
+    t = np.einsum('ij,ij->i', edge_2, q) * inv_det
+    return ~parallel & (u > eps) & (v > eps) & (u + v < 1 - eps) & (t > eps) & (t < 1 - eps)
+
+
+def find_self_intersections(vertices, faces, chunk_size=100000):
+    """
+    Find pairs of faces that pass through each other.
+    Candidate pairs come from candidate_face_pairs, chunk by chunk. Pairs that share a vertex are dropped, as are pairs
+    where one face lies wholly on one side of the plane of the other, or in it, since faces that only touch or are
+    coplanar are not counted. Two triangles intersect when an edge of one crosses the other, so the remaining pairs
+    need six segment-triangle tests.
+    :param vertices:  The (m, 3) welded vertices
+    :param faces:  The (n, 3) vertex ids of each face
+    :param chunk_size:  The number of faces searched at once, bounds the memory used
+    :return: pairs:  The (k, 2) ids of the intersecting faces, smaller id first
+    """
+    corners = vertices[faces].astype(np.float64)
+    normals = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+    lengths = np.linalg.norm(normals, axis=1)
+    normals /= np.where(lengths > 0, lengths, 1.0)[:, None]
+    offsets = np.einsum('ij,ij->i', normals, corners[:, 0])
+    tolerances = 1e-6 * np.sqrt(lengths)  # Distances from a plane below this count as lying on it
+
+    intersecting = [np.empty((0, 2), dtype=np.int64)]
+    for pairs in candidate_face_pairs(corners, chunk_size=chunk_size):
+        face_a, face_b = faces[pairs[:, 0]], faces[pairs[:, 1]]
+        shared = np.any(face_a[:, :, None] == face_b[:, None, :], axis=(1, 2))  # Neighbours meet at their shared vertex
+        pairs = pairs[~shared]
+        for first, second in ((0, 1), (1, 0)):
+            sides = np.einsum('ij,ikj->ik', normals[pairs[:, first]], corners[pairs[:, second]]) - offsets[pairs[:, first], None]
+            tolerance = tolerances[pairs[:, first], None]
+            pairs = pairs[~(np.all(sides >= -tolerance, axis=1) | np.all(sides <= tolerance, axis=1))]
+
+        tri_a, tri_b = corners[pairs[:, 0]], corners[pairs[:, 1]]
+        crossed = np.zeros(pairs.shape[0], dtype=bool)
+        for first, second in ((tri_a, tri_b), (tri_b, tri_a)):
+            for corner in range(3):
+                crossed |= segments_cross_triangles(first[:, corner], first[:, (corner + 1) % 3], second)
+        intersecting.append(pairs[crossed])
+    return np.concatenate(intersecting)
+
+
+class SurfaceMesh:
+    """
+    In-memory STL surface shared by the checks, rotation, type detection and landmarking.
+    It exposes the same vectors/normals/points attributes as a numpy-stl mesh, plus the welded vertices and face
+    indices, which are computed once on first use.
+    """
+
+    def __init__(self, stl_path=None, vectors=None, normals=None, stl_type='BINARY', cache_dir=None, weld_tol=None):
+        self.stl_path = stl_path
+        self.stl_type = stl_type
+        self.weld_tol = weld_tolerance if weld_tol is None else weld_tol
+        self.binary_path = None  # Binary copy of the file on disk, the file itself for binary STLs
+        self.transform = np.eye(3)  # Rotation applied to the file coordinates, row vectors are multiplied on the right
+        self._vertices = None
+        self._faces = None
+        if vectors is None:
+            self.stl_type = stl_file_type(stl_path)
+            if self.stl_type == 'BINARY':
+                self.binary_path = stl_path
+            elif cache_dir:
+                self.binary_path = cached_binary_stl(stl_path, cache_dir)
+            if self.binary_path:
+                normals, vectors = read_binary_stl(self.binary_path)  # Views into the mapped file, nothing is copied
+            else:
+                normals, vectors, solids = read_ascii_stl(stl_path)
+        self.vectors = vectors
+        self.normals = normals if normals is not None else np.zeros((vectors.shape[0], 3), dtype=vectors.dtype)
+
+    @property
+    def points(self):
+        # Matches numpy-stl, one row of nine coordinates per face
+        return self.vectors.reshape(-1, 9)
+
+    @property
+    def vertices(self):
+        if self._vertices is None:
+            self._vertices, self._faces = weld_vertices(self.vectors, self.weld_tol)
+        return self._vertices
+
+    @property
+    def faces(self):
+        if self._faces is None:
+            self._vertices, self._faces = weld_vertices(self.vectors, self.weld_tol)
+        return self._faces
+
+    @property
+    def welded(self):
+        # Whether the welded topology has been built, so callers that do not need it can avoid the cost
+        return self._faces is not None
+
+    def set_weld_tol(self, weld_tol):
+        # Changing the tolerance discards the welded topology so it is rebuilt on next use
+        if weld_tol != self.weld_tol:
+            self.weld_tol = weld_tol
+            self._vertices = None
+            self._faces = None
+
+    def transformed(self, matrix):
+        """
+        Return a new surface with a rotation applied, reusing the welded topology of this one.
+        :param matrix:  The (3, 3) rotation matrix applied to row vectors
+        """
+        surface = SurfaceMesh(self.stl_path, np.dot(self.vectors, matrix).astype(self.vectors.dtype), np.dot(self.normals, matrix).astype(self.normals.dtype), self.stl_type, weld_tol=self.weld_tol)
+        surface.transform = np.dot(self.transform, matrix)
+        if self._faces is not None:
+            surface._vertices = np.dot(self._vertices, matrix)
+            surface._faces = self._faces
+        return surface
+
+    def detach(self):
+        """
+        Copy the triangles out of the memory-mapped file into memory, so the surface no longer holds the file open.
+        A mapped file cannot be replaced on Windows, and reading a map whose file was rewritten raises SIGBUS on Linux.
+        :return: self
+        """
+        if isinstance(self.vectors, np.memmap) or isinstance(self.normals, np.memmap):
+            self.vectors = np.array(self.vectors)
+            self.normals = np.array(self.normals)
+        return self
+
+    def save(self, file_path):
+        """
+        Write the surface to disk as a binary STL, only needed when an external tool requires a file.
+        :param file_path:  The path of the STL file to write
+        :return: file_path
+        """
+        if self.binary_path and os.path.exists(file_path) and os.path.samefile(file_path, self.binary_path):
+            self.detach()  # Writing over the mapped file would pull it out from under the views
+        return write_binary_stl(file_path, self.normals, self.vectors)
+
+
+def load_surface_mesh(stl_path, cache_dir=None):
+    """
+    Parse an STL file once and share the result with every consumer in the run.
+    The cached surface stays memory-mapped, so loading it copies nothing, and is reused until the file on disk changes.
+    The map is released by clear_surface_cache at the end of a run, or by release_surface before the file is rewritten.
+    :param stl_path:  The path to the STL file
+    :param cache_dir:  Where ASCII files are converted to binary once, see cached_binary_stl
+    :return: SurfaceMesh
+    """
+    key = os.path.abspath(stl_path)
+    stat = os.stat(key)
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    with _cache_lock:
+        cached = _cache.get(key)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+
+    surface = SurfaceMesh(stl_path, cache_dir=cache_dir)
+
+    with _cache_lock:
+        _cache.pop(key, None)
+        _cache[key] = (stamp, surface)
+        while len(_cache) > cache_size:
+            _cache.pop(next(iter(_cache)))  # Drop the oldest surface
+    return surface
+
+
+def release_surface(file_path):
+    """
+    Drop every cached surface read from a file, copying it out of the memory map first so anyone still holding the
+    surface keeps working after the file is replaced.
+    :param file_path:  The STL file, or the binary copy of an ASCII STL, about to be written
+    """
+    path = os.path.abspath(file_path)
+    with _cache_lock:
+        keys = [key for key, (stamp, surface) in _cache.items()
+                if path in (key, surface.binary_path and os.path.abspath(surface.binary_path))]
+        released = [_cache.pop(key)[1] for key in keys]
+    for surface in released:
+        surface.detach()
+
+
+def clear_surface_cache():
+    # Called at the end of a run, dropping the cached surfaces closes their memory maps
+    with _cache_lock:
+        _cache.clear()
@@ -0,0 +1,151 @@
+"""
+================================================================================================================
+External Tool Runner for ICEM CFD, BonematCLI and other command line tools, with live output and limits.
+================================================================================================================
+    Created by G.H. Allison, University of Sheffield, Sheffield, United Kingdom.
+    Copyright (C) 2024 George H. Allison
+    Contact: ghallison1@sheffield.ac.uk or xinshan.li@sheffield.ac.uk
+----------------------------------------------------------------------------------------------------------------
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+________________________________________________________________________________________________________________
+
+    Output is printed line by line as the tool writes it, so it reaches the log window while the tool runs.
+    The tool is watched from the calling thread: it is stopped, with every process it started, when it runs past
+    its time limit, when the memory of its process tree goes over its limit, or when cancel_runs is called.
+"""
+
+import subprocess
+import threading
+import time
+import psutil
+
+cancel_event = threading.Event()  # Set by cancel_runs, stops every tool running and any started until it is cleared
+
+
+def cancel_runs():
+    # Stop every running tool, called by the Cancel Run button
+    print("Cancelling the running tools...")
+    cancel_event.set()
+
+
+def tree_processes(pid):
+    # The process and every process below it, empty once it has exited
+    try:
+        parent = psutil.Process(pid)
+        return [parent] + parent.children(recursive=True)
+    except psutil.NoSuchProcess:
+        return []
+
+
+def tree_rss(pid):
+    # Resident memory (bytes) of a process tree, processes exiting or out of reach are left out
+    total = 0
+    for process in tree_processes(pid):
+        try:
+            total += process.memory_info().rss
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            continue
+    return total
+
+
+def kill_tree(pid, grace=5.0):
+    """
+    Stop a process and everything it started, children first so none are left running without a parent.
+    Processes are asked to terminate, and killed if they are still running after the grace time (s).
+    """
+    processes = tree_processes(pid)[::-1]
+    for process in processes:
+        try:
+            process.terminate()
+        except psutil.NoSuchProcess:
+            continue
+    _, alive = psutil.wait_procs(processes, timeout=grace)
+    for process in alive:
+        try:
+            process.kill()
+        except psutil.NoSuchProcess:
+            continue
+
+
+def stream_lines(stream, lines, prefix, echo):
+    # Read a pipe until the tool closes it, printing each line as it comes
+    for line in stream:
+        lines.append(line)
+        if echo:
+            print(f"{prefix}{line}", end="" if line.endswith("\n") else "\n", flush=True)
+    stream.close()
+
+
+def run_tool(command, timeout=0, max_memory=0, cancel=None, prefix="", echo=True, cwd=None, poll_interval=0.5):
+    """
+    Run an external tool with its output streamed to the log, within a wall clock and memory limit.
+    :param command:  The executable and its arguments
+    :param timeout:  Wall clock limit (s), 0 for none
+    :param max_memory:  Limit (bytes) on the resident memory of the tool and the processes it starts, 0 for none
+    :param cancel:  A threading.Event that stops the tool when set, cancel_event by default
+    :param prefix:  Put before each printed line, to tell tools running at once apart
+    :param echo:  Print the output as it comes, otherwise it is only returned
+    :return: result:  Dictionary of 'command', 'status' ('DONE', 'FAIL', 'TIMEOUT', 'MEMORY', 'CANCELLED' or
+        'NOT FOUND'), 'returncode', 'duration_s', 'peak_rss_mb', 'stdout' and 'stderr'
+    """
+    cancel = cancel_event if cancel is None else cancel
+    result = {'command': " ".join(str(part) for part in command), 'status': 'DONE', 'returncode': None,
+              'duration_s': 0.0, 'peak_rss_mb': 0.0, 'stdout': "", 'stderr': ""}
+    if cancel.is_set():
+        result['status'] = 'CANCELLED'
+        return result
+
+    start = time.perf_counter()
+    try:
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, bufsize=1,
+                                   errors="replace", cwd=cwd)
+    except OSError as e:
+        print(f"Error: {e}\n Could not start {command[0]}")
+        result['status'] = 'NOT FOUND'
+        return result
+
+    stdout, stderr = [], []
+    readers = [threading.Thread(target=stream_lines, args=(process.stdout, stdout, prefix, echo), daemon=True),
+               threading.Thread(target=stream_lines, args=(process.stderr, stderr, prefix, echo), daemon=True)]
+    for reader in readers:
+        reader.start()
+
+    peak_rss = 0
+    while process.poll() is None:
+        peak_rss = max(peak_rss, tree_rss(process.pid))
+        if cancel.is_set():
+            result['status'] = 'CANCELLED'
+        elif timeout and time.perf_counter() - start > timeout:
+            result['status'] = 'TIMEOUT'
+        elif max_memory and peak_rss > max_memory:
+            result['status'] = 'MEMORY'
+        if result['status'] != 'DONE':
+            print(f"{prefix}Stopping {command[0]}: {result['status'].lower()} after {time.perf_counter() - start:.0f} s, "
+                  f"{peak_rss / 2 ** 20:.0f} MB in use")
+            kill_tree(process.pid)
+            break
+        cancel.wait(poll_interval)  # Sleeps between checks, but wakes at once on cancel
+
+    process.wait()
+    for reader in readers:
+        reader.join()
+    result['returncode'] = process.returncode
+    if result['status'] == 'DONE' and process.returncode != 0:
+        result['status'] = 'FAIL'
+    result['duration_s'] = round(time.perf_counter() - start, 3)
+    result['peak_rss_mb'] = round(peak_rss / 2 ** 20, 1)
+    result['stdout'], result['stderr'] = "".join(stdout), "".join(stderr)
+    return result
@@ -252,7 +252,7 @@ def local_func(mapdl):
     # Find the max and min node in the x direction along the shaft.
     x1_max = mapdl.get_value("node", "", "MXLOC", "x")
     x1_min = mapdl.get_value("node", "", "MNLOC", "x")
-    l1 = x1_max - x1_min  # Length of the shaft in the x direction
+    l1 = x1_max - x1_min if var_ins.l == "" else var_ins.l  # Length of the shaft in the x direction
     # Use origin as the mid-point of the resulting segment.
     x1_upper = l1 * var_ins.pc / 2  # Upper bound of the segment
     x1_lower = -l1 * var_ins.pc / 2  # Lower bound of the segment
@@ -391,7 +391,7 @@ def init_func(value, mapdl):
         x_max = mapdl.get_value("node", "", "MXLOC", "x")  # Finds the maximum x value of the bone
         x_min = mapdl.get_value("node", "", "MNLOC", "x")  # Finds the minimum x value of the bone
 
-        l = x_max - x_min  # Length of the bone in the x direction
+        l = x_max - x_min if var_ins.l == "" else var_ins.l  # Length of the bone in the x direction
 
         # Use origin as the mid-point of the resulting segment.
         var_ins.x_upper = l * var_ins.pc / 2  # Upper bound of the segment
@@ -666,19 +666,28 @@ def bending():
         core_libs.ldmk_funcs.find_landmarks(var_ins)
         print("Landmarks found using auto landmark function")
 
-    mapdl = launch_mapdl(nproc=gui_ins.core_count, additional_switches='-smp', loglevel="WARNING", print_com=True,
-                         cleanup_on_exit=True)
-    mapdl.clear()
-    file_path = glob.glob(f"{var_ins.working_dir}/{var_ins.id}*")[0].replace("\\", "/")
+    model_paths = [path for path in glob.glob(f"{var_ins.working_dir}/{var_ins.id}*")
+                   if not path.endswith(core_libs.stl_crop.shaft_length_suffix)]
+    file_path = model_paths[0].replace("\\", "/")
     file, file_extension = os.path.splitext(file_path)
+    # A model meshed from an STL cropped to the mid-shaft is shorter than the bone, so the bone length stored with
+    # that mesh is used instead
+    var_ins.l = core_libs.stl_crop.read_shaft_length(file_path)
+    if var_ins.l == "" and core_libs.stl_crop.is_cropped_mesh(file_path):
+        print(f"Error: {file_path} was meshed from an STL cropped to the mid-shaft, but its bone length "
+              f"{core_libs.stl_crop.shaft_length_path(file_path)} was not found.\n Copy the file saved with the mesh "
+              f"into {var_ins.working_dir}, the segment kept would otherwise be taken from the cropped length.")
+        return
+
+    mapdl = launch_mapdl(exec_file=core_libs.ansys_paths.mapdl_exec_file(), nproc=gui_ins.core_count, additional_switches='-smp',
+                         loglevel="WARNING", print_com=True, cleanup_on_exit=True)
+    mapdl.clear()
 
     match file_extension.lower():
         case ".db":
-            file = os.path.splitext(glob.glob(f'{var_ins.working_dir}/{var_ins.id}*')[0].replace("\\", "/"))[0]
             print(f"File: {file}")
             mapdl.resume(file, 'db', '', 0)  # Loads the *.db file for running ANSYS
         case ".cdb":
-            file = os.path.splitext(glob.glob(f'{var_ins.working_dir}/{var_ins.id}*')[0].replace("\\", "/"))[0]
             print(f"File: {file}")
             mapdl.cdread('DB', file, 'cdb')  # Loads the *.cdb file for running ANSYS
         case _:
@@ -0,0 +1,293 @@
+"""
+================================================================================================================
+Python script to screen the 4-point bending strength of a femur with beam theory, before the full FEM sweep
+================================================================================================================
+    Created by G.H. Allison, University of Sheffield, Sheffield, United Kingdom.
+    Copyright (C) 2024 George H. Allison
+    Contact: ghallison1@sheffield.ac.uk or xinshan.li@sheffield.ac.uk
+----------------------------------------------------------------------------------------------------------------
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+________________________________________________________________________________________________________________
+"""
+
+import os
+import time
+import numpy as np
+from PyQt6.QtWidgets import QApplication
+import core_libs
+from core_libs import *
+
+var_ins = core_libs.ansys_vars.FemVariables()
+gui_ins = core_libs.gui_vars.GuiVariables()
+
+
+def get_name():
+    return "Beam Theory Bending Screen"
+
+
+def gui_elements():
+    gui_structure = {
+        'type': 'QVBoxLayout',  # Top-level layout
+        'items': [
+            {
+                'type': 'QHBoxLayout',  # Nested layout
+                'items': [
+                    {
+                        'type': 'QLabel',
+                        'text': 'Bonemat Mesh File (optional):'
+                    },
+                    {
+                        'type': 'QLineEdit',
+                        'obname': 'modulicdb',
+                        'placeholder': 'Material mapped cdb file, leave empty for a homogeneous bone',
+                        'text': var_ins.moduli_cdb,
+                        'slots': {
+                            'valueChanged': (
+                                'moduli_cdb', var_ins, lambda value: core_libs.gui_funcs.on_value_changed(value, var_ins, 'moduli_cdb')
+                            )
+                        }
+                    },
+                    {
+                        'type': 'QPushButton',
+                        'text': 'Browse',
+                        'slots': {
+                            'clicked':
+                                lambda: core_libs.gui_funcs.browse_file_path('Select Bonemat Mesh File', var_ins, 'moduli_cdb', 'ANSYS CDB Files (*.cdb);;All Files (*)', 'modulicdb', QApplication.instance().main_window)
+                        }
+                    }
+                ]
+            },
+            {
+                'type': 'QHBoxLayout',  # Nested layout
+                'items': [
+                    {
+                        'type': 'QLabel',
+                        'text': 'Landmark Directory (optional):'
+                    },
+                    {
+                        'type': 'QLineEdit',
+                        'obname': 'ldmkdir',
+                        'placeholder': 'Directory holding a landmarks folder, leave empty to find them automatically',
+                        'text': var_ins.working_dir,
+                        'slots': {
+                            'valueChanged': (
+                                'working_dir', var_ins, lambda value: core_libs.gui_funcs.on_value_changed(value, var_ins, 'working_dir')
+                            )
+                        }
+                    },
+                    {
+                        'type': 'QPushButton',
+                        'text': 'Browse',
+                        'slots': {
+                            'clicked':
+                                lambda: core_libs.gui_funcs.browse_dir_path('Select Landmark Directory', var_ins, 'working_dir', 'ldmkdir', QApplication.instance().main_window)
+                        }
+                    }
+                ]
+            },
+            {
+                'type': 'QHBoxLayout',  # Nested layout
+                'items': [
+                    {
+                        'type': 'QLabel',
+                        'text': 'Force (N):'
+                    },
+                    {
+                        'type': 'QDoubleSpinBox',
+                        'min': 0,
+                        'max': 100000,
+                        'value': var_ins.F,
+                        'step': 1,
+                        'dp': 2,
+                        'slots': {
+                            'valueChanged': (
+                                'F', var_ins, lambda value: core_libs.gui_funcs.on_value_changed(value, var_ins, 'F')
+                            )
+                        }
+                    }
+                ]
+            },
+            {
+                'type': 'QHBoxLayout',  # Nested layout
+                'items': [
+                    {
+                        'type': 'QLabel',
+                        'text': 'Angle Increment (deg):'
+                    },
+                    {
+                        'type': 'QDoubleSpinBox',
+                        'min': 0,
+                        'max': 360,
+                        'value': var_ins.angle_inc,
+                        'step': 10,
+                        'dp': 2,
+                        'slots': {
+                            'valueChanged': (
+                                'angle_inc', var_ins, lambda value: core_libs.gui_funcs.on_value_changed(value, var_ins, 'angle_inc')
+                            )
+                        }
+                    }
+                ]
+            },
+            {
+                'type': 'QHBoxLayout',  # Nested layout
+                'items': [
+                    {
+                        'type': 'QLabel',
+                        'text': 'Percentage of Remaining Segment:'
+                    },
+                    {
+                        'type': 'QDoubleSpinBox',
+                        'min': 0,
+                        'max': 1,
+                        'value': var_ins.pc,
+                        'step': 0.05,
+                        'dp': 2,
+                        'slots': {
+                            'valueChanged': (
+                                'pc', var_ins, lambda value: core_libs.gui_funcs.on_value_changed(value, var_ins, 'pc')
+                            )
+                        }
+                    }
+                ]
+            },
+            {
+                'type': 'QHBoxLayout',  # Nested layout
+                'items': [
+                    {
+                        'type': 'QLabel',
+                        'text': 'Proportion of mid-segment to apply force:'
+                    },
+                    {
+                        'type': 'QDoubleSpinBox',
+                        'min': 0,
+                        'max': 1,
+                        'value': var_ins.pf,
+                        'step': 0.05,
+                        'dp': 2,
+                        'slots': {
+                            'valueChanged': (
+                                'pf', var_ins, lambda value: core_libs.gui_funcs.on_value_changed(value, var_ins, 'pf')
+                            )
+                        }
+                    }
+                ]
+            },
+            {
+                'type': 'QHBoxLayout',  # Nested layout
+                'items': [
+                    {
+                        'type': 'QLabel',
+                        'text': 'Homogeneous Modulus (MPa):'
+                    },
+                    {
+                        'type': 'QDoubleSpinBox',
+                        'min': 1,
+                        'max': 100000,
+                        'value': var_ins.screen_modulus,
+                        'step': 500,
+                        'dp': 1,
+                        'slots': {
+                            'valueChanged': (
+                                'screen_modulus', var_ins, lambda value: core_libs.gui_funcs.on_value_changed(value, var_ins, 'screen_modulus')
+                            )
+                        }
+                    }
+                ]
+            },
+            {
+                'type': 'QHBoxLayout',  # Nested layout
+                'items': [
+                    {
+                        'type': 'QLabel',
+                        'text': 'Number of Cross-Sections:'
+                    },
+                    {
+                        'type': 'QSpinBox',
+                        'min': 1,
+                        'max': 1000,
+                        'value': var_ins.screen_slices,
+                        'step': 1,
+                        'slots': {
+                            'valueChanged': (
+                                'screen_slices', var_ins, lambda value: core_libs.gui_funcs.on_value_changed(value, var_ins, 'screen_slices')
+                            )
+                        }
+                    }
+                ]
+            },
+            {
+                'type': 'QPushButton',
+                'text': 'Beam Theory Screening',
+                'slots': {
+                    'clicked': lambda: core_libs.gui_funcs.gen_thread_worker(screening, gui_ins.core_count)
+                }
+            }
+        ]
+    }
+    return gui_structure
+
+
+def screening():
+    start = time.perf_counter()
+    var_ins.output_dir = core_libs.gui_funcs.dir_check_and_make('screening', gui_ins.save_path)  # Creates output directory
+
+    # The bone is screened in the frame of the FEM model, which Bonemat may have rotated about z
+    surface = core_libs.surf_mesh.load_surface_mesh(gui_ins.stl_path, gui_ins.save_path)
+    if gui_ins.bm_rot:
+        surface = surface.transformed(np.diag([-1.0, -1.0, 1.0]))
+
+    landmarks_dir = os.path.join(var_ins.working_dir, 'landmarks')
+    if var_ins.working_dir and os.path.exists(landmarks_dir) and os.listdir(landmarks_dir):
+        for file_name in os.listdir(landmarks_dir):
+            core_libs.ldmk_funcs.read_landmark_file(os.path.join(landmarks_dir, file_name), var_ins)
+        print(f"Landmarks read from files")
+    else:
+        core_libs.ldmk_funcs.find_landmarks(var_ins)
+        print("Landmarks found using auto landmark function")
+
+    # A cropped STL is shorter than the bone, so the bone length stored beside it is used instead
+    var_ins.l = core_libs.stl_crop.read_shaft_length(gui_ins.stl_path)
+
+    moduli = None
+    if var_ins.moduli_cdb:
+        try:
+            moduli = core_libs.beam_funcs.read_cdb_moduli(var_ins.moduli_cdb)
+            print(f"Bonemat moduli read for {moduli[1].shape[0]} elements from {var_ins.moduli_cdb}")
+        except Exception as e:
+            print(f"Error: {e}\n Could not read the Bonemat moduli, a homogeneous modulus of {var_ins.screen_modulus} MPa is used")
+
+    step = int(360 / var_ins.angle_inc) if var_ins.angle_inc not in (0, 360) else 1
+    angles = np.arange(step) * var_ins.angle_inc
+    results = core_libs.beam_funcs.screen_bending(
+        surface, var_ins.middle, var_ins.distal, var_ins.proximal, var_ins.F, var_ins.pc, var_ins.pf, angles,
+        var_ins.l, var_ins.screen_slices, var_ins.screen_modulus, moduli, var_ins.screen_cell_size,
+        var_ins.esl_tension, var_ins.esl_compression)
+
+    weakest = np.argmin(results['Force to Failure (N)'])
+    print(f"Average Force to Failure: {np.mean(results['Force to Failure (N)'])} N")
+    print(f"Average Moment to Failure: {np.mean(results['Moment to Failure (Nm)'])} Nm")
+    print(f"Weakest orientation: {results['Angle'][weakest]} deg, {results['Force to Failure (N)'][weakest]} N "
+          f"({results['Fail Type'][weakest]})")
+    np.savetxt(
+        f"{var_ins.output_dir}/Beam_Screen_Bending.csv",
+        results,
+        delimiter=",",
+        fmt="%s",
+        header=','.join(name for name, _ in core_libs.beam_funcs.result_dtype),
+        comments=''
+    )
+    print(f"Beam theory screen finished in {time.perf_counter() - start:.2f} s, saved to {var_ins.output_dir}")
@@ -24,7 +24,6 @@ ________________________________________________________________________________
 """
 
 import os
-import subprocess
 import glob
 from PyQt6.QtWidgets import QApplication
 import core_libs
@@ -130,6 +129,45 @@ def gui_elements():
                     }
                 ]
             },
+            {
+                'type': 'QHBoxLayout',  # Nested layout
+                'items': [
+                    {
+                        'type': 'QLabel',
+                        'text': 'Time Limit (min, 0 = None):'
+                    },
+                    {
+                        'type': 'QDoubleSpinBox',
+                        'min': 0,
+                        'max': 10000,
+                        'value': var_ins.time_limit,
+                        'step': 5,
+                        'dp': 1,
+                        'slots': {
+                            'valueChanged': (
+                                'time_limit', var_ins, lambda value: core_libs.gui_funcs.on_value_changed(value, var_ins, 'time_limit')
+                            )
+                        }
+                    },
+                    {
+                        'type': 'QLabel',
+                        'text': 'Memory Limit (GB, 0 = None):'
+                    },
+                    {
+                        'type': 'QDoubleSpinBox',
+                        'min': 0,
+                        'max': 1024,
+                        'value': var_ins.memory_limit,
+                        'step': 1,
+                        'dp': 1,
+                        'slots': {
+                            'valueChanged': (
+                                'memory_limit', var_ins, lambda value: core_libs.gui_funcs.on_value_changed(value, var_ins, 'memory_limit')
+                            )
+                        }
+                    }
+                ]
+            },
             {
                 'type': 'QPushButton',
                 'text': 'Bonemat Material Application',
@@ -153,10 +191,20 @@ def auto_bonemat():
         arg3 = var_ins.config_path
         arg4 = f"{gui_ins.save_path}/{filename_without_extension}-mat.cdb"
 
-        # Run the subprocess
-        bone = subprocess.run([command, arg1, arg2, arg3, arg4], capture_output=True, text=True)
-        print(bone.stdout)
-        print(bone.stderr)
-        print("Auto Bonemat has finished successfully!")
+        # Remove the output of an earlier run first, so only a file written by this run counts as success
+        if os.path.exists(arg4):
+            os.remove(arg4)
+
+        # Run BonematCLI with its output streamed to the log
+        bone = core_libs.tool_runner.run_tool([command, arg1, arg2, arg3, arg4], var_ins.time_limit * 60,
+                                              var_ins.memory_limit * 2 ** 30)
+        written = os.path.exists(arg4) and os.path.getsize(arg4) > 0
+        if bone['status'] != 'DONE' or not written:
+            print(f"Auto Bonemat has failed: {bone['status'].lower()}, exit code {bone['returncode']} after "
+                  f"{bone['duration_s']} s. {arg4} was {'' if written else 'not '}written.")
+            return False
+        print(f"Auto Bonemat has finished successfully in {bone['duration_s']} s, peak memory {bone['peak_rss_mb']} MB!")
+        return True
     except Exception as e:
         print(f"Error: {e}\n Auto Bonemat has failed to run please check you have files in the correct location")
+        return False
@@ -23,9 +23,11 @@ ANSYS ICEM CFD/APDL Mesher Functions
 ________________________________________________________________________________________________________________
 """
 
+import csv
 import os
 from pathlib import Path
-import subprocess
+import shutil
+from concurrent.futures import ThreadPoolExecutor
 from PyQt6.QtWidgets import QApplication
 from ansys.mapdl.core import launch_mapdl
 import tempfile
@@ -37,6 +39,11 @@ from core_libs import *
 var_ins = core_libs.ansys_vars.MeshVariables()
 gui_ins = core_libs.gui_vars.GuiVariables()
 
+batch_marker = 'PYPECT2S_SPECIMEN'  # Printed by the batch ICEM script around each specimen
+icem_artefacts = ('.inp', '.prj', '.uns')  # Moved back from the scratch folder of each ICEM run
+timing_marker = 'PYPECT2S_TIMING'  # Printed by the ICEM script with the wall time of tetra meshing and smoothing
+timing_columns = ['project', 'sessions', 'threads', 'tetra_s', 'smooth_s', 'icem_s', 'peak_rss_mb', 'tetra_log']
+
 
 def get_name():
     return "ICEM/APDL Mesher"
@@ -127,260 +134,640 @@ def gui_elements():
                     }
                 ]
             },
+            {
+                'type': 'QHBoxLayout',  # Nested layout
+                'items': [
+                    {
+                        'type': 'QLabel',
+                        'text': 'STL Weld Tolerance:'
+                    },
+                    {
+                        'type': 'QDoubleSpinBox',
+                        'min': 0.00,
+                        'max': 1,
+                        'value': var_ins.weld_tol,
+                        'step': 0.0001,
+                        'dp': 5,
+                        'slots': {
+                            'valueChanged': (
+                                'weld_tol', var_ins, lambda value: core_libs.gui_funcs.on_value_changed(value, var_ins, 'weld_tol')
+                            )
+                        }
+                    }
+                ]
+            },
+            {
+                'type': 'QCheckBox',
+                'text': 'Check Self-Intersections',
+                'checked': var_ins.check_self_intersections,
+                'slots': {
+                    'stateChanged': (
+                        'check_self_intersections', var_ins, lambda state: core_libs.gui_funcs.on_state_changed(state, var_ins, 'check_self_intersections')
+                    )
+                }
+            },
+            {
+                'type': 'QCheckBox',
+                'text': 'Auto Repair STL',
+                'checked': var_ins.auto_repair,
+                'slots': {
+                    'stateChanged': (
+                        'auto_repair', var_ins, lambda state: core_libs.gui_funcs.on_state_changed(state, var_ins, 'auto_repair')
+                    )
+                }
+            },
+            {
+                'type': 'QCheckBox',
+                'text': 'Crop to Mid-Shaft',
+                'checked': var_ins.crop_shaft,
+                'slots': {
+                    'stateChanged': (
+                        'crop_shaft', var_ins, lambda state: core_libs.gui_funcs.on_state_changed(state, var_ins, 'crop_shaft')
+                    )
+                }
+            },
+            {
+                'type': 'QHBoxLayout',  # Nested layout
+                'items': [
+                    {
+                        'type': 'QLabel',
+                        'text': 'Percentage of Remaining Segment:'
+                    },
+                    {
+                        'type': 'QDoubleSpinBox',
+                        'min': 0,
+                        'max': 1,
+                        'value': var_ins.crop_pc,
+                        'step': 0.05,
+                        'dp': 2,
+                        'slots': {
+                            'valueChanged': (
+                                'crop_pc', var_ins, lambda value: core_libs.gui_funcs.on_value_changed(value, var_ins, 'crop_pc')
+                            )
+                        }
+                    }
+                ]
+            },
+            {
+                'type': 'QHBoxLayout',  # Nested layout
+                'items': [
+                    {
+                        'type': 'QLabel',
+                        'text': 'Crop Margin:'
+                    },
+                    {
+                        'type': 'QDoubleSpinBox',
+                        'min': 0.00,
+                        'max': 100,
+                        'value': var_ins.crop_margin,
+                        'step': 1.00,
+                        'dp': 1,
+                        'slots': {
+                            'valueChanged': (
+                                'crop_margin', var_ins, lambda value: core_libs.gui_funcs.on_value_changed(value, var_ins, 'crop_margin')
+                            )
+                        }
+                    }
+                ]
+            },
+            {
+                'type': 'QCheckBox',
+                'text': 'Decimate STL',
+                'checked': var_ins.decimate,
+                'slots': {
+                    'stateChanged': (
+                        'decimate', var_ins, lambda state: core_libs.gui_funcs.on_state_changed(state, var_ins, 'decimate')
+                    )
+                }
+            },
+            {
+                'type': 'QHBoxLayout',  # Nested layout
+                'items': [
+                    {
+                        'type': 'QLabel',
+                        'text': 'Max Decimation Deviation:'
+                    },
+                    {
+                        'type': 'QDoubleSpinBox',
+                        'min': 0.00,
+                        'max': 10,
+                        'value': var_ins.max_deviation,
+                        'step': 0.01,
+                        'dp': 3,
+                        'slots': {
+                            'valueChanged': (
+                                'max_deviation', var_ins, lambda value: core_libs.gui_funcs.on_value_changed(value, var_ins, 'max_deviation')
+                            )
+                        }
+                    }
+                ]
+            },
+            {
+                'type': 'QHBoxLayout',  # Nested layout
+                'items': [
+                    {
+                        'type': 'QLabel',
+                        'text': 'ICEM Threads (0 = Share Core Count):'
+                    },
+                    {
+                        'type': 'QSpinBox',
+                        'min': 0,
+                        'max': 256,
+                        'value': var_ins.icem_threads,
+                        'step': 1,
+                        'slots': {
+                            'valueChanged': (
+                                'icem_threads', var_ins, lambda value: core_libs.gui_funcs.on_value_changed(value, var_ins, 'icem_threads')
+                            )
+                        }
+                    }
+                ]
+            },
+            {
+                'type': 'QCheckBox',
+                'text': 'Convert to TET10 without APDL',
+                'checked': var_ins.native_tet10,
+                'slots': {
+                    'stateChanged': (
+                        'native_tet10', var_ins, lambda state: core_libs.gui_funcs.on_state_changed(state, var_ins, 'native_tet10')
+                    )
+                }
+            },
+            {
+                'type': 'QHBoxLayout',  # Nested layout
+                'items': [
+                    {
+                        'type': 'QLabel',
+                        'text': 'ICEM Time Limit per STL (min, 0 = None):'
+                    },
+                    {
+                        'type': 'QDoubleSpinBox',
+                        'min': 0,
+                        'max': 10000,
+                        'value': var_ins.icem_time_limit,
+                        'step': 5,
+                        'dp': 1,
+                        'slots': {
+                            'valueChanged': (
+                                'icem_time_limit', var_ins, lambda value: core_libs.gui_funcs.on_value_changed(value, var_ins, 'icem_time_limit')
+                            )
+                        }
+                    },
+                    {
+                        'type': 'QLabel',
+                        'text': 'Memory Limit (GB, 0 = None):'
+                    },
+                    {
+                        'type': 'QDoubleSpinBox',
+                        'min': 0,
+                        'max': 1024,
+                        'value': var_ins.icem_memory_limit,
+                        'step': 1,
+                        'dp': 1,
+                        'slots': {
+                            'valueChanged': (
+                                'icem_memory_limit', var_ins, lambda value: core_libs.gui_funcs.on_value_changed(value, var_ins, 'icem_memory_limit')
+                            )
+                        }
+                    }
+                ]
+            },
             {
                 'type': 'QPushButton',  # Nested layout
                 'text': 'Mesh STL File',
                 'slots': {
                     'clicked': lambda: core_libs.gui_funcs.gen_thread_worker(run_icem_apdl, gui_ins.core_count)
                 }
+            },
+            {
+                'type': 'QHBoxLayout',  # Nested layout
+                'items': [
+                    {
+                        'type': 'QLabel',
+                        'text': 'Batch STL Folder:'
+                    },
+                    {
+                        'type': 'QLineEdit',
+                        'obname': 'batchstldir',
+                        'placeholder': 'Folder of STL files meshed in batch',
+                        'text': var_ins.batch_stl_dir,
+                        'slots': {
+                            'valueChanged': (
+                                'batch_stl_dir', var_ins, lambda value: core_libs.gui_funcs.on_value_changed(value, var_ins, 'batch_stl_dir')
+                            )
+                        }
+                    },
+                    {
+                        'type': 'QPushButton',
+                        'text': 'Browse',
+                        'slots': {
+                            'clicked':
+                                lambda: core_libs.gui_funcs.browse_dir_path('Select Batch STL Folder', var_ins, 'batch_stl_dir', 'batchstldir', QApplication.instance().main_window)
+                        }
+                    }
+                ]
+            },
+            {
+                'type': 'QHBoxLayout',  # Nested layout
+                'items': [
+                    {
+                        'type': 'QLabel',
+                        'text': 'ICEM Licences for Batch:'
+                    },
+                    {
+                        'type': 'QSpinBox',
+                        'min': 1,
+                        'max': 64,
+                        'value': var_ins.icem_licences,
+                        'step': 1,
+                        'slots': {
+                            'valueChanged': (
+                                'icem_licences', var_ins, lambda value: core_libs.gui_funcs.on_value_changed(value, var_ins, 'icem_licences')
+                            )
+                        }
+                    }
+                ]
+            },
+            {
+                'type': 'QPushButton',  # Nested layout
+                'text': 'Mesh STL Folder',
+                'slots': {
+                    'clicked': lambda: core_libs.gui_funcs.gen_thread_worker(mesh_stl_folder, gui_ins.core_count)
+                }
             }
         ]
     }
     return gui_structure
 
 
-def rpl_paths(stl_path):
+def rpl_paths(stl_path, vari=None, save_path=None):
     """
     ==============================================================================
     Handling ICEM commands outside of the script to not cause issues in running
     ==============================================================================
+    The lines are set on vari, a MeshVariables copy per specimen when meshing in batch, var_ins otherwise.
     """
+    vari = var_ins if vari is None else vari
+    save_path = gui_ins.save_path if save_path is None else save_path
 
-    var_ins.icem_line_3_1 = 'ic_run_application_exec . icemcfd/output-interfaces stl2df {'
-    var_ins.icem_line_3_2 = f"{stl_path}"
-    match var_ins.stl_type:
+    vari.icem_line_3_1 = 'ic_run_application_exec . icemcfd/output-interfaces stl2df {'
+    vari.icem_line_3_2 = f"{stl_path}"
+    match vari.stl_type:
         case 'ASCII':
-            var_ins.icem_line_3_3 = f' "{gui_ins.save_path}/tmpdomain0.uns"  -ascii -fam FAM{var_ins.file_name}'
+            vari.icem_line_3_3 = f' "{save_path}/tmpdomain0.uns"  -ascii -fam FAM{vari.file_name}'
         case 'BINARY':
-            var_ins.icem_line_3_3 = f' "{gui_ins.save_path}/tmpdomain0.uns"  -fam FAM{var_ins.file_name}'
-    var_ins.icem_line_3_4 = '}'
+            vari.icem_line_3_3 = f' "{save_path}/tmpdomain0.uns"  -fam FAM{vari.file_name}'
+    vari.icem_line_3_4 = '}'
 
-    var_ins.icem_line_23_0 = 'ic_uns_update_family_type visible {'
-    match var_ins.stl_type:
+    vari.icem_line_23_0 = 'ic_uns_update_family_type visible {'
+    match vari.stl_type:
         case 'ASCII':
-            var_ins.icem_line_23_1 = f'{var_ins.file_name}.ASCII'
+            vari.icem_line_23_1 = f'{vari.file_name}.ASCII'
         case 'BINARY':
-            var_ins.icem_line_23_1 = f'{var_ins.file_name}'
-    var_ins.icem_line_23_2 = ' ORFN} {TRI_3 !TETRA_4} update 0'
+            vari.icem_line_23_1 = f'{vari.file_name}'
+    vari.icem_line_23_2 = ' ORFN} {TRI_3 !TETRA_4} update 0'
 
-    var_ins.icem_line_25_0 = 'ic_uns_update_family_type visible {'
-    match var_ins.stl_type:
+    vari.icem_line_25_0 = 'ic_uns_update_family_type visible {'
+    match vari.stl_type:
         case 'ASCII':
-            var_ins.icem_line_25_1 = f'{var_ins.file_name}.ASCII'
+            vari.icem_line_25_1 = f'{vari.file_name}.ASCII'
         case 'BINARY':
-            var_ins.icem_line_25_1 = f'{var_ins.file_name}'
-    var_ins.icem_line_25_2 = ' ORFN CREATED_MATERIAL_2} {TRI_3 !TETRA_4} update 0'
-
-    var_ins.icem_line_37_0 = 'ic_save_tetin '
-    var_ins.icem_line_37_1 = f'{var_ins.proj_name}.tin'
-    var_ins.icem_line_37_2 = ' 0 0 {} {} 0 0 1'
-
-    var_ins.icem_line_41_0 = 'ic_save_unstruct '
-    var_ins.icem_line_41_1 = f'{var_ins.proj_name}.uns'
-    var_ins.icem_line_41_2 = ' 1 {} {} {}'
-
-    var_ins.icem_line_76_0 = 'ic_save_tetin '
-    var_ins.icem_line_76_1 = f'{var_ins.proj_name}.tin'
-    var_ins.icem_line_76_2 = ' 0 0 {} {} 0 0 1'
-
-    var_ins.icem_line_79_0 = 'ic_save_unstruct '
-    var_ins.icem_line_79_1 = f'{var_ins.proj_name}.uns'
-    var_ins.icem_line_79_2 = ' 1 {} {} {}'
-
-    var_ins.icem_line_43_0 = f'ic_save_project_file "{gui_ins.save_path}/{var_ins.proj_name}.prj" '
-    var_ins.icem_line_43_1 = '{array\ set\ file_name\ \{ {    catia_dir .} {    parts_dir .} {    domain_loaded 0} {    cart_file_loaded 0} {    cart_file {}} {    domain_saved '
-    var_ins.icem_line_43_2 = f'{var_ins.proj_name}.uns'
-    var_ins.icem_line_43_3 = '} {    archive {}} {    med_replay {}} {    topology_dir .} {    ugparts_dir .} {    icons {{$env(ICEM_ACN)/lib/ai_env/icons} {$env(ICEM_ACN)/lib/va/EZCAD/icons} {$env(ICEM_ACN)/lib/icons} {$env(ICEM_ACN)/lib/va/CABIN/icons}}} {    tetin '
-    var_ins.icem_line_43_4 = f'{var_ins.proj_name}.tin'
-    var_ins.icem_line_43_5 = '} {    family_boco {}} {    prism_params ./George.prism_params} {    iges_dir .} {    solver_params_loaded 0} {    attributes_loaded 0} {    project_lock {}} {    attributes {}} {    domain '
-    var_ins.icem_line_43_6 = f'{var_ins.proj_name}.uns'
-    var_ins.icem_line_43_7 = '} {    domains_dir .} {    settings_loaded 0} {    settings '
-    var_ins.icem_line_43_8 = f'{var_ins.proj_name}.prj'
-    var_ins.icem_line_43_9 = '} {    blocking {}} {    hexa_replay {}} {    transfer_dir .} {    mesh_dir .} {    family_topo {}} {    gemsparts_dir .} {    family_boco_loaded 0} {    tetin_loaded 1} {    project_dir .} {    topo_mulcad_out {}} {    solver_params {}} \} array\ set\ options\ \{ {    expert 1} {    remote_path {}} {    tree_disp_quad 2} {    tree_disp_pyra 0} {    evaluate_diagnostic 0} {    histo_show_default 1} {    select_toggle_corners 0} {    remove_all 0} {    keep_existing_file_names 0} {    record_journal 0} {    edit_wait 0} {    face_mode all} {    select_mode all} {    med_save_emergency_tetin 1} {    user_name George} {    diag_which all} {    uns_warn_if_display 500000} {    bubble_delay 1000} {    external_num 1} {    tree_disp_tri 2} {    apply_all 0} {    temporary_directory {}} {    flood_select_angle 0} {    home_after_load 1} {    project_active 0} {    histo_color_by_quality_default 1} {    undo_logging 1} {    tree_disp_hexa 0} {    histo_solid_default 1} {    host_name DESKTOP-NPPP69T} {    xhidden_full 1} {    replay_internal_editor 1} {    editor {}} {    mouse_color orange} {    clear_undo 1} {    remote_acn {}} {    remote_sh csh} {    tree_disp_penta 0} {    n_processors 1} {    remote_host {}} {    save_to_new 0} {    quality_info Quality} {    tree_disp_node 0} {    med_save_emergency_mesh 1} {    redtext_color red} {    tree_disp_line 0} {    select_edge_mode 0} {    use_dlremote 0} {    max_mesh_map_size 1024} {    show_tris 1} {    remote_user {}} {    enable_idle 0} {    auto_save_views 1} {    max_cad_map_size 512} {    display_origin 0} {    uns_warn_user_if_display 1000000} {    detail_info 0} {    win_java_help 0} {    show_factor 1} {    boundary_mode all} {    clean_up_tmp_files 1} {    auto_fix_uncovered_faces 1} {    med_save_emergency_blocking 1} {    max_binary_tetin 0} {    tree_disp_tetra 0} \} array\ set\ disp_options\ \{ {    uns_dualmesh 0} {    uns_warn_if_display 500000} {    uns_normals_colored 0} {    uns_icons 0} {    uns_locked_elements 0} {    uns_shrink_npos 0} {    uns_node_type None} {    uns_icons_normals_vol 0} {    uns_bcfield 0} {    backup Solid/wire} {    uns_nodes 0} {    uns_only_edges 0} {    uns_surf_bounds 0} {    uns_wide_lines 0} {    uns_vol_bounds 0} {    uns_displ_orient Triad} {    uns_orientation 0} {    uns_directions 0} {    uns_thickness 0} {    uns_shell_diagnostic 0} {    uns_normals 0} {    uns_couplings 0} {    uns_periodicity 0} {    uns_single_surfaces 0} {    uns_midside_nodes 1} {    uns_shrink 100} {    uns_multiple_surfaces 0} {    uns_no_inner 0} {    uns_enums 0} {    uns_disp Wire} {    uns_bcfield_name {}} {    uns_color_by_quality 0} {    uns_changes 0} {    uns_cut_delay_count 1000} \} {set icon_size1 24} {set icon_size2 35} {set thickness_defined 0} {set solver_type 1} {set solver_setup -1} array\ set\ prism_values\ \{ {    n_triangle_smoothing_steps 5} {    min_smoothing_steps 6} {    first_layer_smoothing_steps 1} {    new_volume {}} {    height 0} {    prism_height_limit 0} {    interpolate_heights 0} {    n_tetra_smoothing_steps 10} {    do_checks {}} {    delete_standalone 1} {    ortho_weight 0.50} {    max_aspect_ratio {}} {    ratio_max {}} {    incremental_write 0} {    total_height 0} {    use_prism_v10 0} {    intermediate_write 1} {    delete_base_triangles {}} {    ratio_multiplier {}} {    verbosity_level 1} {    refine_prism_boundary 1} {    max_size_ratio {}} {    triangle_quality {}} {    max_prism_angle 180} {    tetra_smooth_limit 0.30000001} {    max_jump_factor 5} {    use_existing_quad_layers 0} {    layers 3} {    fillet 0.1} {    into_orphan 0} {    init_dir_from_prev {}} {    blayer_2d 0} {    do_not_allow_sticking {}} {    top_family {}} {    law exponential} {    min_smoothing_val 0.1} {    auto_reduction 0} {    max_prism_height_ratio 0} {    stop_columns 1} {    stair_step 1} {    smoothing_steps 12} {    side_family {}} {    min_prism_quality 0.0099999998} {    ratio 1.2} \} {set aie_current_flavor {}} array\ set\ vid_options\ \{ {    auxiliary 0} {    show_name 0} {    inherit 1} {    default_part GEOM} {    new_srf_topo 1} {    DelPerFlag 0} {    composite_tolerance 1.0} {    replace 0} {    same_pnt_tol 1e-4} {    tdv_axes 1} {    vid_mode 0} {    DelBlkPerFlag 0} \} {set savedTreeVisibility {geomNode 2 geomSurfNode 2 meshNode 1 mesh_subsetNode 2 meshShellNode 2 meshTriNode 2 meshVolumeNode 0 meshTetraNode 0 partNode 2 part-CREATED_MATERIAL_2 2 part-'
-    match var_ins.stl_type:
+            vari.icem_line_25_1 = f'{vari.file_name}'
+    vari.icem_line_25_2 = ' ORFN CREATED_MATERIAL_2} {TRI_3 !TETRA_4} update 0'
+
+    vari.icem_line_37_0 = 'ic_save_tetin '
+    vari.icem_line_37_1 = f'{vari.proj_name}.tin'
+    vari.icem_line_37_2 = ' 0 0 {} {} 0 0 1'
+
+    vari.icem_line_41_0 = 'ic_save_unstruct '
+    vari.icem_line_41_1 = f'{vari.proj_name}.uns'
+    vari.icem_line_41_2 = ' 1 {} {} {}'
+
+    vari.icem_line_76_0 = 'ic_save_tetin '
+    vari.icem_line_76_1 = f'{vari.proj_name}.tin'
+    vari.icem_line_76_2 = ' 0 0 {} {} 0 0 1'
+
+    vari.icem_line_79_0 = 'ic_save_unstruct '
+    vari.icem_line_79_1 = f'{vari.proj_name}.uns'
+    vari.icem_line_79_2 = ' 1 {} {} {}'
+
+    vari.icem_line_43_0 = f'ic_save_project_file "{save_path}/{vari.proj_name}.prj" '
+    vari.icem_line_43_1 = '{array\ set\ file_name\ \{ {    catia_dir .} {    parts_dir .} {    domain_loaded 0} {    cart_file_loaded 0} {    cart_file {}} {    domain_saved '
+    vari.icem_line_43_2 = f'{vari.proj_name}.uns'
+    vari.icem_line_43_3 = '} {    archive {}} {    med_replay {}} {    topology_dir .} {    ugparts_dir .} {    icons {{$env(ICEM_ACN)/lib/ai_env/icons} {$env(ICEM_ACN)/lib/va/EZCAD/icons} {$env(ICEM_ACN)/lib/icons} {$env(ICEM_ACN)/lib/va/CABIN/icons}}} {    tetin '
+    vari.icem_line_43_4 = f'{vari.proj_name}.tin'
+    vari.icem_line_43_5 = '} {    family_boco {}} {    prism_params ./George.prism_params} {    iges_dir .} {    solver_params_loaded 0} {    attributes_loaded 0} {    project_lock {}} {    attributes {}} {    domain '
+    vari.icem_line_43_6 = f'{vari.proj_name}.uns'
+    vari.icem_line_43_7 = '} {    domains_dir .} {    settings_loaded 0} {    settings '
+    vari.icem_line_43_8 = f'{vari.proj_name}.prj'
+    vari.icem_line_43_9 = '} {    blocking {}} {    hexa_replay {}} {    transfer_dir .} {    mesh_dir .} {    family_topo {}} {    gemsparts_dir .} {    family_boco_loaded 0} {    tetin_loaded 1} {    project_dir .} {    topo_mulcad_out {}} {    solver_params {}} \} array\ set\ options\ \{ {    expert 1} {    remote_path {}} {    tree_disp_quad 2} {    tree_disp_pyra 0} {    evaluate_diagnostic 0} {    histo_show_default 1} {    select_toggle_corners 0} {    remove_all 0} {    keep_existing_file_names 0} {    record_journal 0} {    edit_wait 0} {    face_mode all} {    select_mode all} {    med_save_emergency_tetin 1} {    user_name George} {    diag_which all} {    uns_warn_if_display 500000} {    bubble_delay 1000} {    external_num 1} {    tree_disp_tri 2} {    apply_all 0} {    temporary_directory {}} {    flood_select_angle 0} {    home_after_load 1} {    project_active 0} {    histo_color_by_quality_default 1} {    undo_logging 1} {    tree_disp_hexa 0} {    histo_solid_default 1} {    host_name DESKTOP-NPPP69T} {    xhidden_full 1} {    replay_internal_editor 1} {    editor {}} {    mouse_color orange} {    clear_undo 1} {    remote_acn {}} {    remote_sh csh} {    tree_disp_penta 0} {    n_processors 1} {    remote_host {}} {    save_to_new 0} {    quality_info Quality} {    tree_disp_node 0} {    med_save_emergency_mesh 1} {    redtext_color red} {    tree_disp_line 0} {    select_edge_mode 0} {    use_dlremote 0} {    max_mesh_map_size 1024} {    show_tris 1} {    remote_user {}} {    enable_idle 0} {    auto_save_views 1} {    max_cad_map_size 512} {    display_origin 0} {    uns_warn_user_if_display 1000000} {    detail_info 0} {    win_java_help 0} {    show_factor 1} {    boundary_mode all} {    clean_up_tmp_files 1} {    auto_fix_uncovered_faces 1} {    med_save_emergency_blocking 1} {    max_binary_tetin 0} {    tree_disp_tetra 0} \} array\ set\ disp_options\ \{ {    uns_dualmesh 0} {    uns_warn_if_display 500000} {    uns_normals_colored 0} {    uns_icons 0} {    uns_locked_elements 0} {    uns_shrink_npos 0} {    uns_node_type None} {    uns_icons_normals_vol 0} {    uns_bcfield 0} {    backup Solid/wire} {    uns_nodes 0} {    uns_only_edges 0} {    uns_surf_bounds 0} {    uns_wide_lines 0} {    uns_vol_bounds 0} {    uns_displ_orient Triad} {    uns_orientation 0} {    uns_directions 0} {    uns_thickness 0} {    uns_shell_diagnostic 0} {    uns_normals 0} {    uns_couplings 0} {    uns_periodicity 0} {    uns_single_surfaces 0} {    uns_midside_nodes 1} {    uns_shrink 100} {    uns_multiple_surfaces 0} {    uns_no_inner 0} {    uns_enums 0} {    uns_disp Wire} {    uns_bcfield_name {}} {    uns_color_by_quality 0} {    uns_changes 0} {    uns_cut_delay_count 1000} \} {set icon_size1 24} {set icon_size2 35} {set thickness_defined 0} {set solver_type 1} {set solver_setup -1} array\ set\ prism_values\ \{ {    n_triangle_smoothing_steps 5} {    min_smoothing_steps 6} {    first_layer_smoothing_steps 1} {    new_volume {}} {    height 0} {    prism_height_limit 0} {    interpolate_heights 0} {    n_tetra_smoothing_steps 10} {    do_checks {}} {    delete_standalone 1} {    ortho_weight 0.50} {    max_aspect_ratio {}} {    ratio_max {}} {    incremental_write 0} {    total_height 0} {    use_prism_v10 0} {    intermediate_write 1} {    delete_base_triangles {}} {    ratio_multiplier {}} {    verbosity_level 1} {    refine_prism_boundary 1} {    max_size_ratio {}} {    triangle_quality {}} {    max_prism_angle 180} {    tetra_smooth_limit 0.30000001} {    max_jump_factor 5} {    use_existing_quad_layers 0} {    layers 3} {    fillet 0.1} {    into_orphan 0} {    init_dir_from_prev {}} {    blayer_2d 0} {    do_not_allow_sticking {}} {    top_family {}} {    law exponential} {    min_smoothing_val 0.1} {    auto_reduction 0} {    max_prism_height_ratio 0} {    stop_columns 1} {    stair_step 1} {    smoothing_steps 12} {    side_family {}} {    min_prism_quality 0.0099999998} {    ratio 1.2} \} {set aie_current_flavor {}} array\ set\ vid_options\ \{ {    auxiliary 0} {    show_name 0} {    inherit 1} {    default_part GEOM} {    new_srf_topo 1} {    DelPerFlag 0} {    composite_tolerance 1.0} {    replace 0} {    same_pnt_tol 1e-4} {    tdv_axes 1} {    vid_mode 0} {    DelBlkPerFlag 0} \} {set savedTreeVisibility {geomNode 2 geomSurfNode 2 meshNode 1 mesh_subsetNode 2 meshShellNode 2 meshTriNode 2 meshVolumeNode 0 meshTetraNode 0 partNode 2 part-CREATED_MATERIAL_2 2 part-'
+    match vari.stl_type:
         case 'ASCII':
-            var_ins.icem_line_40_10 = f'{var_ins.file_name}.ASCII'
+            vari.icem_line_43_10 = f'{vari.file_name}.ASCII'
         case 'BINARY':
-            var_ins.icem_line_40_10 = f'{var_ins.file_name}'
-    var_ins.icem_line_43_11 = ' 2}} {set last_view {rot {0 0 0 1} scale {13.5742371737 13.5742371737 13.5742371737} center {38.77415 -3.3241 -197.3125} pos {0 0 0}}} array\ set\ cut_info\ \{ {    active 0} \} array\ set\ hex_option\ \{ {    default_bunching_ratio 2.0} {    floating_grid 0} {    project_to_topo 0} {    n_tetra_smoothing_steps 20} {    sketching_mode 0} {    trfDeg 1} {    wr_hexa7 0} {    hexa_projection_mode 0} {    smooth_ogrid 0} {    find_worst 1-3} {    hexa_verbose_mode 0} {    old_eparams 0} {    uns_face_mesh_method uniform_quad} {    multigrid_level 0} {    uns_face_mesh one_tri} {    check_blck 0} {    proj_limit 0} {    check_inv 0} {    project_bspline 0} {    hexa_update_mode 1} {    default_bunching_law BiGeometric} {    worse_criterion Quality} \} array\ set\ saved_views\ \{ {    views {}} \}} {ICEM CFD}'
-
-    var_ins.icem_line_87_0 = f'ic_save_project_file "{gui_ins.save_path}/{var_ins.proj_name}.prj" '
-    var_ins.icem_line_87_1 = '{array\ set\ file_name\ \{ {    catia_dir .} {    parts_dir .} {    domain_loaded 0} {    cart_file_loaded 0} {    cart_file {}} {    domain_saved '
-    var_ins.icem_line_87_2 = f'{var_ins.proj_name}.uns'
-    var_ins.icem_line_87_3 = '} {    archive {}} {    med_replay {}} {    topology_dir .} {    ugparts_dir .} {    icons {{$env(ICEM_ACN)/lib/ai_env/icons} {$env(ICEM_ACN)/lib/va/EZCAD/icons} {$env(ICEM_ACN)/lib/icons} {$env(ICEM_ACN)/lib/va/CABIN/icons}}} {    tetin '
-    var_ins.icem_line_87_4 = f'{var_ins.proj_name}.tin'
-    var_ins.icem_line_87_5 = '} {    family_boco '
-    var_ins.icem_line_87_6 = f'{var_ins.proj_name}.fbc'
-    var_ins.icem_line_87_7 = '} {    prism_params ./George.prism_params} {    iges_dir .} {    solver_params_loaded 1} {    attributes_loaded 1} {    project_lock {}} {    attributes '
-    var_ins.icem_line_87_8 = f'{var_ins.proj_name}.atr'
-    var_ins.icem_line_87_9 = '} {    domain '
-    var_ins.icem_line_87_10 = f'{var_ins.proj_name}.uns'
-    var_ins.icem_line_87_11 = '} {    domains_dir .} {    settings_loaded 0} {    settings '
-    var_ins.icem_line_87_12 = f'{var_ins.proj_name}.prj'
-    var_ins.icem_line_87_13 = '} {    blocking {}} {    hexa_replay {}} {    transfer_dir .} {    mesh_dir .} {    family_topo {}} {    gemsparts_dir .} {    family_boco_loaded 1} {    tetin_loaded 1} {    project_dir .} {    topo_mulcad_out {}} {    solver_params '
-    var_ins.icem_line_87_14 = f'{var_ins.proj_name}.par'
-    var_ins.icem_line_87_15 = '} \} array\ set\ options\ \{ {    expert 1} {    remote_path {}} {    tree_disp_quad 2} {    tree_disp_pyra 0} {    evaluate_diagnostic 0} {    histo_show_default 1} {    select_toggle_corners 0} {    remove_all 0} {    keep_existing_file_names 0} {    record_journal 0} {    edit_wait 0} {    face_mode all} {    select_mode all} {    med_save_emergency_tetin 1} {    user_name George} {    diag_which all} {    uns_warn_if_display 500000} {    bubble_delay 1000} {    external_num 1} {    tree_disp_tri 2} {    apply_all 0} {    temporary_directory {}} {    flood_select_angle 0} {    home_after_load 1} {    project_active 0} {    histo_color_by_quality_default 1} {    undo_logging 1} {    tree_disp_hexa 0} {    histo_solid_default 1} {    host_name DESKTOP-NPPP69T} {    xhidden_full 1} {    replay_internal_editor 1} {    editor {}} {    mouse_color orange} {    clear_undo 1} {    remote_acn {}} {    remote_sh csh} {    tree_disp_penta 0} {    n_processors 1} {    remote_host {}} {    save_to_new 0} {    quality_info Quality} {    tree_disp_node 0} {    med_save_emergency_mesh 1} {    redtext_color red} {    tree_disp_line 0} {    select_edge_mode 0} {    use_dlremote 0} {    max_mesh_map_size 1024} {    show_tris 1} {    remote_user {}} {    enable_idle 0} {    auto_save_views 1} {    max_cad_map_size 512} {    display_origin 0} {    uns_warn_user_if_display 1000000} {    detail_info 0} {    win_java_help 0} {    show_factor 1} {    boundary_mode all} {    clean_up_tmp_files 1} {    auto_fix_uncovered_faces 1} {    med_save_emergency_blocking 1} {    max_binary_tetin 0} {    tree_disp_tetra 0} \} array\ set\ disp_options\ \{ {    uns_dualmesh 0} {    uns_warn_if_display 500000} {    uns_normals_colored 0} {    uns_icons 0} {    uns_locked_elements 0} {    uns_shrink_npos 0} {    uns_node_type None} {    uns_icons_normals_vol 0} {    uns_bcfield 0} {    backup Solid/wire} {    uns_nodes 0} {    uns_only_edges 0} {    uns_surf_bounds 0} {    uns_wide_lines 0} {    uns_vol_bounds 0} {    uns_displ_orient Triad} {    uns_orientation 0} {    uns_directions 0} {    uns_thickness 0} {    uns_shell_diagnostic 0} {    uns_normals 0} {    uns_couplings 0} {    uns_periodicity 0} {    uns_single_surfaces 0} {    uns_midside_nodes 1} {    uns_shrink 100} {    uns_multiple_surfaces 0} {    uns_no_inner 0} {    uns_enums 0} {    uns_disp Wire} {    uns_bcfield_name {}} {    uns_color_by_quality 0} {    uns_changes 0} {    uns_cut_delay_count 1000} \} {set icon_size1 24} {set icon_size2 35} {set thickness_defined 0} {set solver_type 1} {set solver_setup 1} array\ set\ prism_values\ \{ {    n_triangle_smoothing_steps 5} {    min_smoothing_steps 6} {    first_layer_smoothing_steps 1} {    new_volume {}} {    height 0} {    prism_height_limit 0} {    interpolate_heights 0} {    n_tetra_smoothing_steps 10} {    do_checks {}} {    delete_standalone 1} {    ortho_weight 0.50} {    max_aspect_ratio {}} {    ratio_max {}} {    incremental_write 0} {    total_height 0} {    use_prism_v10 0} {    intermediate_write 1} {    delete_base_triangles {}} {    ratio_multiplier {}} {    verbosity_level 1} {    refine_prism_boundary 1} {    max_size_ratio {}} {    triangle_quality {}} {    max_prism_angle 180} {    tetra_smooth_limit 0.30000001} {    max_jump_factor 5} {    use_existing_quad_layers 0} {    layers 3} {    fillet 0.1} {    into_orphan 0} {    init_dir_from_prev {}} {    blayer_2d 0} {    do_not_allow_sticking {}} {    top_family {}} {    law exponential} {    min_smoothing_val 0.1} {    auto_reduction 0} {    max_prism_height_ratio 0} {    stop_columns 1} {    stair_step 1} {    smoothing_steps 12} {    side_family {}} {    min_prism_quality 0.0099999998} {    ratio 1.2} \} {set aie_current_flavor {}} array\ set\ vid_options\ \{ {    auxiliary 0} {    show_name 0} {    inherit 1} {    default_part GEOM} {    new_srf_topo 1} {    DelPerFlag 0} {    composite_tolerance 1.0} {    replace 0} {    same_pnt_tol 1e-4} {    tdv_axes 1} {    vid_mode 0} {    DelBlkPerFlag 0} \} {set savedTreeVisibility {geomNode 2 geomSurfNode 2 meshNode 1 mesh_subsetNode 2 meshShellNode 2 meshTriNode 2 meshVolumeNode 0 meshTetraNode 0 partNode 2 part-CREATED_MATERIAL_2 2 part-'
-    match var_ins.stl_type:
+            vari.icem_line_43_10 = f'{vari.file_name}'
+    vari.icem_line_43_11 = ' 2}} {set last_view {rot {0 0 0 1} scale {13.5742371737 13.5742371737 13.5742371737} center {38.77415 -3.3241 -197.3125} pos {0 0 0}}} array\ set\ cut_info\ \{ {    active 0} \} array\ set\ hex_option\ \{ {    default_bunching_ratio 2.0} {    floating_grid 0} {    project_to_topo 0} {    n_tetra_smoothing_steps 20} {    sketching_mode 0} {    trfDeg 1} {    wr_hexa7 0} {    hexa_projection_mode 0} {    smooth_ogrid 0} {    find_worst 1-3} {    hexa_verbose_mode 0} {    old_eparams 0} {    uns_face_mesh_method uniform_quad} {    multigrid_level 0} {    uns_face_mesh one_tri} {    check_blck 0} {    proj_limit 0} {    check_inv 0} {    project_bspline 0} {    hexa_update_mode 1} {    default_bunching_law BiGeometric} {    worse_criterion Quality} \} array\ set\ saved_views\ \{ {    views {}} \}} {ICEM CFD}'
+
+    vari.icem_line_87_0 = f'ic_save_project_file "{save_path}/{vari.proj_name}.prj" '
+    vari.icem_line_87_1 = '{array\ set\ file_name\ \{ {    catia_dir .} {    parts_dir .} {    domain_loaded 0} {    cart_file_loaded 0} {    cart_file {}} {    domain_saved '
+    vari.icem_line_87_2 = f'{vari.proj_name}.uns'
+    vari.icem_line_87_3 = '} {    archive {}} {    med_replay {}} {    topology_dir .} {    ugparts_dir .} {    icons {{$env(ICEM_ACN)/lib/ai_env/icons} {$env(ICEM_ACN)/lib/va/EZCAD/icons} {$env(ICEM_ACN)/lib/icons} {$env(ICEM_ACN)/lib/va/CABIN/icons}}} {    tetin '
+    vari.icem_line_87_4 = f'{vari.proj_name}.tin'
+    vari.icem_line_87_5 = '} {    family_boco '
+    vari.icem_line_87_6 = f'{vari.proj_name}.fbc'
+    vari.icem_line_87_7 = '} {    prism_params ./George.prism_params} {    iges_dir .} {    solver_params_loaded 1} {    attributes_loaded 1} {    project_lock {}} {    attributes '
+    vari.icem_line_87_8 = f'{vari.proj_name}.atr'
+    vari.icem_line_87_9 = '} {    domain '
+    vari.icem_line_87_10 = f'{vari.proj_name}.uns'
+    vari.icem_line_87_11 = '} {    domains_dir .} {    settings_loaded 0} {    settings '
+    vari.icem_line_87_12 = f'{vari.proj_name}.prj'
+    vari.icem_line_87_13 = '} {    blocking {}} {    hexa_replay {}} {    transfer_dir .} {    mesh_dir .} {    family_topo {}} {    gemsparts_dir .} {    family_boco_loaded 1} {    tetin_loaded 1} {    project_dir .} {    topo_mulcad_out {}} {    solver_params '
+    vari.icem_line_87_14 = f'{vari.proj_name}.par'
+    vari.icem_line_87_15 = '} \} array\ set\ options\ \{ {    expert 1} {    remote_path {}} {    tree_disp_quad 2} {    tree_disp_pyra 0} {    evaluate_diagnostic 0} {    histo_show_default 1} {    select_toggle_corners 0} {    remove_all 0} {    keep_existing_file_names 0} {    record_journal 0} {    edit_wait 0} {    face_mode all} {    select_mode all} {    med_save_emergency_tetin 1} {    user_name George} {    diag_which all} {    uns_warn_if_display 500000} {    bubble_delay 1000} {    external_num 1} {    tree_disp_tri 2} {    apply_all 0} {    temporary_directory {}} {    flood_select_angle 0} {    home_after_load 1} {    project_active 0} {    histo_color_by_quality_default 1} {    undo_logging 1} {    tree_disp_hexa 0} {    histo_solid_default 1} {    host_name DESKTOP-NPPP69T} {    xhidden_full 1} {    replay_internal_editor 1} {    editor {}} {    mouse_color orange} {    clear_undo 1} {    remote_acn {}} {    remote_sh csh} {    tree_disp_penta 0} {    n_processors 1} {    remote_host {}} {    save_to_new 0} {    quality_info Quality} {    tree_disp_node 0} {    med_save_emergency_mesh 1} {    redtext_color red} {    tree_disp_line 0} {    select_edge_mode 0} {    use_dlremote 0} {    max_mesh_map_size 1024} {    show_tris 1} {    remote_user {}} {    enable_idle 0} {    auto_save_views 1} {    max_cad_map_size 512} {    display_origin 0} {    uns_warn_user_if_display 1000000} {    detail_info 0} {    win_java_help 0} {    show_factor 1} {    boundary_mode all} {    clean_up_tmp_files 1} {    auto_fix_uncovered_faces 1} {    med_save_emergency_blocking 1} {    max_binary_tetin 0} {    tree_disp_tetra 0} \} array\ set\ disp_options\ \{ {    uns_dualmesh 0} {    uns_warn_if_display 500000} {    uns_normals_colored 0} {    uns_icons 0} {    uns_locked_elements 0} {    uns_shrink_npos 0} {    uns_node_type None} {    uns_icons_normals_vol 0} {    uns_bcfield 0} {    backup Solid/wire} {    uns_nodes 0} {    uns_only_edges 0} {    uns_surf_bounds 0} {    uns_wide_lines 0} {    uns_vol_bounds 0} {    uns_displ_orient Triad} {    uns_orientation 0} {    uns_directions 0} {    uns_thickness 0} {    uns_shell_diagnostic 0} {    uns_normals 0} {    uns_couplings 0} {    uns_periodicity 0} {    uns_single_surfaces 0} {    uns_midside_nodes 1} {    uns_shrink 100} {    uns_multiple_surfaces 0} {    uns_no_inner 0} {    uns_enums 0} {    uns_disp Wire} {    uns_bcfield_name {}} {    uns_color_by_quality 0} {    uns_changes 0} {    uns_cut_delay_count 1000} \} {set icon_size1 24} {set icon_size2 35} {set thickness_defined 0} {set solver_type 1} {set solver_setup 1} array\ set\ prism_values\ \{ {    n_triangle_smoothing_steps 5} {    min_smoothing_steps 6} {    first_layer_smoothing_steps 1} {    new_volume {}} {    height 0} {    prism_height_limit 0} {    interpolate_heights 0} {    n_tetra_smoothing_steps 10} {    do_checks {}} {    delete_standalone 1} {    ortho_weight 0.50} {    max_aspect_ratio {}} {    ratio_max {}} {    incremental_write 0} {    total_height 0} {    use_prism_v10 0} {    intermediate_write 1} {    delete_base_triangles {}} {    ratio_multiplier {}} {    verbosity_level 1} {    refine_prism_boundary 1} {    max_size_ratio {}} {    triangle_quality {}} {    max_prism_angle 180} {    tetra_smooth_limit 0.30000001} {    max_jump_factor 5} {    use_existing_quad_layers 0} {    layers 3} {    fillet 0.1} {    into_orphan 0} {    init_dir_from_prev {}} {    blayer_2d 0} {    do_not_allow_sticking {}} {    top_family {}} {    law exponential} {    min_smoothing_val 0.1} {    auto_reduction 0} {    max_prism_height_ratio 0} {    stop_columns 1} {    stair_step 1} {    smoothing_steps 12} {    side_family {}} {    min_prism_quality 0.0099999998} {    ratio 1.2} \} {set aie_current_flavor {}} array\ set\ vid_options\ \{ {    auxiliary 0} {    show_name 0} {    inherit 1} {    default_part GEOM} {    new_srf_topo 1} {    DelPerFlag 0} {    composite_tolerance 1.0} {    replace 0} {    same_pnt_tol 1e-4} {    tdv_axes 1} {    vid_mode 0} {    DelBlkPerFlag 0} \} {set savedTreeVisibility {geomNode 2 geomSurfNode 2 meshNode 1 mesh_subsetNode 2 meshShellNode 2 meshTriNode 2 meshVolumeNode 0 meshTetraNode 0 partNode 2 part-CREATED_MATERIAL_2 2 part-'
+    match vari.stl_type:
         case 'ASCII':
-            var_ins.icem_line_87_16 = f'{var_ins.file_name}.ASCII'
+            vari.icem_line_87_16 = f'{vari.file_name}.ASCII'
         case 'BINARY':
-            var_ins.icem_line_87_16 = f'{var_ins.file_name}'
-    var_ins.icem_line_87_17 = ' 2}} {set last_view {rot {0 0 0 1} scale {13.5742371737 13.5742371737 13.5742371737} center {38.77415 -3.3241 -197.3125} pos {0 0 0}}} array\ set\ cut_info\ \{ {    active 0} \} array\ set\ hex_option\ \{ {    default_bunching_ratio 2.0} {    floating_grid 0} {    project_to_topo 0} {    n_tetra_smoothing_steps 20} {    sketching_mode 0} {    trfDeg 1} {    wr_hexa7 0} {    hexa_projection_mode 0} {    smooth_ogrid 0} {    find_worst 1-3} {    hexa_verbose_mode 0} {    old_eparams 0} {    uns_face_mesh_method uniform_quad} {    multigrid_level 0} {    uns_face_mesh one_tri} {    check_blck 0} {    proj_limit 0} {    check_inv 0} {    project_bspline 0} {    hexa_update_mode 1} {    default_bunching_law BiGeometric} {    worse_criterion Quality} \} array\ set\ saved_views\ \{ {    views {}} \}} {ICEM CFD}'
+            vari.icem_line_87_16 = f'{vari.file_name}'
+    vari.icem_line_87_17 = ' 2}} {set last_view {rot {0 0 0 1} scale {13.5742371737 13.5742371737 13.5742371737} center {38.77415 -3.3241 -197.3125} pos {0 0 0}}} array\ set\ cut_info\ \{ {    active 0} \} array\ set\ hex_option\ \{ {    default_bunching_ratio 2.0} {    floating_grid 0} {    project_to_topo 0} {    n_tetra_smoothing_steps 20} {    sketching_mode 0} {    trfDeg 1} {    wr_hexa7 0} {    hexa_projection_mode 0} {    smooth_ogrid 0} {    find_worst 1-3} {    hexa_verbose_mode 0} {    old_eparams 0} {    uns_face_mesh_method uniform_quad} {    multigrid_level 0} {    uns_face_mesh one_tri} {    check_blck 0} {    proj_limit 0} {    check_inv 0} {    project_bspline 0} {    hexa_update_mode 1} {    default_bunching_law BiGeometric} {    worse_criterion Quality} \} array\ set\ saved_views\ \{ {    views {}} \}} {ICEM CFD}'
 
-    var_ins.icem_line_88_1 = 'ic_exec {'
-    var_ins.icem_line_88_2 = f'{((Path(var_ins.icem_path).parents[1]).joinpath("icemcfd", "output-interfaces", "ansys.exe"))}'
-    var_ins.icem_line_88_3 = '} '
-    var_ins.icem_line_88_4 = f'-dom {var_ins.proj_name}.uns -atr "{gui_ins.save_path}/{var_ins.proj_name}.fluentAnsys.fbc" -par "{gui_ins.save_path}/{var_ins.proj_name}.fluentAnsys.par" "{gui_ins.save_path}/{var_ins.proj_name}.inp" -use_blocks -make_comp -no_bar -no_shell'
+    vari.icem_line_88_1 = 'ic_exec {'
+    vari.icem_line_88_2 = vari.icem_ansys_path or f'{((Path(vari.icem_path).parents[1]).joinpath("icemcfd", "output-interfaces", "ansys.exe"))}'
+    vari.icem_line_88_3 = '} '
+    vari.icem_line_88_4 = f'-dom {vari.proj_name}.uns -atr "{save_path}/{vari.proj_name}.fluentAnsys.fbc" -par "{save_path}/{vari.proj_name}.fluentAnsys.par" "{save_path}/{vari.proj_name}.inp" -use_blocks -make_comp -no_bar -no_shell'
 
 
-def find_icem_path():
-    for folder, subfolders, files in os.walk(var_ins.root_dir):
-        for file in files:
-            if file == 'icemcfd.bat':
-                return os.path.abspath(os.path.join(folder, file))
-    return None
+def find_icem_path(refresh=False):
+    paths = core_libs.ansys_paths.find_ansys(var_ins.root_dir, refresh)
+    if paths['icem_output']:
+        var_ins.icem_ansys_path = paths['icem_output']
+    return paths['icem']
 
 
 def auto_icem_path():
     try:
-        try:
-            var_ins.icem_path = find_icem_path()
-            print(f'Path to icemcfd.bat found: {var_ins.icem_path}')
-            core_libs.gui_funcs.update_line_edit(var_ins.icem_path, 'icemdir', QApplication.instance().main_window)
-            #var_ins.icem_ansys_path = (((Path(var_ins.icem_path).parents[1]).joinpath('icemcfd', 'output-interfaces', 'ansys.exe')))
-        except:
-            print('Standard Auto-Find Method, failed. Falling back to alternate method.')
-            base_ansys_dir = 'C:/Program Files/Ansys Inc/'
-            directories = [os.path.join(base_ansys_dir, d) for d in os.listdir(base_ansys_dir) if os.path.isdir(os.path.join(base_ansys_dir, d))]
-            directories = [d for d in directories if d.startswith(os.path.join(base_ansys_dir, 'v'))]
-            for d in directories:
-                paths = glob.glob(os.path.join(d, 'icemcfd', 'win64_amd', 'bin', 'icemcfd.bat'))
-                if paths:
-                    var_ins.icem_path = paths[0]
-                    print(f'Path to icemcfd.bat found: {var_ins.icem_path}')
-                    core_libs.gui_funcs.update_line_edit(var_ins.icem_path, 'icemdir', QApplication.instance().main_window)
-                    #var_ins.icem_ansys_path = (((Path(var_ins.icem_path).parents[1]).joinpath('icemcfd', 'output-interfaces', 'ansys.exe')))
-
+        # The cached path is checked first, Auto Find always looks again in case a newer ANSYS was installed
+        var_ins.icem_path = find_icem_path(refresh=True)
+        if var_ins.icem_path is None:
+            raise FileNotFoundError("icemcfd launcher not found")
+        print(f'Path to icemcfd.bat found: {var_ins.icem_path}')
+        core_libs.gui_funcs.update_line_edit(var_ins.icem_path, 'icemdir', QApplication.instance().main_window)
     except Exception as e:
         print(e)
         print('Path to icemcfd.bat not found.\n Please manually set the path.')
 
 
-def update_icem_commands(stl_path):
-    var_ins.icem_commands = [
-        f'ic_chdir "{gui_ins.save_path}"',
+def update_icem_commands(stl_path, vari=None, save_path=None, n_processors=1):
+    vari = var_ins if vari is None else vari
+    save_path = gui_ins.save_path if save_path is None else save_path
+    vari.icem_commands = [
+        f'ic_chdir "{save_path}"',
         'ic_csystem_set_current global',
         f'ic_file_is_ascii "{stl_path}"',
-        f'{var_ins.icem_line_3_1}"{var_ins.icem_line_3_2}"{var_ins.icem_line_3_3}{var_ins.icem_line_3_4}',
+        f'{vari.icem_line_3_1}"{vari.icem_line_3_2}"{vari.icem_line_3_3}{vari.icem_line_3_4}',
         'ic_empty_tetin',
-        f'ic_geo_import_mesh {gui_ins.save_path}/tmpdomain0.uns 1 1',
+        f'ic_geo_import_mesh {save_path}/tmpdomain0.uns 1 1',
         'ic_boco_solver',
         'ic_boco_clear_icons',
         'ic_set_global geo_cad 0.08 toler',
-        f'ic_set_meshing_params global 0 gref 1.0 gmax {var_ins.max_element_size} gfast 0 gedgec 0.2 gnat 0 gcgap 1 gnatref 10',
+        f'ic_set_meshing_params global 0 gref 1.0 gmax {vari.max_element_size} gfast 0 gedgec 0.2 gnat 0 gcgap 1 gnatref 10',
         'ic_set_meshing_params surface_global 0 mesh_type 0 mesh_method 1 simple_offset 0 bunch_respect 0 protect_line 0 bound_smooth 0 block_mapping 0.2 adjust_nodes_max 0.0 proj_surf 1 surf_sizes 0 ign_size 0.08 try_harder 1 impr_level 1 mesh_dormant 0 smooth_dormant 0 max_area 0.0 max_length 0.0 min_angle 0.0 max_nodes 0 max_elements 0 merge_surfs 1 mapped_method 1 free_bunch 0 shrinkwrap_nsmooth 5 shrinkwrap_projfactor 0.1 snorm 1 quadratic 0',
         'ic_set_meshing_params global 0 gfast 0 gedgec 0.2',
         'ic_set_global geo_cad 0.08 toler',
         'ic_save_tetin temp_tetra.tin',
-        'ic_run_tetra temp_tetra.tin ./tetra_mesh.uns run_cutter 1 delete_auto 1 run_smoother 0 fix_holes 1 n_processors 1 in_process 1 auto_vol 1 log ./tetra_cmd.log',
+        'set pypect2s_clock [clock milliseconds]',
+        f'ic_run_tetra temp_tetra.tin ./tetra_mesh.uns run_cutter 1 delete_auto 1 run_smoother 0 fix_holes 1 n_processors {n_processors} in_process 1 auto_vol 1 log ./tetra_cmd.log',
+        f'puts "{timing_marker} tetra [expr {{[clock milliseconds] - $pypect2s_clock}}]"',
         'ic_geo_set_modified 1',
-        f'{var_ins.icem_line_23_0}{var_ins.icem_line_23_1}{var_ins.icem_line_23_2}',
+        f'{vari.icem_line_23_0}{vari.icem_line_23_1}{vari.icem_line_23_2}',
         'ic_boco_solver',
-        f'{var_ins.icem_line_25_0}{var_ins.icem_line_25_1}{var_ins.icem_line_25_2}',
+        f'{vari.icem_line_25_0}{vari.icem_line_25_1}{vari.icem_line_25_2}',
         'ic_boco_clear_icons',
         'ic_uns_diagnostic diag_type single quiet 1',
-        'ic_smooth_elements map all upto 0.4 iterations 5 fix_families {} n_processors 1 smooth TRI_3 float TETRA_4 laplace 1',
-        'ic_smooth_elements map all upto 0.4 iterations 5 prism_warp_weight 0.5 fix_families {} n_processors 1 smooth TETRA_4 float PENTA_6 freeze TRI_3',
-        'ic_smooth_elements map all upto 0.4 iterations 5 prism_warp_weight 0.5 fix_families {} metric Quality n_processors 1 smooth TETRA_4 smooth TRI_3 float PENTA_6',
+        'set pypect2s_clock [clock milliseconds]',
+        f'ic_smooth_elements map all upto 0.4 iterations 5 fix_families {{}} n_processors {n_processors} smooth TRI_3 float TETRA_4 laplace 1',
+        f'ic_smooth_elements map all upto 0.4 iterations 5 prism_warp_weight 0.5 fix_families {{}} n_processors {n_processors} smooth TETRA_4 float PENTA_6 freeze TRI_3',
+        f'ic_smooth_elements map all upto 0.4 iterations 5 prism_warp_weight 0.5 fix_families {{}} metric Quality n_processors {n_processors} smooth TETRA_4 smooth TRI_3 float PENTA_6',
+        f'puts "{timing_marker} smooth [expr {{[clock milliseconds] - $pypect2s_clock}}]"',
+        'flush stdout',
         'ic_geo_set_modified 1',
         'ic_delete_empty_parts',
-        f'ic_chdir "{gui_ins.save_path}"',
+        f'ic_chdir "{save_path}"',
         'ic_delete_empty_parts',
-        f'{var_ins.icem_line_37_0}{var_ins.icem_line_37_1}{var_ins.icem_line_37_2}',
+        f'{vari.icem_line_37_0}{vari.icem_line_37_1}{vari.icem_line_37_2}',
         'ic_uns_check_duplicate_numbers',
         'ic_uns_renumber_all_elements 1 1',
-        f'{var_ins.icem_line_41_0}{var_ins.icem_line_41_1}{var_ins.icem_line_41_2}',
+        f'{vari.icem_line_41_0}{vari.icem_line_41_1}{vari.icem_line_41_2}',
         'ic_uns_set_modified 1',
-        f'{var_ins.icem_line_43_0}{var_ins.icem_line_43_1}{var_ins.icem_line_43_2}{var_ins.icem_line_43_3}{var_ins.icem_line_43_4}{var_ins.icem_line_43_5}{var_ins.icem_line_43_6}{var_ins.icem_line_43_7}{var_ins.icem_line_43_8}{var_ins.icem_line_43_9}{var_ins.icem_line_43_10}{var_ins.icem_line_43_11}',
+        f'{vari.icem_line_43_0}{vari.icem_line_43_1}{vari.icem_line_43_2}{vari.icem_line_43_3}{vari.icem_line_43_4}{vari.icem_line_43_5}{vari.icem_line_43_6}{vari.icem_line_43_7}{vari.icem_line_43_8}{vari.icem_line_43_9}{vari.icem_line_43_10}{vari.icem_line_43_11}',
         'ic_boco_solver',
         'ic_boco_solver {Ansys Fluent}',
         'ic_solution_set_solver {Ansys Fluent} 1',
         'ic_boco_solver {Ansys Fluent}',
         'ic_solver_mesh_info {Ansys Fluent}',
-        f'ic_boco_save "{gui_ins.save_path}/{var_ins.proj_name}.fluentAnsys.fbc"',
-        f'ic_boco_save_atr "{gui_ins.save_path}/{var_ins.proj_name}.fluentAnsys.atr"',
-        f'ic_param_save "{gui_ins.save_path}/{var_ins.proj_name}.fluentAnsys.par"',
+        f'ic_boco_save "{save_path}/{vari.proj_name}.fluentAnsys.fbc"',
+        f'ic_boco_save_atr "{save_path}/{vari.proj_name}.fluentAnsys.atr"',
+        f'ic_param_save "{save_path}/{vari.proj_name}.fluentAnsys.par"',
         'ic_boco_solver',
         'ic_boco_solver {Ansys Fluent}',
         'ic_solution_set_solver {Ansys Fluent} 1',
-        f'ic_boco_save "{gui_ins.save_path}/{var_ins.proj_name}.fluentAnsys.fbc"',
-        f'ic_boco_save_atr "{gui_ins.save_path}/{var_ins.proj_name}.fluentAnsys.atr"',
-        f'ic_param_save "{gui_ins.save_path}/{var_ins.proj_name}.fluentAnsys.par"',
+        f'ic_boco_save "{save_path}/{vari.proj_name}.fluentAnsys.fbc"',
+        f'ic_boco_save_atr "{save_path}/{vari.proj_name}.fluentAnsys.atr"',
+        f'ic_param_save "{save_path}/{vari.proj_name}.fluentAnsys.par"',
         'ic_uns_thickness_exists_mesh',
         'ic_uns_thickness_exists_mesh',
         'ic_uns_thickness_exists_mesh',
         'ic_uns_thickness_exists_mesh',
         'ic_boco_unload',
-        f'ic_boco_load "{gui_ins.save_path}/{var_ins.proj_name}.fluentAnsys.fbc"',
+        f'ic_boco_load "{save_path}/{vari.proj_name}.fluentAnsys.fbc"',
         'ic_boco_solver Ansys',
-        f'ic_param_load "{gui_ins.save_path}/{var_ins.proj_name}.fluentAnsys.par"',
+        f'ic_param_load "{save_path}/{vari.proj_name}.fluentAnsys.par"',
         'ic_param_set_all {:ansys_product:ST,EXPASS 0 :ansys_product:FL:FLDATA5,MACH 1 :ansys_product:TH,timestep 0 :def_3_TH_1,inopr 0 :ansys_product:FL:FLDATA5,PTOT 1 :ansys_product,save_opt 1 :def_3_ST_1,type 200 :def_3_FL_1,inopr 0 :contact:real_contact3,r10 0.0 :contact:real_contact3,r11 1.0 :ansys_product:FL:FLDATA5,SPHT 0 :def_2_TH_1,type 0 :contact:real_contact3,r12 1.0 :contact:real_contact3,r13 0.0 :def_2_ST_1:kop181,kop1 -1 :contact:real_contact3,r14 0.0 :ansys_product:FL:FLDATA5,DENS 1 :def_2_ST_1:kop181,kop2 -1 :contact:real_contact3,r15 1.0 :ansys_product:FL:FLDATA5,RESI 0 :def_2_ST_1:kop181,kop3 0 :contact:real_contact3,r16 0.0 :def_2_ST_1:kop181,kop4 -1 :contact:real_contact3,r17 1.0 :def_2_ST_1:kop181,kop5 -1 :contact:real_contact3,r18 0.5 :def_2_ST_1:kop181,kop6 -1 :contact:real_contact3,r20 1.0 :contact:real_contact3,r19 0.0 :contact:real_contact3,r21 1.0 :contact:real_contact3,r3 1.0 :ansys_product:FL:FLDATA3,ENDS 1E-02 :contact:real_contact3,r22 0.0 :contact:real_contact3,r4 0.1 :contact:real_contact3,r23 0.01 :contact:real_contact3,r5 0.0 :def_3_TH_1,real None :contact:real_contact3,r6 0.0 :contact:real_contact3,r25 0.0 :contact:real_contact3,r7 0.0 :contact:kop_contact3,kop1 0 :contact:real_contact3,r8 0.0 :contact:kop_contact3,kop2 0 :ansys_product:ST,mod_norm 0 :contact:real_contact3,r9 1.0E20 :contact:kop_contact3,kop3 -1 :contact:kop_contact3,kop4 0 :ansys_product:FL:FLDATA5,EVIS 1 :ansys_product:TH,BETAD 0.0 :contact:kop_contact3,kop5 0 :contact:kop_contact3,kop6 -1 :ansys_product:FL:FLDATA1,TURB 0 :contact:kop_contact3,kop7 0 :contact:kop_contact3,kop8 0 :contact:kop_contact3,kop9 0 :def_2_ST_2,type 200 :def_0_ST_3,real None :def_1_ST_1:kop188,kop1 0 :def_1_ST_1:kop188,kop2 0 :def_1_ST_1:kop188,kop3 0 :ansys_product:ST,DMPRAT 0.02 :def_1_ST_1:kop188,kop4 0 :ansys_product:FL:FLDATA14,NOMI 293.0 :def_1_ST_1:kop188,kop5 -1 :ansys_product:TH,anal_type None :ansys_product:TH,solv_type SPARSE :def_1_ST_1:kop188,kop6 0 :ansys_product:ST,mod_solv LANB :ansys_product:FL:FLDATA1,IVSH 0 :def_3_ST_2,real None :ansys_product:FL:FLDATA13,SFTS 0 :ansys_product:TH,DELTIM1 0 :def_3_TH_2:kop90,kop1 0 :def_3_ST_1:kop195,kop1 -1 :ansys_product:TH,DELTIM2 0 :def_3_TH_2:kop90,kop2 -1 :def_3_ST_1:kop195,kop2 0 :global,DOMEGA 0 :def_3_TH_2:kop90,kop3 -1 :def_3_ST_1:kop195,kop3 -1 :def_3_TH_2:kop90,kop4 -1 :def_1_ST_1,sec None :ansys_product:FL:FLDATA13,COND 0 :def_3_ST_1:kop195,kop4 -1 :ansys_product,opt0 1 :def_3_TH_2:kop90,kop5 -1 :def_3_ST_1:kop195,kop5 -1 :ansys_product,opt1 {} :def_3_TH_2:kop90,kop6 -1 :def_3_TH_1:kop70,kop1 -1 :def_3_ST_1:kop195,kop6 -1 :ansys_product,opt2 {} :def_3_TH_1:kop70,kop2 0 :ansys_product:TH,DELTIM 1.0 :ansys_product,opt3 {} :def_3_TH_1:kop70,kop3 -1 :ansys_product,opt4 {} :def_3_TH_1:kop70,kop4 0 :def_3_ST_2:kop95,kop1 0 :def_3_TH_1:kop70,kop5 -1 :def_3_ST_2:kop95,kop2 -1 :def_3_TH_1:kop70,kop6 -1 :def_3_ST_2:kop95,kop3 -1 :def_3_ST_2:kop95,kop4 -1 :def_3_ST_2:kop95,kop5 0 :def_3_ST_2:kop92,kop1 -1 :def_3_ST_2:kop95,kop6 0 :def_3_ST_2:kop92,kop2 -1 :def_3_ST_1:kop185,kop1 -1 :def_3_ST_2:kop92,kop3 -1 :ansys_product:FL:FLDATA1,SPEC 0 :def_0_TH_3,type 0 :def_3_ST_1:kop185,kop2 0 :def_3_ST_2:kop92,kop4 -1 :def_3_ST_1:kop185,kop3 -1 :def_3_ST_2:kop92,kop5 0 :def_3_ST_1:kop185,kop4 0 :def_3_ST_2:kop92,kop6 0 :def_3_ST_1:kop185,kop5 -1 :contact:kop_contact3,kop10 0 :def_3_ST_1:kop185,kop6 0 :ansys_product:FL:FLDATA3,TEMP 1E-08 :contact:kop_contact3,kop11 0 :def_2_ST_1:kop41,kop1 0 :contact:kop_contact3,kop12 0 :def_2_ST_1:kop41,kop2 0 :def_2_ST_1:kop41,kop3 -1 :ansys_product:ST,TIMINT 1 :def_1_ST_1:kop10,kop1 -1 :def_2_ST_1:kop41,kop4 0 :ansys_product:FL:FLDATA3,ENKE 1E-02 :def_1_ST_1:kop10,kop2 0 :def_2_ST_1:kop41,kop5 0 :def_3_TH_2,type 200 :ansys_product:FL:FLDATA5,YPLU 0 :def_1_ST_1:kop10,kop3 0 :def_2_ST_1:kop41,kop6 0 :def_1_ST_1:kop10,kop4 -1 :def_1_ST_1:kop10,kop5 -1 :def_3_ST_1:kop65,kop1 0 :ansys_product:FL:FLDATA5,ECON 1 :def_1_ST_1:kop10,kop6 -1 :def_3_ST_1:kop65,kop2 -1 :def_3_ST_1:kop65,kop3 -1 :def_1_FL_1,real None :def_3_ST_1:kop65,kop4 -1 :ansys_product:FL:FLDATA5,RDFL 0 :ansys_product:FL:FLDATA5,SFTS 0 :def_3_ST_1:kop65,kop5 0 :ansys_product:FL:FLDATA6,OUTP BNOW :def_3_ST_1:kop65,kop6 0 :def_1_FL_1:kop116,kop1 0 :ansys_product:ST,AUTOTS -1 :def_1_FL_1:kop116,kop2 0 :def_1_FL_1:kop116,kop3 -1 :ansys_product:FL:FLDATA5,COND 1 :ansys_product:ST,ALPHAD 0.0 :def_1_FL_1:kop116,kop4 0 :def_1_FL_1:kop116,kop5 0 :def_1_FL_1:kop116,kop6 0 :ansys_product:FL,flag 0 :ansys_product,lab_EH_ST_0 n :ansys_product:ST,NSUBST 1 :ansys_product:FL:FLDATA16,BETA 1.0E15 :def_1_ST_1:kop52,kop1 0 :def_1_ST_1:kop52,kop2 -1 :def_1_ST_1:kop52,kop3 0 :def_0_ST_3,inopr 0 :def_2_FL_1:kop141,kop1 0 :def_1_ST_1:kop52,kop4 0 :def_2_FL_1:kop141,kop2 -1 :def_1_ST_1:kop52,kop5 -1 :def_2_FL_1:kop141,kop3 0 :def_1_ST_1:kop52,kop6 -1 :def_2_FL_1:kop141,kop4 0 :def_1_ST_1,real None :ansys_product:FL:FLDATA1,FLOW 1 :def_2_FL_1:kop141,kop5 -1 :ansys_product:FL:FLDATA6,ITER 1 :def_2_ST_2:kop93,kop1 -1 :ansys_product,lab_EH_TH_0 n :def_2_FL_1:kop141,kop6 -1 :def_2_FL_1,type 200 :def_2_ST_2:kop93,kop2 -1 :ansys_product,lab_EH_TH_1 n :def_2_ST_2:kop93,kop3 -1 :def_3_ST_2:kop194,kop1 -1 :def_2_ST_2:kop93,kop4 0 :def_3_ST_2:kop194,kop2 0 :def_2_ST_2:kop93,kop5 0 :def_3_ST_2:kop194,kop3 -1 :def_3_ST_1:kop45,kop1 0 :def_2_ST_2:kop93,kop6 0 :ansys_product:ST,NSUBST1 0 :ansys_product:FL:FLDATA5,TTOT 1 :def_3_ST_2:kop194,kop4 -1 :def_3_ST_1:kop45,kop2 0 :ansys_product:ST,NSUBST2 0 :def_3_ST_2:kop194,kop5 -1 :def_3_ST_1:kop45,kop3 -1 :def_3_ST_2:kop194,kop6 -1 :def_3_ST_1:kop45,kop4 0 :def_3_ST_1:kop45,kop5 0 :def_3_ST_1:kop45,kop6 0 :def_2_TH_1:kop57,kop1 -1 :def_3_FL_1,real None :ansys_product:TH,NLGEOM OFF :def_2_TH_1:kop57,kop2 0 :def_3_ST_2:kop187,kop1 -1 :def_2_TH_1:kop57,kop3 -1 :def_3_ST_2:kop187,kop2 -1 :def_2_TH_1:kop57,kop4 -1 :def_3_ST_2:kop187,kop3 -1 :ansys_product:ST,solv_tol 1.0E-08 :def_2_TH_1:kop57,kop5 -1 :def_3_ST_2:kop187,kop4 0 :def_2_TH_1:kop57,kop6 -1 :def_3_ST_2:kop187,kop5 -1 :def_3_ST_2:kop187,kop6 0 :ansys_product,lab_TH_ST_0 n :def_2_ST_1:kop63,kop1 0 :def_2_ST_1:kop63,kop2 0 :def_3_EH_2,type 200 :def_2_ST_1:kop63,kop3 0 :def_2_ST_1,type 200 :ansys_product,type1 ST :def_2_ST_1:kop63,kop4 -1 :ansys_product,type2 TH :def_2_ST_1:kop63,kop5 0 :def_2_ST_1:kop63,kop6 0 :def_3_ST_1,real None :ansys_product,exit_save SOLU :def_1_ST_2,inopr 0 :def_2_TH_1,real None :global,DOMEGA_XYZ {0 0 0} :def_0_TH_3:kop71,kop1 -1 :def_0_TH_3:kop71,kop2 -1 :ansys_product:ST,mod_expec 0 :def_0_TH_3:kop71,kop3 0 :def_0_TH_3:kop71,kop4 0 :ansys_product,kimg 1 :def_0_TH_3:kop71,kop5 -1 :def_0_TH_3:kop71,kop6 -1 :ansys_product:ST,KBC 1 :def_3_FL_1:kop142,kop1 0 :def_1_ST_2,type 0 :def_0_ST_3:kop21,kop1 0 :def_3_FL_1:kop142,kop2 -1 :ansys_product:FL:FLDATA13,VISC 0 :def_0_ST_3:kop21,kop2 0 :def_3_FL_1:kop142,kop3 0 :def_0_ST_3:kop21,kop3 0 :def_3_FL_1:kop142,kop4 0 :def_0_ST_3:kop21,kop4 -1 :def_3_FL_1:kop142,kop5 -1 :ansys_product:FL:FLDATA5,PCOE 1 :def_0_ST_3:kop21,kop5 -1 :def_2_ST_1:kop43,kop1 -1 :ansys_product:ST,solv_mult 1.0 :def_3_FL_1:kop142,kop6 -1 :def_1_ST_1,inopr 0 :def_0_ST_3:kop21,kop6 -1 :def_2_ST_1:kop43,kop2 -1 :def_2_ST_1:kop43,kop3 0 :ansys_product:TH,solv_tol 1.0E-08 :global,ACEL 0 :ansys_product:FL:FLDATA5,DEBG 1 :def_2_ST_1:kop43,kop4 0 :def_2_ST_1:kop43,kop5 0 :def_2_ST_1:kop43,kop6 0 :def_0_TH_3,inopr 0 :def_2_ST_2,real None :contact,1 {} :def_2_ST_1:kop143,kop1 -1 :def_2_ST_1:kop143,kop2 0 :def_3_TH_1,type 200 :ansys_product:FL:FLDATA5,TAUW 0 :ansys_product:ST,DELTIM 1.0 :ansys_product:FL:FLDATA1,TRAN 0 :def_2_ST_1:kop143,kop3 0 :def_2_ST_2,inopr 0 :def_2_ST_1:kop143,kop4 0 :def_3_ST_1:kop64,kop1 0 :def_2_ST_1:kop143,kop5 0 :def_3_ST_1:kop64,kop2 -1 :def_2_ST_1:kop143,kop6 0 :ansys_product,coupled 0 :def_3_ST_1:kop64,kop3 -1 :ansys_product:FL:FLDATA5,STRM 1 :def_3_ST_1:kop64,kop4 -1 :def_3_ST_1:kop64,kop5 0 :ansys_product:TH,NSUBST1 0 :def_3_ST_1:kop64,kop6 0 :ansys_product:TH,NSUBST2 0 :def_0_ST_3,type 0 :ansys_product:FL:FLDATA1,SFTS 0 :ansys_product:FL:FLDATA5,HFLM 1 :ansys_product:TH,KBC 1 :global,OMEGA_XYZ {0 0 0} :ansys_product:FL:FLDATA1,VOF 0 :def_3_EH_2,inopr 0 :ansys_product:ST,TIME 1.0 :def_2_ST_1,inopr 0 :def_1_ST_2:kop189,kop1 0 :def_1_ST_1:kop4,kop1 -1 :def_1_ST_2:kop189,kop2 0 :ansys_product:FL:FLDATA1,COMP 0 :def_1_ST_1:kop4,kop2 0 :def_1_ST_2:kop189,kop3 -1 :def_3_ST_2,type 200 :def_1_ST_1:kop4,kop3 -1 :def_1_ST_2:kop189,kop4 0 :ansys_product:FL:FLDATA5,VISC 1 :def_1_ST_1:kop4,kop4 -1 :def_1_ST_2:kop189,kop5 -1 :ansys_product:TH,TIME 1.0 :def_1_ST_1:kop4,kop5 -1 :def_1_ST_2:kop189,kop6 0 :ansys_product:FL:FLDATA5,HFLU 1 :def_1_ST_1:kop4,kop6 0 :ansys_product:FL:FLDATA3,PRES 1E-08 :def_0_TH_3,real None :ansys_product:ST,freq2 1E+08 :def_3_ST_2,inopr 0 :ansys_product:FL:FLDATA5,EMD 1 :def_1_ST_1:kop44,kop1 -1 :ansys_product:ST,HROPT FULL :def_1_ST_1:kop44,kop2 0 :def_1_ST_1:kop44,kop3 -1 :def_1_ST_1:kop44,kop4 -1 :def_3_EH_2:kop119,kop1 1 :def_3_EH_2:kop120,kop1 1 :ansys_product:FL:FLDATA5,SUMF 10 :def_1_ST_1:kop44,kop5 -1 :def_3_TH_2,real None :def_3_EH_2:kop119,kop2 -1 :def_3_EH_2:kop120,kop2 -1 :ansys_product:FL:FLDATA3,VX 1E-02 :def_1_ST_1:kop44,kop6 0 :def_3_EH_2:kop119,kop3 -1 :def_3_EH_2:kop120,kop3 -1 :ansys_product:FL:FLDATA3,VY 1E-02 :def_3_EH_2:kop119,kop4 0 :def_3_EH_2:kop120,kop4 0 :ansys_product:FL:FLDATA3,VZ 1E-02 :def_3_EH_2:kop119,kop5 0 :def_3_EH_2:kop120,kop5 0 :def_3_EH_2:kop119,kop6 -1 :def_3_EH_2:kop120,kop6 -1 :def_3_ST_2:kop186,kop1 -1 :def_3_ST_1,inopr 0 :def_3_ST_2:kop186,kop2 -1 :ansys_product:FL:FLDATA15,REFE 1.0135E05 :def_3_ST_2:kop186,kop3 -1 :ansys_product,lab_EH_FL_0 n :def_3_ST_2:kop186,kop4 0 :ansys_product,lab_EH_FL_1 n :def_3_ST_2:kop186,kop5 -1 :def_3_ST_2:kop186,kop6 0 :def_1_ST_2,sec None :def_1_FL_1,type 200 :global,OMEGA 0 :ansys_product:FL:FLDATA17,COMP 1.4 :def_1_FL_1,inopr 0 :ansys_product:TH,TIMINT 1 :ansys_product:ST,NLGEOM OFF :def_1_ST_1:kop24,kop1 0 :ansys_product:ST,timestep 0 :def_3_TH_2:kop87,kop1 0 :ansys_product:FL:FLDATA14,BULK 293.0 :def_1_ST_1:kop24,kop2 0 :global,OMEGA_SPIN 0 :def_3_TH_2:kop87,kop2 -1 :def_1_ST_1:kop24,kop3 0 :ansys_product:ST,anal_type None :ansys_product:ST,solv_type SPARSE :ansys_product:ST,mod_n 1 :def_3_TH_2:kop87,kop3 -1 :def_1_ST_1:kop180,kop1 -1 :def_2_FL_1,real None :def_1_ST_1:kop24,kop4 -1 :def_3_TH_2:kop87,kop4 -1 :def_1_ST_1:kop180,kop2 0 :def_1_ST_1:kop24,kop5 -1 :def_3_TH_2:kop87,kop5 -1 :def_1_ST_1:kop180,kop3 -1 :def_1_ST_1:kop24,kop6 0 :def_3_TH_2:kop87,kop6 -1 :def_1_ST_1:kop180,kop4 -1 :def_1_ST_1:kop180,kop5 -1 :ansys_product:TH,solv_mult 1.0 :def_1_ST_1:kop180,kop6 -1 :ansys_product:TH,AUTOTS -1 :ansys_product:TH,ALPHAD 0.0 :def_1_ST_1,type 0 :ansys_product,exit_opt 0 :def_2_TH_1,inopr 0 :ansys_product,lab_FL_ST_0 n :ansys_product:FL:FLDATA13,SPHT 0 :ansys_product:TH,NSUBST 1 :ansys_product:FL:FLDATA1,ALE 0 :ansys_product:ST,NUMEXP ALL :ansys_product:ST,freq 0.0 :ansys_product:FL:FLDATA13,DENS 0 :ansys_product:ST,mod_ce 0 :ansys_product:ST,DELTIM1 0 :ansys_product:ST,BETAD 0.0 :ansys_product:FL:FLDATA1,TEMP 0 :ansys_product:FL:FLDATA14,TTOT 293.0 :ansys_product:ST,DELTIM2 0 :global,ACEL_XYZ {0 0 0} :def_2_FL_1,inopr 0 :ansys_product:FL:FLDATA1,SWRL 0 :def_3_EH_2,real None :ansys_product:FL:FLDATA5,LMD 1 :def_2_ST_1,real None :def_3_FL_1,type 200 :def_3_TH_2,inopr 0 :ansys_product,proc_n 1 :ansys_product,lab_FL_TH_0 n :ansys_product,lab_FL_TH_1 n}',
-        f'ic_param_save "{gui_ins.save_path}/{var_ins.proj_name}.fluentAnsys.par"',
+        f'ic_param_save "{save_path}/{vari.proj_name}.fluentAnsys.par"',
         'ic_boco_unload',
         'ic_param_set_all {}',
-        f'ic_param_load "{gui_ins.save_path}/{var_ins.proj_name}.fluentAnsys.par" 0',
-        f'ic_boco_load_atr "{gui_ins.save_path}/{var_ins.proj_name}.fluentAnsys.atr"',
+        f'ic_param_load "{save_path}/{vari.proj_name}.fluentAnsys.par" 0',
+        f'ic_boco_load_atr "{save_path}/{vari.proj_name}.fluentAnsys.atr"',
         'ic_boco_clear_icons',
         'ic_delete_empty_parts',
-        f'{var_ins.icem_line_76_0}{var_ins.icem_line_76_1}{var_ins.icem_line_76_2}',
-        f'ic_rename {var_ins.proj_name}.uns {var_ins.proj_name}.uns.bak',
+        f'{vari.icem_line_76_0}{vari.icem_line_76_1}{vari.icem_line_76_2}',
+        f'ic_rename {vari.proj_name}.uns {vari.proj_name}.uns.bak',
         'ic_uns_check_duplicate_numbers',
-        f'{var_ins.icem_line_79_0}{var_ins.icem_line_79_1}{var_ins.icem_line_79_2}',
+        f'{vari.icem_line_79_0}{vari.icem_line_79_1}{vari.icem_line_79_2}',
         'ic_uns_set_modified 1',
         'ic_boco_solver',
         'ic_boco_solver Ansys',
         'ic_solution_set_solver Ansys 1',
-        f'ic_boco_save {var_ins.proj_name}.fbc',
-        f'ic_boco_save_atr {var_ins.proj_name}.atr',
-        f'ic_param_save {var_ins.proj_name}.par',
-        f'ic_param_save {var_ins.proj_name}.par',
-        f'{var_ins.icem_line_87_0}{var_ins.icem_line_87_1}{var_ins.icem_line_87_2}{var_ins.icem_line_87_3}{var_ins.icem_line_87_4}{var_ins.icem_line_87_5}{var_ins.icem_line_87_6}{var_ins.icem_line_87_7}{var_ins.icem_line_87_8}{var_ins.icem_line_87_9}{var_ins.icem_line_87_10}{var_ins.icem_line_87_11}{var_ins.icem_line_87_12}{var_ins.icem_line_87_13}{var_ins.icem_line_87_14}{var_ins.icem_line_87_15}{var_ins.icem_line_87_16}{var_ins.icem_line_87_17}',
-        f'{var_ins.icem_line_88_1}{var_ins.icem_line_88_2}{var_ins.icem_line_88_3}{var_ins.icem_line_88_4}',
+        f'ic_boco_save {vari.proj_name}.fbc',
+        f'ic_boco_save_atr {vari.proj_name}.atr',
+        f'ic_param_save {vari.proj_name}.par',
+        f'ic_param_save {vari.proj_name}.par',
+        f'{vari.icem_line_87_0}{vari.icem_line_87_1}{vari.icem_line_87_2}{vari.icem_line_87_3}{vari.icem_line_87_4}{vari.icem_line_87_5}{vari.icem_line_87_6}{vari.icem_line_87_7}{vari.icem_line_87_8}{vari.icem_line_87_9}{vari.icem_line_87_10}{vari.icem_line_87_11}{vari.icem_line_87_12}{vari.icem_line_87_13}{vari.icem_line_87_14}{vari.icem_line_87_15}{vari.icem_line_87_16}{vari.icem_line_87_17}',
+        f'{vari.icem_line_88_1}{vari.icem_line_88_2}{vari.icem_line_88_3}{vari.icem_line_88_4}',
         'exit'
     ]
+    return vari.icem_commands
+
+
+def scratch_dir(save_path, vari):
+    # A folder of its own for one ICEM run, inside save_path so the artefacts are moved back without copying
+    return tempfile.mkdtemp(prefix=f"icem_{vari.proj_name}_", dir=save_path).replace("\\", "/")
+
+
+def collect_artefacts(scratch_path, save_path, vari):
+    """
+    Move the final ICEM artefacts of a run from its scratch folder to save_path and delete the scratch folder,
+    with everything else ICEM left there.
+    :return: moved:  The artefacts moved
+    """
+    moved = []
+    for ext in icem_artefacts:
+        file_name = f"{vari.proj_name}{ext}"
+        if os.path.exists(f"{scratch_path}/{file_name}"):
+            os.replace(f"{scratch_path}/{file_name}", f"{save_path}/{file_name}")
+            moved.append(file_name)
+    shutil.rmtree(scratch_path, ignore_errors=True)
+    return moved
+
+
+def icem_budget(n_jobs=1):
+    """
+    Share the meshing core budget between the ICEM sessions run at once.
+    The budget is the GUI core count, kept to the physical cores since tetra meshing and smoothing gain little from
+    hyperthreads. With icem_threads set, each session gets that many threads and as many sessions are run as the
+    licences and budget allow; otherwise one session per licence is run and the budget is split between them.
+    :return: n_sessions, n_processors:  ICEM sessions run at once and the threads given to each
+    """
+    cores = max(1, gui_ins.core_count)
+    if gui_ins.phys_core and cores > gui_ins.phys_core:
+        print(f"Core count {cores} is more than the {gui_ins.phys_core} physical cores, ICEM is given {gui_ins.phys_core}.")
+        cores = gui_ins.phys_core
+    if var_ins.icem_threads:
+        n_processors = min(var_ins.icem_threads, cores)
+        n_sessions = min(var_ins.icem_licences, cores // n_processors, n_jobs)
+    else:
+        n_sessions = min(var_ins.icem_licences, cores, n_jobs)
+        n_processors = cores // max(1, n_sessions)
+    return max(1, n_sessions), n_processors
+
+
+def parse_timing(log, n_specimens=1):
+    """
+    Read the tetra meshing and smoothing wall times (s) printed by the ICEM script, per specimen of a batch session.
+    :return: timings:  Dictionary with 'tetra_s' and 'smooth_s' per specimen, missing when ICEM did not get there
+    """
+    timings, index = [{} for _ in range(n_specimens)], 0
+    for line in log.splitlines():
+        fields = line.split()
+        if line.startswith(batch_marker) and fields[1] == 'BEGIN':
+            index = int(fields[2])
+        elif line.startswith(timing_marker) and len(fields) == 3:
+            timings[index][f'{fields[1]}_s'] = int(fields[2]) / 1000
+    return timings
+
+
+def tetra_log_times(scratch_path):
+    # The timing lines of the tetra mesher's own log, read before the scratch folder is deleted
+    try:
+        with open(f"{scratch_path}/tetra_cmd.log", "r", errors="replace") as file:
+            return "; ".join(line.strip() for line in file if 'time' in line.lower())
+    except OSError:
+        return ""
+
+
+def write_timing(rows, save_path):
+    """
+    Add the ICEM timings to '<save_path>/icem_timing.csv', appending so runs with different core counts can be
+    compared.
+    """
+    timing_path = f"{save_path}/icem_timing.csv"
+    new_file = not os.path.exists(timing_path)
+    with open(timing_path, "a", newline="") as file:
+        writer = csv.DictWriter(file, fieldnames=timing_columns, extrasaction='ignore')
+        if new_file:
+            writer.writeheader()
+        writer.writerows(rows)
+
+
+def icem_limits(n_specimens=1):
+    # Wall clock limit (s) for an ICEM session meshing n specimens and its memory limit (bytes), 0 for none
+    return var_ins.icem_time_limit * 60 * n_specimens, var_ins.icem_memory_limit * 2 ** 30
 
 
 def run_icem(stl_path):
+    """
+    Mesh one STL in ICEM CFD, with the output streamed to the log as ICEM writes it.
+    :return: meshed:  True when ICEM finished and wrote the .inp file
+    """
+    scratch_path = scratch_dir(gui_ins.save_path, var_ins)
+    _, n_processors = icem_budget()
     try:
-        update_icem_commands(stl_path)
+        rpl_paths(stl_path, var_ins, scratch_path)
+        update_icem_commands(stl_path, var_ins, scratch_path, n_processors)
         var_ins.icem_commands = "\n".join(var_ins.icem_commands)  # Combine commands into a single string
-        with open(f"{gui_ins.save_path}/temp_icem_script.rpl", "w") as file:
+        with open(f"{scratch_path}/temp_icem_script.rpl", "w") as file:
             file.write(var_ins.icem_commands)  # Save commands to temporary file
-        auto = subprocess.run([var_ins.icem_path, "-batch", "-script", f"{gui_ins.save_path}/temp_icem_script.rpl"], capture_output=True, text=True, check=True)  # Run ICEM CFD with the script
-        print(auto.stdout)
-        print(auto.stderr)
-        for file in var_ins.files_to_remove:
-            try:
-                pass
-                # Try to remove temporary files
-                os.remove(f'{gui_ins.save_path}/{file}')
-            except OSError:
-                # If the file does not exist or cannot be removed, ignore the error
-                pass
-        print('ICEM CFD meshing complete!')
-    except subprocess.CalledProcessError as e:
-        print(f"Command '{e.cmd}' returned non-zero exit status {e.returncode}.")
-        print("Error:", e.stderr)
+        timeout, max_memory = icem_limits()
+        auto = core_libs.tool_runner.run_tool([var_ins.icem_path, "-batch", "-script", f"{scratch_path}/temp_icem_script.rpl"], timeout, max_memory)  # Run ICEM CFD with the script
+        if auto['status'] != 'DONE':
+            print(f"ICEM CFD {auto['status'].lower()}, exit code {auto['returncode']} after {auto['duration_s']} s.")
+            return False
+        var_ins.icem_timing = {'project': var_ins.proj_name, 'sessions': 1, 'threads': n_processors,
+                               **parse_timing(auto['stdout'])[0], 'icem_s': auto['duration_s'],
+                               'peak_rss_mb': auto['peak_rss_mb'], 'tetra_log': tetra_log_times(scratch_path)}
+        write_timing([var_ins.icem_timing], gui_ins.save_path)
+        print(f"ICEM CFD meshing complete! Tetra {var_ins.icem_timing.get('tetra_s', '-')} s, smoothing "
+              f"{var_ins.icem_timing.get('smooth_s', '-')} s on {n_processors} threads, peak memory {auto['peak_rss_mb']} MB.")
+        return True
     except Exception as e:
         print(f'Error: {e}')
+        return False
+    finally:
+        collect_artefacts(scratch_path, gui_ins.save_path, var_ins)
 
 
-def apdl_mesh():
-    mapdl = launch_mapdl(nproc=gui_ins.core_count, loglevel="WARNING", print_com=True, cleanup_on_exit=True)
+def native_mesh(save_path=None, proj_name=None, shaft_length=None):
+    """
+    Convert the ICEM output to 10 node tetrahedra and write the .cdb without MAPDL, see core_libs/cdb_funcs.py.
+    The .cdb is read back and checked against the converted mesh. No .db file is written, the FEM scripts read the .cdb.
+    :return: converted:  False when native_tet10 is off or the ICEM output could not be converted
+    """
+    save_path = gui_ins.save_path if save_path is None else save_path
+    proj_name = var_ins.proj_name if proj_name is None else proj_name
+    shaft_length = var_ins.shaft_length if shaft_length is None else shaft_length
+    if not var_ins.native_tet10:
+        return False
+    try:
+        n_nodes, n_elements = core_libs.cdb_funcs.inp_to_cdb(f"{save_path}/{proj_name}.inp", f"{save_path}/{proj_name}.cdb",
+                                                             core_libs.stl_crop.mesh_title(proj_name, shaft_length))
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}\n The TET10 conversion has failed, APDL is used instead.")
+        return False
+    print(f'MESHING COMPLETE!\n {proj_name}.cdb has been saved with {n_elements} SOLID187 elements and {n_nodes} nodes')
+    return True
+
+
+def apdl_mesh(save_path=None, proj_name=None, mapdl=None, shaft_length=None):
+    """
+    Read the ICEM output into APDL, convert it to 10 node tetrahedra and write the .db and .cdb files.
+    When native_tet10 is on and no session is given, the conversion is first tried without MAPDL, see native_mesh.
+    :param mapdl:  An open MAPDL session to reuse, as in batch meshing, otherwise one is started and closed here
+    :param shaft_length:  The whole bone length of a cropped STL, marks the .cdb title, see stl_crop.mesh_title
+    """
+    save_path = gui_ins.save_path if save_path is None else save_path
+    proj_name = var_ins.proj_name if proj_name is None else proj_name
+    shaft_length = var_ins.shaft_length if shaft_length is None else shaft_length
+    own_session = mapdl is None
+    if own_session and native_mesh(save_path, proj_name, shaft_length):
+        return True
+    if own_session:
+        mapdl = launch_mapdl(exec_file=core_libs.ansys_paths.mapdl_exec_file(), nproc=gui_ins.core_count, loglevel="WARNING",
+                             print_com=True, cleanup_on_exit=True)
     try:
         # File > Read Input From > Patient00X.inp
-        mapdl.cwd(f"{gui_ins.save_path}/")
-        mapdl.input(f"{var_ins.proj_name}.inp")
+        mapdl.clear()
+        mapdl.cwd(f"{save_path}/")
+        mapdl.input(f"{proj_name}.inp")
 
         # Preprocessor > Element type > Add/Edit/Delete > Add -> Solid -> 10 node 187 > ok > close
         mapdl.prep7()
@@ -400,36 +787,107 @@ def apdl_mesh():
 
         # File > save as > Patient00X.db
         mapdl.finish()
-        mapdl.save(f"{var_ins.proj_name}.db")
+        mapdl.save(f"{proj_name}.db")
 
-        # Archive Model > write > save Patient00X.cdb
-        mapdl.cdwrite("ALL", f"{var_ins.proj_name}", "cdb", f"{var_ins.proj_name}", "iges", "BLOCKED")
+        # Archive Model > write > save Patient00X.cdb, titled so a mesh of a cropped STL can be told apart
+        mapdl.run(f"/TITLE,{core_libs.stl_crop.mesh_title(proj_name, shaft_length)}")
+        mapdl.cdwrite("ALL", f"{proj_name}", "cdb", f"{proj_name}", "iges", "BLOCKED")
 
-        mapdl.exit()
+        if own_session:
+            mapdl.exit()
         print('MESHING COMPLETE!\n *.cdb files have been saved')
+        return True
     except Exception as e:
-        mapdl.exit()
+        if own_session:
+            mapdl.exit()
         print(e)
         print('ANSYS APDL meshing failed!')
+        return False
 
 
-def run_icem_apdl():
-
+def prepare_stl(stl_path, save_path, vari):
+    """
+    Check, repair, crop, decimate and rotate an STL file as set in the meshing options, ready for ICEM.
+    :param vari:  The MeshVariables of this specimen, its stl_type and file names are set here
+    :return: stl_path, temp_path:  The file ICEM should import and any temporary file to delete after it has run,
+        or None, None when the STL failed its checks and should not be meshed
+    """
+    # Parse the STL once, the checks, rotation and file type all share this surface
+    surface = None
+    report = None
     try:
-        core_libs.stl_checks.STLChecks(gui_ins.stl_path)  # Check the STL file is valid
+        surface = core_libs.surf_mesh.load_surface_mesh(stl_path, save_path)
+        # Stop at the first hard error, unless the repair below needs the full picture
+        report = core_libs.stl_checks.STLChecks(
+            surface, vari.weld_tol, fail_fast=not vari.auto_repair, self_intersections=vari.check_self_intersections
+        ).report
     except Exception as e:
         print(
             f"Error: {e} - Check you have set a valid STL and save file path.\n"
             "Could not perform STL checks, proceed with caution."
         )
 
+    vari.stl_type = surface.stl_type if surface is not None else core_libs.gui_funcs.check_stl_file_type(stl_path)
+
+    if vari.auto_repair and surface is not None:
+        try:
+            # ICEM is given the repaired file, which is always binary
+            repaired_path, surface = core_libs.stl_repair.write_repaired_stl(
+                surface, save_path, vari.min_body_fraction, vari.max_hole_edges
+            )
+            if repaired_path:
+                stl_path = repaired_path
+                vari.stl_type = 'BINARY'
+                # Report anything the repair could not fix
+                report = core_libs.stl_checks.STLChecks(
+                    surface, vari.weld_tol, fail_fast=True, self_intersections=vari.check_self_intersections
+                ).report
+        except Exception as e:
+            print(f"Error: {e}\n Could not repair the STL file, ICEM will use the original file.")
+
+    if report is not None and report.failed:
+        # ICEM and APDL would spend a long time failing on this file, so neither is run
+        print(
+            f"Meshing skipped: the STL file failed the '{report.errors[0].name}' check.\n"
+            "Fix the STL file, or tick 'Auto Repair STL', and mesh again."
+        )
+        return None, None
+
+    vari.shaft_length = ""
+    if vari.crop_shaft and surface is not None:
+        try:
+            # The FEM solve deletes everything outside the mid-shaft segment, so it is not meshed at all
+            cropped_path, surface, vari.shaft_length = core_libs.stl_crop.write_cropped_stl(
+                surface, save_path, vari.crop_pc, vari.crop_margin
+            )
+            if cropped_path:
+                stl_path = cropped_path
+                vari.stl_type = 'BINARY'
+        except Exception as e:
+            print(f"Error: {e}\n Could not crop the STL file, ICEM will use the whole bone.")
+
+    if vari.decimate and surface is not None:
+        try:
+            # ICEM only needs a surface somewhat finer than the max element size, fewer triangles import and mesh faster
+            decimated_path, surface = core_libs.stl_decimate.write_decimated_stl(
+                surface, save_path, vari.max_element_size, vari.max_deviation, vari.decimate_refinement
+            )
+            if decimated_path:
+                stl_path = decimated_path
+                vari.stl_type = 'BINARY'
+        except Exception as e:
+            print(f"Error: {e}\n Could not decimate the STL file, ICEM will use the full surface.")
+
+    temp_path = None
     match gui_ins.bm_rot:
         case True:
             try:
-                stl_mesh = core_libs.gui_funcs.rotate_stl_180_z(gui_ins.stl_path)
-                with tempfile.NamedTemporaryFile(delete=False, dir=gui_ins.save_path, suffix=".stl") as temp_file:
-                    stl_mesh.save(temp_file.name)
-                    stl_path = temp_file.name.replace("\\", "/")
+                stl_mesh = core_libs.gui_funcs.rotate_stl_180_z(surface if surface is not None else stl_path)
+                # ICEM can only import from disk, so the rotated surface is written out here and nowhere else
+                with tempfile.NamedTemporaryFile(delete=False, dir=save_path, suffix=".stl") as temp_file:
+                    stl_path = stl_mesh.save(temp_file.name).replace("\\", "/")
+                temp_path = temp_file.name
+                vari.stl_type = 'BINARY'
             except Exception as e:
                 print(
                     f"Error: {e}\n"
@@ -437,32 +895,224 @@ def run_icem_apdl():
                     "- Could not rotate the STL file, please check the file is not corrupted."
                 )
         case False:
-            stl_path = gui_ins.stl_path
+            if vari.stl_type == 'ASCII':
+                try:
+                    # Hand ICEM the binary copy made once in the save path, stl2df then skips the slow '-ascii' import
+                    stl_path = core_libs.surf_mesh.cached_binary_stl(stl_path, save_path)
+                    vari.stl_type = 'BINARY'
+                except Exception as e:
+                    print(f"Error: {e}\n Could not convert the ASCII STL to binary, ICEM will import the ASCII file.")
 
-    var_ins.stl_type = core_libs.gui_funcs.check_stl_file_type(stl_path)
-    var_ins.file_name_ext = (os.path.basename(stl_path))
-    var_ins.file_name = (os.path.splitext(os.path.basename(stl_path))[0]).upper()
+    vari.file_name_ext = (os.path.basename(stl_path))
+    vari.file_name = (os.path.splitext(os.path.basename(stl_path))[0]).upper()
 
-    try:
-        rpl_paths(stl_path)
-    except Exception as e:
-        print(f'Error: {e}')
+    return stl_path, temp_path
+
+
+def run_icem_apdl():
+    stl_path, temp_path = prepare_stl(gui_ins.stl_path, gui_ins.save_path, var_ins)
+    if stl_path is None:
+        return
+
+    if not var_ins.icem_path:
+        # Use the cached install found by an earlier Auto Find, a fresh search is only made when there is none
+        var_ins.icem_path = find_icem_path() or ""
+        print(f'Path to icemcfd.bat found: {var_ins.icem_path}' if var_ins.icem_path else 'Path to icemcfd.bat not set.')
 
     try:
-        run_icem(stl_path)
+        meshed = run_icem(stl_path)
     except Exception as e:
         print(f'Error: {e}\n ANSYS ICEM has failed to run please check you have files in the correct location')
+        meshed = False
 
-    if gui_ins.bm_rot and temp_file:
+    if temp_path:
         try:
-            os.remove(temp_file.name)
+            os.remove(temp_path)
         except OSError:
             pass
-        except Exception as e:
-            print(f'Error deleting temporary file: {e}')
+    if not meshed:
+        print('ANSYS ICEM did not mesh the STL, the APDL step is skipped.')
+        return
 
     try:
-        apdl_mesh()
+        if apdl_mesh():
+            # Once the mesh is written, so the length is stored with it and only with a mesh made from the crop
+            core_libs.stl_crop.write_shaft_length(f"{gui_ins.save_path}/{var_ins.proj_name}.cdb", var_ins.shaft_length)
     except Exception as e:
         print(e)
         print('ANSYS APDL meshing failed!')
+
+
+def batch_block(index, stl_path, vari, save_path, n_processors=1):
+    """
+    The replay commands of one specimen in a batch ICEM session, wrapped in a Tcl catch so a failed specimen does
+    not stop the rest. Markers printed before and after are read back by parse_batch_log, and the session is
+    cleared afterwards so the next specimen starts from an empty model.
+    """
+    commands = update_icem_commands(stl_path, vari, save_path, n_processors)[:-1]  # The session exits once, after every specimen
+    return "\n".join([
+        f'puts "{batch_marker} BEGIN {index}"',
+        'flush stdout',
+        'if {[catch {',
+        *commands,
+        '} batch_error]} {',
+        f'    puts "{batch_marker} FAIL {index} $batch_error"',
+        '} else {',
+        f'    puts "{batch_marker} DONE {index}"',
+        '}',
+        'flush stdout',
+        'catch {ic_unload_tetin}',
+        'catch {ic_unload_mesh}',
+        'catch {ic_boco_unload}',
+    ])
+
+
+def parse_batch_log(log, n_specimens):
+    """
+    Read the outcome of each specimen from the output of a batch ICEM session.
+    :return: outcomes:  (status, message) per specimen, status is 'DONE', 'FAIL', 'STOPPED' when ICEM exited while
+        meshing it, or 'NOT RUN' when ICEM exited before reaching it
+    """
+    outcomes = [('NOT RUN', 'ICEM exited before this specimen')] * n_specimens
+    for line in log.splitlines():
+        if not line.startswith(batch_marker):
+            continue
+        fields = line.split(' ', 3)
+        status, index = fields[1], int(fields[2])
+        match status:
+            case 'BEGIN':
+                outcomes[index] = ('STOPPED', 'ICEM exited while meshing this specimen')
+            case 'DONE':
+                outcomes[index] = ('DONE', '')
+            case 'FAIL':
+                outcomes[index] = ('FAIL', fields[3] if len(fields) > 3 else '')
+    return outcomes
+
+
+def run_icem_batch(jobs, script_dir, session=0, n_sessions=1, n_processors=1):
+    """
+    Mesh several specimens in one ICEM session, so ICEM starts and checks out its licence only once.
+    Each specimen is meshed in a scratch folder of its own, and only its final artefacts are moved to its save path.
+    :param jobs:  (name, stl_path, vari, save_path) of each specimen
+    :param script_dir:  Where the combined replay script and the ICEM log are written
+    :param session:  Number of the session, keeps the script and log of sessions run at once apart
+    :param n_sessions:  Sessions run at once, recorded with the timings
+    :param n_processors:  Threads for tetra meshing and smoothing
+    :return: outcomes:  (status, message) per job, see parse_batch_log
+    """
+    blocks, scratch_paths = [], []
+    for index, (_, stl_path, vari, save_path) in enumerate(jobs):
+        scratch_path = scratch_dir(save_path, vari)
+        rpl_paths(stl_path, vari, scratch_path)
+        blocks.append(batch_block(index, stl_path, vari, scratch_path, n_processors))
+        scratch_paths.append(scratch_path)
+    script_path = f"{script_dir}/batch_icem_script_{session}.rpl"
+    with open(script_path, "w") as file:
+        file.write("\n".join(blocks + ['exit']))
+    print(f"Meshing {len(jobs)} specimens in ICEM session {session} on {n_processors} threads...")
+    timeout, max_memory = icem_limits(len(jobs))
+    auto = core_libs.tool_runner.run_tool([var_ins.icem_path, "-batch", "-script", script_path], timeout, max_memory,
+                                          prefix=f"[ICEM {session}] ")
+    with open(f"{script_dir}/batch_icem_{session}.log", "w") as file:
+        file.write(auto['stdout'])
+        file.write(auto['stderr'])
+
+    outcomes = parse_batch_log(auto['stdout'], len(jobs))
+    timings = parse_timing(auto['stdout'], len(jobs))
+    for index, ((name, _, vari, save_path), scratch_path) in enumerate(zip(jobs, scratch_paths)):
+        # The session time and memory are shared by its specimens, so icem_s and peak_rss_mb are the same for each
+        vari.icem_timing = {'project': vari.proj_name, 'sessions': n_sessions, 'threads': n_processors,
+                            **timings[index], 'icem_s': auto['duration_s'], 'peak_rss_mb': auto['peak_rss_mb'],
+                            'tetra_log': tetra_log_times(scratch_path)}
+        collect_artefacts(scratch_path, save_path, vari)
+        if outcomes[index][0] == 'DONE' and not os.path.exists(f"{save_path}/{vari.proj_name}.inp"):
+            outcomes[index] = ('FAIL', f'{vari.proj_name}.inp was not written')
+        elif outcomes[index][0] != 'DONE' and auto['status'] in ('TIMEOUT', 'MEMORY', 'CANCELLED'):
+            outcomes[index] = (outcomes[index][0], f"ICEM session stopped: {auto['status'].lower()}")
+    return outcomes
+
+
+def run_icem_queue(jobs, script_dir):
+    """
+    Mesh specimens in several ICEM sessions at once. The specimens are shared between the sessions largest STL
+    first, each going to the session with the least STL data so far, so the sessions finish at about the same time.
+    The number of sessions and their threads come from icem_budget, and the timings are added to icem_timing.csv in script_dir.
+    :param jobs:  (name, stl_path, vari, save_path) of each specimen
+    :return: outcomes:  (status, message) per job, in the order of jobs
+    """
+    n_sessions, n_processors = icem_budget(len(jobs))
+    sizes = [os.path.getsize(stl_path) for _, stl_path, _, _ in jobs]
+    groups, loads = [[] for _ in range(n_sessions)], [0] * n_sessions
+    for index in sorted(range(len(jobs)), key=lambda i: sizes[i], reverse=True):
+        session = loads.index(min(loads))
+        groups[session].append(index)
+        loads[session] += sizes[index]
+
+    outcomes = [None] * len(jobs)
+    with ThreadPoolExecutor(max_workers=n_sessions) as executor:
+        # Each thread only waits on its ICEM process, so threads are enough to run the sessions in parallel
+        results = executor.map(lambda session: run_icem_batch([jobs[i] for i in groups[session]], script_dir, session, n_sessions, n_processors), range(n_sessions))
+        for group, result in zip(groups, results):
+            for index, outcome in zip(group, result):
+                outcomes[index] = outcome
+    write_timing([vari.icem_timing for _, _, vari, _ in jobs], script_dir)
+    return outcomes
+
+
+def mesh_stl_folder():
+    """
+    Mesh every STL file in the batch folder, each in '<save path>/<name>', with as many ICEM sessions at once as
+    the licence and core budget allow, see run_icem_queue. The TET10 step is done without MAPDL where it can be,
+    and one MAPDL session is started for the rest. A summary is saved to '<save path>/icem_batch.csv'.
+    """
+    stl_paths = core_libs.batch_funcs.find_stl_files(var_ins.batch_stl_dir)
+    if not stl_paths:
+        print(f"No STL files found in {var_ins.batch_stl_dir}")
+        return
+    if not var_ins.icem_path:
+        var_ins.icem_path = find_icem_path() or ""
+
+    rows, jobs, temp_paths = [], [], []
+    for stl_path in stl_paths:
+        name = os.path.splitext(os.path.basename(stl_path))[0]
+        save_path = core_libs.gui_funcs.dir_check_and_make(name, gui_ins.save_path).replace("\\", "/")
+        vari = core_libs.ansys_vars.MeshVariables(var_ins)  # Each specimen keeps its own ICEM lines
+        vari.proj_name = f"{var_ins.proj_name}_{name}" if var_ins.proj_name else name
+        print(f"\nPreparing {name}...")
+        icem_stl_path, temp_path = prepare_stl(stl_path, save_path, vari)
+        if icem_stl_path is None:
+            rows.append({'specimen': name, 'project': vari.proj_name, 'status': 'SKIPPED', 'issues': 'Failed the STL checks'})
+            continue
+        jobs.append((name, icem_stl_path, vari, save_path))
+        temp_paths.append(temp_path)
+
+    outcomes = run_icem_queue(jobs, gui_ins.save_path) if jobs else []
+    for temp_path in temp_paths:
+        if temp_path:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+
+    mapdl = None
+    for (name, _, vari, save_path), (status, message) in zip(jobs, outcomes):
+        if status == 'DONE' and core_libs.tool_runner.cancel_event.is_set():
+            status, message = 'CANCELLED', 'Cancelled before the APDL step'
+        elif status == 'DONE' and not native_mesh(save_path, vari.proj_name, vari.shaft_length):
+            if mapdl is None:
+                mapdl = launch_mapdl(exec_file=core_libs.ansys_paths.mapdl_exec_file(), nproc=gui_ins.core_count,
+                                     loglevel="WARNING", print_com=True, cleanup_on_exit=True)
+            if not apdl_mesh(save_path, vari.proj_name, mapdl, vari.shaft_length):
+                status, message = 'FAIL', 'APDL meshing failed'
+        if status == 'DONE':
+            core_libs.stl_crop.write_shaft_length(f"{save_path}/{vari.proj_name}.cdb", vari.shaft_length)
+        print(f"{name}: {status} {message}")
+        rows.append({'specimen': name, 'project': vari.proj_name, 'status': status, 'issues': message,
+                     **{key: vari.icem_timing.get(key) for key in ('threads', 'tetra_s', 'smooth_s')}})
+    if mapdl is not None:
+        mapdl.exit()
+
+    csv_path, _ = core_libs.batch_funcs.write_summary(rows, f"{gui_ins.save_path}/icem_batch")
+    done = sum(row['status'] == 'DONE' for row in rows)
+    print(f"Batch meshing finished, {done} of {len(rows)} specimens meshed. Summary saved to {csv_path}")
+
@@ -147,6 +147,14 @@ class MyApplication(QWidget):
         batch_layout.setAlignment(Qt.AlignmentFlag.AlignCenter)
         batch_layout.addWidget(self.batch_mode_check)
 
+        # Cancel button, stops the external tools of the running script
+        cancel_layout = QHBoxLayout()
+        cancel_btn = QPushButton("Cancel Run")
+        cancel_btn.setObjectName('cancel_button')
+        cancel_btn.setToolTip("Stops ICEM CFD, BonematCLI and the other tools started by the running script.")
+        cancel_btn.clicked.connect(core_libs.tool_runner.cancel_runs)
+        cancel_layout.addWidget(cancel_btn)
+
         # bonemat rotation mode toggle
         bm_rot_layout = QHBoxLayout()
         self.bm_rot_check = QCheckBox("Segmented with RAS Coordinate System", self)
@@ -222,6 +230,8 @@ class MyApplication(QWidget):
         batch_cpu_layout.addLayout(bm_rot_layout)
         batch_cpu_layout.addStretch()
         batch_cpu_layout.addLayout(batch_layout)
+        batch_cpu_layout.addStretch()
+        batch_cpu_layout.addLayout(cancel_layout)
 
         mesh_tab = QWidget(self)
         layout = QVBoxLayout()